@@ -0,0 +1,56 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+# Benchmark actions with expanders (contains: and ALL) on a large enhanced
+# multi-frame header, where each action matches thousands of fields.
+#
+# python -m benchmarks.bench_expanders --frames 5000
+
+import argparse
+from copy import deepcopy
+
+from benchmarks.common import functional_groups_dataset, timed
+from deid.dicom.parser import DicomParser
+from deid.tests.common import create_recipe
+
+actions = [
+    {"action": "JITTER", "field": "contains:DateTime", "value": "1"},
+    {"action": "BLANK", "field": "endswith:Number"},
+    {"action": "REMOVE", "field": "ALL"},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark actions with expanders on a large multi-frame header."
+    )
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = functional_groups_dataset(args.frames)
+    recipe = create_recipe(deepcopy(actions))
+
+    def run():
+        dicom = deepcopy(dataset)
+        parser = DicomParser(dicom, recipe=recipe)
+        parser.parse()
+        return parser
+
+    # Sanity check: jittered fields are kept, and everything else is removed
+    # (including the functional groups, with the jittered fields nested in them)
+    parser = run()
+    assert parser.dicom.AcquisitionDateTime == "20240102120000.000000"
+    assert "PatientID" not in parser.dicom
+    assert "PerFrameFunctionalGroupsSequence" not in parser.dicom
+
+    best = timed(run, repeat=args.repeat)
+    print(
+        "JITTER contains:, BLANK endswith:, REMOVE ALL, %s frames: %.3f seconds"
+        % (args.frames, best)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+# Benchmark the time to import deid modules (and run the deid command) in a
+# new interpreter, as a short lived job or pool worker does, and check that
+# matplotlib isn't imported unless a figure is needed.
+#
+# python -m benchmarks.bench_imports --repeat 10
+
+import argparse
+import subprocess
+import sys
+import time
+
+# Each statement is run in a new interpreter, and prints if matplotlib is loaded
+statements = [
+    ("python", "pass"),
+    ("import deid", "import deid"),
+    ("import deid.dicom", "import deid.dicom"),
+    ("import deid.dicom.pixels", "import deid.dicom.pixels"),
+    ("deid identifiers", "import deid.main.identifiers"),
+]
+
+
+def run(statement):
+    """
+    Run a statement in a new interpreter, and return if matplotlib was imported.
+    """
+    code = statement + "\nimport sys; print('matplotlib' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip().splitlines()[-1] == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the time to import deid modules in a new interpreter."
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, statement in statements:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            matplotlib = run(statement)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        print("%s: %.4f seconds (matplotlib imported: %s)" % (name, best, matplotlib))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+# Benchmark reading a large enhanced multi-frame header in full, and with
+# a projection of the tags the default recipe's filters reference, as
+# has_burned_pixels(..., projection=True) does. Bytes read are counted.
+#
+# python -m benchmarks.bench_projection --frames 50000
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import functional_groups_dataset, timed
+from deid.config import DeidRecipe
+from deid.dicom import utils
+from deid.dicom.compiled import compile_filters
+
+
+class CountingFile(io.FileIO):
+    """
+    A file that counts the bytes read from it.
+    """
+
+    read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark reading a large multi-frame header in full, and with a projection."
+    )
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    dicom_file = os.path.join(tmpdir, "functional-groups.dcm")
+    functional_groups_dataset(args.frames).save_as(dicom_file, enforce_file_format=True)
+    tags = compile_filters(DeidRecipe("dicom")).tags
+
+    for name, specific_tags in [("full header", None), ("projection", tags)]:
+        with CountingFile(dicom_file) as fd:
+            utils.read_header(fd, specific_tags=specific_tags)
+            read_bytes = fd.read_bytes
+        best = timed(
+            lambda: utils.read_header(dicom_file, specific_tags=specific_tags),
+            repeat=args.repeat,
+        )
+        print(
+            "%s, %s frames: %.1f KB read, %.4f seconds"
+            % (name, args.frames, read_bytes / 1000, best)
+        )
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+# Benchmark REMOVE on a large enhanced multi-frame header, when the recipe
+# also has REPLACE / JITTER actions that REMOVE must not delete.
+#
+# python -m benchmarks.bench_remove_excluded --frames 5000
+
+import argparse
+from copy import deepcopy
+
+from benchmarks.common import functional_groups_dataset, timed
+from deid.dicom.parser import DicomParser
+from deid.tests.common import create_recipe
+
+actions = [
+    {"action": "JITTER", "field": "FrameAcquisitionDateTime", "value": "1"},
+    {"action": "REPLACE", "field": "StudyInstanceUID", "value": "1.2.3"},
+    {"action": "REPLACE", "field": "contains:Stack", "value": "1"},
+    {"action": "REMOVE", "field": "FrameReferenceDateTime"},
+    {"action": "REMOVE", "field": "contains:DateTime"},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark REMOVE (with REPLACE and JITTER exclusions) on a large multi-frame header."
+    )
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = functional_groups_dataset(args.frames)
+    recipe = create_recipe(deepcopy(actions))
+
+    def run():
+        dicom = deepcopy(dataset)
+        DicomParser(dicom, recipe=recipe).parse()
+        return dicom
+
+    # Sanity check: removed fields are gone, jittered fields are kept
+    dicom = run()
+    content = dicom.PerFrameFunctionalGroupsSequence[0].FrameContentSequence[0]
+    assert "FrameReferenceDateTime" not in content
+    assert content.FrameAcquisitionDateTime.startswith("20240102")
+
+    best = timed(run, repeat=args.repeat)
+    print("REMOVE with excluded fields, %s frames: %.3f seconds" % (args.frames, best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+# Benchmark REMOVE and BLANK of nested sequences (one per frame) on a large
+# enhanced multi-frame header, where the fields nested under each sequence
+# have to be removed from the parser's fields too.
+#
+# python -m benchmarks.bench_remove_sequence --frames 5000
+
+import argparse
+from copy import deepcopy
+
+from benchmarks.common import functional_groups_dataset, timed
+from deid.dicom.parser import DicomParser
+from deid.tests.common import create_recipe
+
+actions = [
+    {"action": "REMOVE", "field": "PlanePositionSequence"},
+    {"action": "BLANK", "field": "PixelMeasuresSequence"},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark REMOVE and BLANK of nested sequences on a large multi-frame header."
+    )
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = functional_groups_dataset(args.frames)
+    recipe = create_recipe(deepcopy(actions))
+
+    def run():
+        dicom = deepcopy(dataset)
+        parser = DicomParser(dicom, recipe=recipe)
+        parser.parse()
+        return parser
+
+    # Sanity check: the sequences and their nested fields are gone
+    parser = run()
+    item = parser.dicom.PerFrameFunctionalGroupsSequence[-1]
+    assert "PlanePositionSequence" not in item
+    assert not any("ImagePositionPatient" in f.name for f in parser.fields.values())
+    assert not any("SliceThickness" in f.name for f in parser.fields.values())
+
+    best = timed(run, repeat=args.repeat)
+    print(
+        "REMOVE/BLANK nested sequences, %s frames: %.3f seconds" % (args.frames, best)
+    )
+
+
+if __name__ == "__main__":
+    main()
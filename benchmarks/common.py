@@ -0,0 +1,144 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import time
+
+from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+
+def functional_groups_dataset(frames=5000):
+    """
+    Create an enhanced multi-frame header with one functional group per frame.
+
+    Each item of the PerFrameFunctionalGroupsSequence has nested frame
+    content, plane position and pixel measures sequences, as an enhanced
+    CT or MR object would. There is no pixel data.
+    """
+    file_meta = FileMetaDataset()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2.1"
+    file_meta.MediaStorageSOPInstanceUID = generate_uid(entropy_srcs=["sop"])
+    ds = FileDataset(
+        "functional-groups.dcm", {}, file_meta=file_meta, preamble=b"\0" * 128
+    )
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid(entropy_srcs=["study"])
+    ds.SeriesInstanceUID = generate_uid(entropy_srcs=["series"])
+    ds.PatientName = "Benchmark^Patient"
+    ds.PatientID = "benchmark"
+    ds.StudyDate = "20240101"
+    ds.AcquisitionDateTime = "20240101120000.000000"
+    ds.NumberOfFrames = frames
+
+    items = []
+    for frame in range(frames):
+        content = Dataset()
+        content.FrameAcquisitionDateTime = "20240101120000.%06d" % frame
+        content.FrameReferenceDateTime = "20240101120000.%06d" % frame
+        content.FrameAcquisitionNumber = frame
+        content.StackID = "1"
+        content.InStackPositionNumber = frame + 1
+
+        position = Dataset()
+        position.ImagePositionPatient = [0.0, 0.0, float(frame)]
+
+        measures = Dataset()
+        measures.PixelSpacing = [0.5, 0.5]
+        measures.SliceThickness = 1.0
+
+        item = Dataset()
+        item.FrameContentSequence = Sequence([content])
+        item.PlanePositionSequence = Sequence([position])
+        item.PixelMeasuresSequence = Sequence([measures])
+        items.append(item)
+
+    ds.PerFrameFunctionalGroupsSequence = Sequence(items)
+    return ds
+
+
+def timed(func, repeat=3):
+    """
+    Run a function repeat times, and return the best wall time (seconds)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def pixel_dataset(shape, samples_per_pixel=1):
+    """
+    Create a dataset with (uncompressed) pixel data of a shape.
+
+    The shape is (rows, columns) for a 2D image, (frames, rows, columns) for
+    a greyscale cine, or (frames, rows, columns, 3) for an RGB cine, as the
+    pixel_array of the dataset would be.
+    """
+    import numpy
+
+    multiframe = len(shape) - (samples_per_pixel > 1) == 3
+    rows, columns = shape[1:3] if multiframe else shape[:2]
+    dtype = numpy.uint8 if samples_per_pixel > 1 else numpy.uint16
+
+    ds = functional_groups_dataset(0)
+    del ds.PerFrameFunctionalGroupsSequence
+    del ds.NumberOfFrames
+    if multiframe:
+        ds.NumberOfFrames = shape[0]
+    ds.Modality = "US"
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.SamplesPerPixel = samples_per_pixel
+    ds.PhotometricInterpretation = "RGB" if samples_per_pixel > 1 else "MONOCHROME2"
+    if samples_per_pixel > 1:
+        ds.PlanarConfiguration = 0
+    ds.BitsAllocated = ds.BitsStored = 8 * numpy.dtype(dtype).itemsize
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = 0
+    ds.PixelData = numpy.ones(shape, dtype=dtype).tobytes()
+    return ds
+
+
+def deep_sequence_dataset(depth=50, width=20):
+    """
+    Create a dataset with sequences nested depth levels deep.
+
+    Each level is a sequence of width items with a few fields each, and the
+    first item of each level holds the sequence for the next level.
+    """
+    ds = functional_groups_dataset(0)
+    parent = ds
+    for level in range(depth):
+        items = []
+        for index in range(width):
+            item = Dataset()
+            item.CodeValue = "%s.%s" % (level, index)
+            item.CodingSchemeDesignator = "DCM"
+            item.CodeMeaning = "Level %s item %s" % (level, index)
+            item.ReferencedSOPInstanceUID = generate_uid(
+                entropy_srcs=[str(level), str(index)]
+            )
+            item.ContentDate = "20240101"
+            items.append(item)
+        parent.ContentSequence = Sequence(items)
+        parent = items[0]
+    return ds
+
+
+def large_recipe_text(copies=20):
+    """
+    Get the text of a large recipe, the sections of the default deid recipe
+    repeated copies times.
+    """
+    from deid.config.utils import get_deid
+
+    with open(get_deid("dicom")) as fd:
+        _, sections = fd.read().split("\n", 1)
+    return "FORMAT dicom\n" + sections * copies
@@ -0,0 +1,354 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+# A suite of benchmarks for the main entrypoints of deid, on synthetic data.
+# Each benchmark records the best wall time, and the peak memory allocated
+# (in Python) for one run. Results are saved as json, and can be compared
+# with an earlier (baseline) result to flag regressions.
+#
+# python -m benchmarks.suite run --output baseline.json
+# python -m benchmarks.suite run --output current.json
+# python -m benchmarks.suite compare baseline.json current.json --threshold 0.2
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import pydicom
+
+from benchmarks.common import (
+    deep_sequence_dataset,
+    functional_groups_dataset,
+    large_recipe_text,
+    pixel_dataset,
+)
+from deid.logger import bot
+from deid.version import __version__
+
+# Benchmarks by name, each a function that takes a scale and a temporary
+# folder, and returns the function to time and a description of the size
+benchmarks = {}
+
+
+def benchmark(func):
+    """
+    Register a benchmark function by its name.
+    """
+    benchmarks[func.__name__] = func
+    return func
+
+
+@benchmark
+def parse_default_recipe(scale, tmpdir):
+    from deid.dicom.compiled import compile_recipe
+    from deid.dicom.parser import DicomParser
+
+    frames = max(1, int(500 * scale))
+    dicom_file = os.path.join(tmpdir, "functional-groups.dcm")
+    functional_groups_dataset(frames).save_as(dicom_file, enforce_file_format=True)
+    recipe = compile_recipe()
+
+    def run():
+        DicomParser(dicom_file, recipe=recipe).parse()
+
+    return run, "%s frames" % frames
+
+
+@benchmark
+def get_fields_deep_sequences(scale, tmpdir):
+    from deid.dicom.fields import fields_cache, get_fields_with_lookup
+
+    depth = max(1, int(50 * scale))
+    dicom = deep_sequence_dataset(depth=depth, width=20)
+
+    def run():
+        fields_cache.invalidate(dicom)
+        get_fields_with_lookup(dicom)
+
+    return run, "depth %s, width 20" % depth
+
+
+@benchmark
+def has_burned_pixels_folder(scale, tmpdir):
+    from deid.dicom import get_files, has_burned_pixels
+
+    count = max(1, int(200 * scale))
+    folder = os.path.join(tmpdir, "headers")
+    os.makedirs(folder)
+    dicom = pixel_dataset((64, 64))
+    for index in range(count):
+        dicom.SOPInstanceUID = "1.2.3.%s" % index
+        dicom.save_as(
+            os.path.join(folder, "%05d.dcm" % index), enforce_file_format=True
+        )
+
+    def run():
+        has_burned_pixels(list(get_files(folder, check=False)))
+
+    return run, "%s files" % count
+
+
+@benchmark
+def replace_identifiers_synthetic(scale, tmpdir):
+    from deid.dicom import replace_identifiers
+    from deid.dicom.compiled import compile_recipe
+    from deid.dicom.synthetic import generate_corpus
+
+    count = max(1, int(100 * scale))
+    dicom_files = generate_corpus(
+        os.path.join(tmpdir, "corpus"),
+        count=count,
+        width=200,
+        depth=3,
+        fanout=3,
+        private_blocks=2,
+        recipe=False,
+    )
+    recipe = compile_recipe()
+
+    def run():
+        replace_identifiers(dicom_files, deid=recipe, save=False, remove_private=True)
+
+    return run, "%s files, 200 fields" % count
+
+
+def _clean_pixel_data(shape, samples_per_pixel=1):
+    from deid.dicom.pixels import clean_pixel_data
+
+    dicom = pixel_dataset(shape, samples_per_pixel)
+    results = {
+        "flagged": True,
+        "results": [{"coordinates": [[0, "0,0,%s,%s" % (shape[-2], shape[-2] // 4)]]}],
+    }
+
+    def run():
+        clean_pixel_data(dicom, results)
+
+    return run
+
+
+@benchmark
+def clean_pixel_data_2d(scale, tmpdir):
+    size = max(16, int(2048 * scale**0.5))
+    return _clean_pixel_data((size, size)), "%sx%s" % (size, size)
+
+
+@benchmark
+def clean_pixel_data_3d(scale, tmpdir):
+    frames = max(1, int(100 * scale))
+    return _clean_pixel_data((frames, 512, 512)), "%sx512x512" % frames
+
+
+@benchmark
+def clean_pixel_data_4d(scale, tmpdir):
+    frames = max(1, int(50 * scale))
+    return _clean_pixel_data((frames, 480, 640, 3), 3), "%sx480x640x3" % frames
+
+
+@benchmark
+def load_large_recipe(scale, tmpdir):
+    from deid.config.utils import load_deid
+
+    copies = max(1, int(20 * scale))
+    recipe = os.path.join(tmpdir, "large.dicom")
+    with open(recipe, "w") as fd:
+        fd.write(large_recipe_text(copies))
+
+    def run():
+        load_deid(recipe)
+
+    return run, "%s copies of the default recipe" % copies
+
+
+def get_seconds(func, repeat=5, min_seconds=0.2):
+    """
+    Get the best time (seconds) for one run of a function.
+
+    As timeit does, a function is run in a loop for each sample, with enough
+    runs that a sample takes at least min_seconds, and garbage collection is
+    disabled while a sample runs. This makes fast functions less noisy.
+    """
+    loops = 1
+    while True:
+        seconds = timeit.timeit(func, number=loops)
+        if seconds >= min_seconds or loops >= 1000:
+            break
+        loops *= 2
+    samples = timeit.repeat(func, number=loops, repeat=repeat)
+    return min(samples) / loops
+
+
+def get_peak_memory(func):
+    """
+    Get the peak memory (bytes) allocated by Python in one run of a function.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(names=None, scale=1.0, repeat=5):
+    """
+    Run benchmarks (all, or by name), and return the results.
+    """
+    results = {
+        "version": __version__,
+        "pydicom": pydicom.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "scale": scale,
+        "benchmarks": {},
+    }
+    for name, setup in benchmarks.items():
+        if names and name not in names:
+            continue
+        tmpdir = tempfile.mkdtemp()
+        try:
+            func, size = setup(scale, tmpdir)
+            func()  # warm up, e.g., compiled recipes and imports
+            seconds = get_seconds(func, repeat=repeat)
+            peak_memory = get_peak_memory(func)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        results["benchmarks"][name] = {
+            "size": size,
+            "seconds": seconds,
+            "peak_memory": peak_memory,
+        }
+        print(
+            "%-28s %-36s %10.4f seconds %10.1f MB"
+            % (name, size, seconds, peak_memory / 1e6)
+        )
+    return results
+
+
+def compare(baseline, current, threshold=0.2, memory_threshold=None):
+    """
+    Compare results with a baseline, and return the names of regressions.
+
+    A benchmark regresses if its time (or peak memory) is more than
+    threshold (a fraction, e.g., 0.2 is 20%) larger than the baseline.
+    Benchmarks that are not in both results are skipped.
+    """
+    if memory_threshold is None:
+        memory_threshold = threshold
+    if baseline.get("scale") != current.get("scale"):
+        print(
+            "Warning: the baseline (scale %s) and current (scale %s) results differ in scale."
+            % (baseline.get("scale"), current.get("scale"))
+        )
+
+    regressions = []
+    print(
+        "%-28s %12s %12s %8s %10s"
+        % ("benchmark", "baseline", "current", "time", "memory")
+    )
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        time_ratio = result["seconds"] / before["seconds"]
+        memory_ratio = result["peak_memory"] / max(before["peak_memory"], 1)
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + memory_threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            "%-28s %11.4fs %11.4fs %7.2fx %9.2fx %s"
+            % (
+                name,
+                before["seconds"],
+                result["seconds"],
+                time_ratio,
+                memory_ratio,
+                "REGRESSION" if regressed else "",
+            )
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the deid benchmark suite, or compare results."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="run the benchmarks")
+    run.add_argument("--output", help="save the results to this json file")
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="scale the size of the data (e.g., 0.1 for a quick run)",
+    )
+    run.add_argument(
+        "benchmarks", nargs="*", help="the benchmarks to run (default is all)"
+    )
+
+    check = subparsers.add_parser("compare", help="compare results with a baseline")
+    check.add_argument("baseline", help="the baseline results (json)")
+    check.add_argument("current", help="the current results (json)")
+    check.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="the fraction a time can grow before it's a regression (default 0.2)",
+    )
+    check.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=None,
+        help="the fraction peak memory can grow (defaults to the threshold)",
+    )
+
+    subparsers.add_parser("list", help="list the benchmarks")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print("\n".join(benchmarks))
+        return
+
+    if args.command == "run":
+        unknown = set(args.benchmarks) - set(benchmarks)
+        if unknown:
+            sys.exit("Unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+
+        # Messages are not printed while the benchmarks run
+        bot.level = 0
+        results = run_suite(args.benchmarks, scale=args.scale, repeat=args.repeat)
+        if args.output:
+            with open(args.output, "w") as fd:
+                json.dump(results, fd, indent=4)
+            print("Saved results to %s" % args.output)
+        return
+
+    with open(args.baseline) as fd:
+        baseline = json.load(fd)
+    with open(args.current) as fd:
+        current = json.load(fd)
+    regressions = compare(
+        baseline,
+        current,
+        threshold=args.threshold,
+        memory_threshold=args.memory_threshold,
+    )
+    if regressions:
+        sys.exit("%s regressions: %s" % (len(regressions), ", ".join(regressions)))
+    print("No regressions beyond a threshold of %s" % args.threshold)
+
+
+if __name__ == "__main__":
+    main()
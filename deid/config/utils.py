@@ -97,18 +97,21 @@ def load_deid(path=None):
     """
     path = find_deid(path)
 
-    # Read in spec, clean up extra spaces and newlines
-    spec = [
-        x.strip("\n").strip(" ")
-        for x in read_file(path)
-        if x.strip("\n").strip(" ") not in [""]
+    # Read in spec, clean up extra spaces and newlines (keeping line numbers)
+    numbered = [
+        (number, x.strip("\n").strip(" "))
+        for number, x in enumerate(read_file(path), 1)
+        if x.strip("\n").strip(" ") not in ["", None]
     ]
-
-    spec = [x for x in spec if x not in ["", None]]
+    spec = [x for _, x in numbered]
     config = OrderedDict()
     section = None
 
     while spec:
+        # The source of the line (file and line number), spec is only popped
+        number = numbered[len(numbered) - len(spec)][0]
+        source = "%s:%s" % (os.path.basename(path), number)
+
         # Clean up white trailing/leading space
         line = spec.pop(0).strip()
 
@@ -161,7 +164,11 @@ def load_deid(path=None):
             # Parse the action
             else:
                 config = parse_config_action(
-                    section=section, section_name=section_name, line=line, config=config
+                    section=section,
+                    section_name=section_name,
+                    line=line,
+                    config=config,
+                    source=source,
                 )
         else:
             bot.warning("%s not recognized to be in valid format, skipping." % line)
@@ -544,7 +551,7 @@ def parse_group_action(section, line, config, section_name):
     return config
 
 
-def parse_config_action(section, line, config, section_name=None):
+def parse_config_action(section, line, config, section_name=None, source=None):
     """add action will take a line from a deid config file, a config (dictionary), and
     an active section name (eg header) and add an entry to the config file to perform
     the action.
@@ -555,6 +562,7 @@ def parse_config_action(section, line, config, section_name=None):
     line: the line content to parse for the section/action
     config: the growing/current config dictionary
     section_name: optionally, a section name
+    source: optionally, the file and line number of the line (e.g., deid.dicom:12)
 
     """
     if not line.upper().startswith(actions):
@@ -571,13 +579,14 @@ def parse_config_action(section, line, config, section_name=None):
     field = parts.pop(0)
 
     # Actions that require a value
+    entry = None
     if action in ["ADD", "REPLACE", "JITTER"]:
         if len(parts) == 0:
             bot.exit("%s requires a VALUE, but not found" % action)
 
         value = _remove_comments(parts)
         bot.debug("%s: adding %s" % (section, line))
-        config[section].append({"action": action, "field": field, "value": value})
+        entry = {"action": action, "field": field, "value": value}
 
     # Actions that can optionally have a value
     elif action in ["REMOVE"]:
@@ -585,18 +594,22 @@ def parse_config_action(section, line, config, section_name=None):
 
         # Case 1: removing without any criteria
         if len(parts) == 0:
-            config[section].append({"action": action, "field": field})
+            entry = {"action": action, "field": field}
 
         # Case 2: REMOVE can have a func:is_thing to return boolean
         else:
             value = _remove_comments(parts)
-            config[section].append({"action": action, "field": field, "value": value})
+            entry = {"action": action, "field": field, "value": value}
 
     # Actions that don't require a value
     elif action in ["BLANK", "KEEP"]:
         bot.debug("%s: adding %s" % (section, line))
-        config[section].append({"action": action, "field": field})
+        entry = {"action": action, "field": field}
 
+    if entry is not None:
+        if source is not None:
+            entry["source"] = source
+        config[section].append(entry)
     return config
 
 
@@ -1,4 +1,11 @@
+from .export import export_identifiers, read_header_table
 from .fields import extract_sequence
-from .header import get_identifiers, remove_private_identifiers, replace_identifiers
+from .header import (
+    get_identifiers,
+    iter_replace_identifiers,
+    remove_private_identifiers,
+    replace_identifiers,
+)
 from .pixels import DicomCleaner, clean_pixel_data, has_burned_pixels
+from .synthetic import generate_corpus, generate_dataset
 from .utils import get_files
@@ -1,4 +1,5 @@
 from .jitter import jitter_timestamp, jitter_timestamp_func
+from .remap import RemapStore, get_remap_store, remap
 from .uids import basic_uuid, dicom_uuid, pydicom_uuid, suffix_uuid
 
 # Function lookup
@@ -10,4 +11,5 @@ deid_funcs = {
     "suffix_uuid": suffix_uuid,
     "basic_uuid": basic_uuid,
     "pydicom_uuid": pydicom_uuid,
+    "remap": remap,
 }
@@ -0,0 +1,215 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import os
+import sqlite3
+from collections import OrderedDict
+
+from deid.logger import bot
+from deid.utils import parse_keyvalue_pairs
+
+# Options for remap, the rest are given to the generator
+remap_options = ("generator", "store", "namespace")
+
+# One store per path (and per process), shared by parsers and files
+_stores = {}
+
+
+class RemapStore:
+    """
+    A store of remapped identifiers (e.g., an original UID and its new value).
+
+    Values are kept in an in-process LRU cache of cache_size values, in front
+    of a sqlite database at path. The database is shared by processes (e.g.,
+    workers) that use the same path, so an identifier is generated once, and
+    every process gets the same value for it. If two processes generate a
+    value for the same identifier at once, the value that is saved first is
+    used by both.
+
+    Without a path, values are only kept in this process, for this run, and
+    they are never evicted (a value that was forgotten would be generated
+    again, and the same identifier would get two values). Memory grows with
+    the number of identifiers, so a warning is given when there are more
+    than cache_size; use a path for a large corpus.
+
+    Parameters
+    ==========
+    path: the path to the sqlite database (created if it doesn't exist)
+    cache_size: the number of values to keep in memory (default 100000)
+    """
+
+    def __init__(self, path=None, cache_size=100000):
+        self.path = os.path.abspath(path) if path else None
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._pid = None
+        self._warned = False
+
+    def __str__(self):
+        return "[deid.RemapStore][%s]" % (self.path or "memory")
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def db(self):
+        """
+        The connection to the database, opened once per process.
+
+        A connection can't be shared with a (forked) worker process, so
+        a worker opens its own.
+        """
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=60)
+
+            # Write ahead logging lets readers and a writer work at once, and
+            # commits are appended to the log (and written back in batches)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS remap (namespace TEXT, "
+                "original TEXT, value TEXT, PRIMARY KEY (namespace, original))"
+            )
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+    def close(self):
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
+
+    def _remember(self, key, value):
+        self.cache[key] = value
+        if not self.cache_size or len(self.cache) <= self.cache_size:
+            return
+
+        # Values in memory only are the store, so they can't be evicted
+        if self.path is None:
+            if not self._warned:
+                bot.warning(
+                    "More than %s remapped values are kept in memory, provide a "
+                    "store (or DEID_REMAP_STORE) to keep them in a database."
+                    % self.cache_size
+                )
+                self._warned = True
+        else:
+            self.cache.popitem(last=False)
+
+    def get(self, namespace, original, generate):
+        """
+        Get the value for an original identifier, generating it if it's new.
+
+        Parameters
+        ==========
+        namespace: identifiers in different namespaces have different values
+        original: the original identifier
+        generate: a function (without arguments) to generate a new value
+        """
+        key = (namespace, original)
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        if self.path is None:
+            value = str(generate())
+        else:
+            value = self._select(namespace, original)
+            if value is None:
+                value = self._insert(namespace, original, str(generate()))
+        self._remember(key, value)
+        return value
+
+    def _select(self, namespace, original):
+        row = self.db.execute(
+            "SELECT value FROM remap WHERE namespace=? AND original=?",
+            (namespace, original),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _insert(self, namespace, original, value):
+        """
+        Save a new value, and return the value saved (first) for the original.
+        """
+        with self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO remap VALUES (?, ?, ?)",
+                (namespace, original, value),
+            )
+        return self._select(namespace, original)
+
+    def __len__(self):
+        if self.path is None:
+            return len(self.cache)
+        return self.db.execute("SELECT COUNT(*) FROM remap").fetchone()[0]
+
+
+def get_remap_store(path=None):
+    """
+    Get the (shared) remap store for a path, or the in-memory store.
+    """
+    key = os.path.abspath(path) if path else None
+    if key not in _stores:
+        _stores[key] = RemapStore(key)
+    return _stores[key]
+
+
+def get_generator_extras(extras):
+    """
+    Remove the options for remap from extras, to give the rest to a generator.
+    """
+    if not extras:
+        return extras
+    pairs = [
+        pair
+        for pair in extras.split(" ")
+        if pair.split("=", 1)[0].strip() not in remap_options
+    ]
+    return " ".join(pairs)
+
+
+def remap(item, value, field, dicom=None, **kwargs):
+    """
+    Remap an identifier, generating a new value only the first time it's seen.
+
+    The value is generated by another deid_func (the generator, default is
+    pydicom_uuid) and saved in a RemapStore, so the same original value
+    (e.g., a StudyInstanceUID repeated across a series) gets the same new
+    value across files and worker processes. Optional kwargs include:
+
+    generator (str): the name of the deid_func to generate a value
+    store (str): the path to a (sqlite) store shared by processes. If not
+    provided, the DEID_REMAP_STORE environment variable is used, and if
+    that isn't set, values are only kept in memory.
+    namespace (str): values are unique to a namespace (default is the generator)
+
+    Other kwargs are given to the generator.
+    """
+    from deid.dicom.actions import deid_funcs
+
+    extras = kwargs.get("extras")
+    opts = parse_keyvalue_pairs(extras)
+    generator = opts.get("generator", "pydicom_uuid")
+    if generator not in deid_funcs or generator == "remap":
+        bot.exit("%s is not a deid_func that can generate a value." % generator)
+
+    store = get_remap_store(opts.get("store") or os.environ.get("DEID_REMAP_STORE"))
+    original = str(field.element.value) if hasattr(field, "element") else str(value)
+
+    def generate():
+        return deid_funcs[generator](
+            item=item,
+            value=value,
+            field=field,
+            dicom=dicom,
+            extras=get_generator_extras(extras),
+        )
+
+    return store.get(opts.get("namespace", generator), original, generate)
@@ -0,0 +1,212 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pydicom.dataset import Dataset
+
+from deid.dicom.compiled import compile_recipe
+from deid.dicom.metrics import MetricsRegistry, timer, track_file
+from deid.dicom.parser import DicomParser
+from deid.dicom.profile import ActionProfile
+from deid.dicom.utils import save_dicom
+from deid.logger import bot
+
+# State shared by all tasks in a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(recipe, options, profile=False, metrics=False):
+    """
+    Initialize a worker process.
+
+    The (already parsed) recipe and the options shared by every file are
+    shipped once per worker, so tasks only need to carry a file path. If
+    profile (or metrics) is True, each task also returns the profile of
+    its actions (or a snapshot of its metrics).
+    """
+    _worker["recipe"] = recipe
+    _worker["options"] = options
+    _worker["profile"] = profile
+    _worker["metrics"] = metrics
+
+
+def _replace_one(dicom_file, lookup=None):
+    """
+    Replace identifiers for a single dicom file in a worker process.
+    """
+    profile = ActionProfile() if _worker.get("profile") else None
+    metrics = MetricsRegistry() if _worker.get("metrics") else None
+    result = replace_identifiers_single(
+        dicom_file,
+        recipe=_worker["recipe"],
+        lookup=lookup,
+        profile=profile,
+        metrics=metrics,
+        **_worker["options"],
+    )
+    if profile is None and metrics is None:
+        return result
+    return (
+        result,
+        profile and profile.to_dict(),
+        metrics and metrics.to_dict(),
+    )
+
+
+def replace_identifiers_single(
+    dicom_file,
+    recipe=None,
+    lookup=None,
+    save=False,
+    overwrite=False,
+    output_folder=None,
+    force=True,
+    config=None,
+    strip_sequences=False,
+    remove_private=False,
+    disable_skip=False,
+    profile=None,
+    metrics=None,
+):
+    """
+    Replace identifiers for one dicom file.
+
+    This is the unit of work shared by the serial and parallel paths of
+    replace_identifiers. It returns the path of the saved file (if save
+    is True) or the updated dataset. If a profile (an ActionProfile) is
+    given, the actions for the file are recorded in it, and if metrics (a
+    MetricsRegistry) are given, the file and its stages are counted.
+    """
+    with track_file(metrics, "replace", dicom_file) as tracked:
+        parser = DicomParser(
+            dicom_file,
+            force=force,
+            config=config,
+            recipe=recipe,
+            disable_skip=disable_skip,
+            profile=profile,
+            metrics=metrics,
+        )
+
+        # If a custom lookup was provided, update the parser
+        if lookup:
+            parser.lookup.update(lookup)
+
+        parser.parse(strip_sequences=strip_sequences, remove_private=remove_private)
+
+        # Save to file, otherwise return updated objects
+        if save is not True:
+            return parser.dicom
+        with timer(metrics, "write"):
+            tracked["output"] = save_dicom(
+                dicom=parser.dicom,
+                dicom_file=parser.dicom_file,
+                output_folder=output_folder,
+                overwrite=overwrite,
+            )
+        return tracked["output"]
+
+
+def get_file_lookup(ids, dicom_file):
+    """
+    Find the custom lookup (if any) for a dicom file.
+
+    The ids are indexed by the full path to the file, as DicomParser does.
+    """
+    if not ids:
+        return None
+    if isinstance(dicom_file, Dataset):
+        dicom_file = dicom_file.get("filename")
+    if not isinstance(dicom_file, str):
+        return None
+    return ids.get(os.path.abspath(dicom_file))
+
+
+def iter_ordered(executor, func, items, max_pending):
+    """
+    Submit items to an executor and yield results in input order.
+
+    Unlike executor.map, at most max_pending tasks are in flight at once,
+    so the input can be a generator over an arbitrarily large listing.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, *item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def replace_identifiers_batch(
+    dicom_files,
+    ids=None,
+    deid=None,
+    save=False,
+    overwrite=False,
+    output_folder=None,
+    force=True,
+    config=None,
+    strip_sequences=False,
+    remove_private=False,
+    disable_skip=False,
+    workers=None,
+    profile=None,
+    metrics=None,
+):
+    """
+    Replace identifiers for a batch of files using a pool of processes.
+
+    The recipe is compiled once here and sent to each worker when it starts,
+    and file paths are streamed to the workers. Results (output paths if
+    save is True, otherwise datasets) are yielded in the order of the input.
+
+    Parameters
+    ==========
+    dicom_files: an iterable of dicom file paths (or datasets)
+    workers: the number of processes to use (defaults to the number of cpus)
+    profile: an ActionProfile, the profile of each file is merged into it
+    metrics: a MetricsRegistry, the metrics of each file are merged into it
+
+    All other parameters are the same as for replace_identifiers.
+    """
+    if isinstance(dicom_files, (str, Dataset)):
+        dicom_files = [dicom_files]
+
+    # Parse and compile the recipe once, workers receive the compiled object
+    deid = compile_recipe(deid)
+
+    workers = workers or os.cpu_count() or 1
+    bot.debug("Replacing identifiers with %s workers" % workers)
+
+    options = {
+        "save": save,
+        "overwrite": overwrite,
+        "output_folder": output_folder,
+        "force": force,
+        "config": config,
+        "strip_sequences": strip_sequences,
+        "remove_private": remove_private,
+        "disable_skip": disable_skip,
+    }
+    items = (
+        (dicom_file, get_file_lookup(ids, dicom_file)) for dicom_file in dicom_files
+    )
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(deid, options, profile is not None, metrics is not None),
+    ) as executor:
+        for result in iter_ordered(executor, _replace_one, items, workers * 4):
+            if profile is not None or metrics is not None:
+                result, counts, snapshot = result
+                if profile is not None:
+                    profile.merge(counts)
+                if metrics is not None:
+                    metrics.merge(snapshot)
+            yield result
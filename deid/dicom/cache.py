@@ -0,0 +1,215 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from deid.logger import bot
+from deid.version import __version__
+
+
+def get_fingerprint_value(value):
+    """
+    Get the part of a value that determines a result, for a fingerprint.
+
+    The source (file and line number) of a recipe action is dropped, so
+    moving a line (or adding a comment) doesn't change the fingerprint,
+    and a function (e.g., a deid_func in a lookup) is named by its module
+    and qualified name, and not by its string (which has its address).
+    """
+    if isinstance(value, dict):
+        return {
+            str(key): get_fingerprint_value(item)
+            for key, item in value.items()
+            if not (key == "source" and "action" in value)
+        }
+    if isinstance(value, (list, tuple)):
+        return [get_fingerprint_value(item) for item in value]
+    if callable(value):
+        func = getattr(value, "func", value)  # e.g., a functools.partial
+        return "%s.%s" % (
+            getattr(func, "__module__", None) or type(func).__module__,
+            getattr(func, "__qualname__", None) or type(func).__qualname__,
+        )
+    return value
+
+
+def get_fingerprint(*parts):
+    """
+    Get a fingerprint (sha256) for the parts that determine a result.
+
+    The parts (e.g., a recipe, and the options for a run) are serialized as
+    json with sorted keys, after get_fingerprint_value. Other values that
+    are not json (e.g., a DicomField in a lookup) are serialized as strings.
+    """
+    content = json.dumps(get_fingerprint_value(parts), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_run_cache(cache):
+    """
+    Get a RunCache from a path to a cache, or None if cache is None.
+    """
+    if cache is None or isinstance(cache, RunCache):
+        return cache
+    return RunCache(cache)
+
+
+class RunCache:
+    """
+    An on-disk index of results for files that were already processed.
+
+    Results are indexed by the kind of run (e.g., "replace"), the input file,
+    a key for its content, the fingerprint of the recipe and options, and
+    the version of deid. The content key is the size and modification time
+    of the file, or with hash_contents, a sha256 of its content (slower, but
+    a file that is touched or copied without changes is not processed again).
+    A file that changes, or a run with a different recipe or version, is
+    not found, so a re-run only processes what changed.
+
+    Parameters
+    ==========
+    path: the path to the sqlite database (created if it doesn't exist)
+    hash_contents: key files by a hash of their content (default False)
+    """
+
+    def __init__(self, path, hash_contents=False):
+        self.path = os.path.abspath(path)
+        self.hash_contents = hash_contents
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "kind TEXT, input TEXT, content TEXT, fingerprint TEXT, "
+            "version TEXT, result TEXT, "
+            "PRIMARY KEY (kind, input, content, fingerprint, version))"
+        )
+        self.db.commit()
+
+    def __str__(self):
+        return "[deid.RunCache][%s]" % self.path
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def get_content_key(self, dicom_file):
+        """
+        Get the key for the content of a file.
+        """
+        if self.hash_contents:
+            digest = hashlib.sha256()
+            with open(dicom_file, "rb") as fd:
+                for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            return "sha256:%s" % digest.hexdigest()
+        stat = os.stat(dicom_file)
+        return "stat:%s:%s" % (stat.st_size, stat.st_mtime_ns)
+
+    def _get_key(self, kind, dicom_file, fingerprint):
+        dicom_file = os.path.abspath(dicom_file)
+        return (
+            kind,
+            dicom_file,
+            self.get_content_key(dicom_file),
+            fingerprint,
+            __version__,
+        )
+
+    def get(self, kind, dicom_file, fingerprint):
+        """
+        Get the result of a run for a file, or None if it isn't cached.
+        """
+        return self._select(self._get_key(kind, dicom_file, fingerprint))
+
+    def _select(self, key):
+        row = self.db.execute(
+            "SELECT result FROM results WHERE kind=? AND input=? AND content=? "
+            "AND fingerprint=? AND version=?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set(self, kind, dicom_file, fingerprint, result):
+        """
+        Save the result (a json serializable value) of a run for a file.
+        """
+        self._insert([self._get_key(kind, dicom_file, fingerprint) + (result,)])
+
+    def _insert(self, rows):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            [row[:-1] + (json.dumps(row[-1]),) for row in rows],
+        )
+        self.db.commit()
+
+    def clear(self):
+        """
+        Remove all results from the cache.
+        """
+        self.db.execute("DELETE FROM results")
+        self.db.commit()
+
+    def run(self, kind, items, func, is_valid=None):
+        """
+        Get the results for items, running func only for those not cached.
+
+        Items are (dicom_file, fingerprint) tuples, and func is called with
+        the list of files that are not cached (or with a cached result that
+        is not valid, e.g., an output file that was removed). It should
+        return their results, in order. Results are returned for all items,
+        in the order given. A file that isn't a path (e.g., a dataset) is
+        never cached.
+
+        Parameters
+        ==========
+        kind: the kind of run (e.g., "replace" or "detect")
+        items: a list of (dicom_file, fingerprint)
+        func: a function to get the results for a list of dicom files
+        is_valid: an optional function to check that a cached result can be used
+        """
+        results = [None] * len(items)
+        keys = [None] * len(items)
+        missing = []
+        for index, (dicom_file, fingerprint) in enumerate(items):
+            result = None
+            if isinstance(dicom_file, str):
+                keys[index] = self._get_key(kind, dicom_file, fingerprint)
+                result = self._select(keys[index])
+            if result is None or (is_valid is not None and not is_valid(result)):
+                missing.append(index)
+                continue
+            results[index] = result
+
+        self.hits += len(items) - len(missing)
+        self.misses += len(missing)
+        bot.debug(
+            "%s cache: %s of %s files found"
+            % (kind, len(items) - len(missing), len(items))
+        )
+        if not missing:
+            return results
+
+        # Results are saved together, so the database is written once
+        rows = []
+        updated = func([items[index][0] for index in missing])
+        for index, result in zip(missing, updated):
+            results[index] = result
+            if keys[index] is not None:
+                rows.append(keys[index] + (result,))
+        self._insert(rows)
+        return results
@@ -0,0 +1,404 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import re
+import weakref
+
+from deid.config import DeidRecipe
+from deid.config.standards import actions as valid_actions
+from deid.dicom.fields import compile_field_expression
+from deid.dicom.filter import extract_coordinates, get_filter, get_filter_field
+from deid.dicom.tags import get_field_tag
+from deid.logger import bot
+from deid.utils import split_value
+
+
+class CompiledAction:
+    """
+    A header action from a recipe, resolved once.
+
+    The action is classified by the kind of field it targets:
+
+    values: a %values list (e.g., values:cookie_names)
+    fields: a %fields list (e.g., fields:instance_fields)
+    expression: a specific field or a field expander (e.g., contains:Time)
+
+    For an expression, the parsed FieldExpression is kept. The value is
+    split (var:, func: or deid_func:) once as well. The source is the file
+    and line number of the action in its recipe (e.g., deid.dicom:12), if known.
+    """
+
+    def __init__(self, action, field, value=None, source=None):
+        # Validate the action
+        if action not in valid_actions:
+            bot.warning("%s in not a valid choice. Defaulting to blanked." % action)
+            action = "BLANK"
+
+        self.action = action
+        self.field = field
+        self.value = value
+        self.source = source
+        self.value_spec = split_value(value) if isinstance(value, str) else None
+        self.expression = None
+        self.group = None
+
+        # A values list returns fields with the value
+        if re.search("^values", field):
+            self.kind = "values"
+            self.group = re.sub("^values:", "", field)
+
+        # A fields list is used verbatim
+        elif re.search("^fields", field):
+            self.kind = "fields"
+            self.group = re.sub("^fields:", "", field)
+
+        # A specific field, or an expander applied to fields
+        else:
+            self.kind = "expression"
+            self.expression = compile_field_expression(field)
+
+    def __str__(self):
+        return "[compiled-action:%s %s]" % (self.action, self.field)
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def line(self):
+        """
+        The action as a recipe line (e.g., REPLACE PatientID var:id).
+        """
+        parts = [self.action, self.field]
+        if self.value is not None:
+            parts.append(str(self.value))
+        return " ".join(parts)
+
+
+def get_action_tags(actions):
+    """
+    Get the (top level) tags that a list of compiled actions reference.
+
+    Returns a set of tag numbers, or None if the actions could reference
+    any field: an expander (e.g., contains: or ALL), a %values or %fields
+    list, a function value (func: or deid_func:, which is given the dicom),
+    or a field that isn't a known keyword, name or tag.
+    """
+    tags = set()
+    for action in actions:
+        if action.kind != "expression" or not action.expression.is_exact:
+            return
+        if action.value_spec is not None and action.value_spec[0] != "var":
+            return
+        tag = get_field_tag(action.field)
+        if tag is None:
+            return
+        tags.add(tag)
+    return tags
+
+
+def compile_actions(actions):
+    """
+    Compile a list of action dictionaries (action, field and value).
+    """
+    return [
+        CompiledAction(
+            action=action.get("action"),
+            field=action.get("field"),
+            value=action.get("value"),
+            source=action.get("source"),
+        )
+        for action in actions
+    ]
+
+
+class CompiledRecipe:
+    """
+    A deid recipe with header actions resolved once.
+
+    A DicomParser walks the header actions of a recipe for every file.
+    Compiling the recipe up front means the work of classifying each action
+    and parsing field expressions and values is done once per recipe, and
+    a batch of files can share the result. Usage:
+
+    recipe = CompiledRecipe(DeidRecipe("dicom"))
+    parser = DicomParser(dicom_file, recipe=recipe)
+    """
+
+    def __init__(self, recipe=None):
+        if not isinstance(recipe, DeidRecipe):
+            recipe = DeidRecipe(recipe)
+        self.recipe = recipe
+        self.actions = []
+        self.values_lists = {}
+        self.fields_lists = {}
+        self.keep = []
+        self.excluded_from_deletion = []
+        self.tags = set()
+
+        if recipe.deid is None:
+            return
+
+        self.actions = compile_actions(recipe.get_actions())
+        if recipe.has_values_lists():
+            self.values_lists = recipe.get_values_lists()
+        if recipe.has_fields_lists():
+            self.fields_lists = recipe.get_fields_lists()
+
+        # KEEP fields are skipped when fields are extracted
+        self.keep = [
+            compile_field_expression(action.field)
+            for action in self.actions
+            if action.action == "KEEP" and action.field
+        ]
+
+        # Fields that REPLACE or JITTER will change are not removed before then
+        self.excluded_from_deletion = [
+            compile_field_expression(action.field)
+            for action in self.actions
+            if action.action == "JITTER" and action.field
+        ] + [
+            compile_field_expression(action.field)
+            for action in self.actions
+            if action.action == "REPLACE" and action.field
+        ]
+
+        # The tags the actions reference (None if they could reference any)
+        self.tags = get_action_tags(self.actions)
+
+    def __str__(self):
+        return "[compiled-recipe:%s actions]" % len(self.actions)
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def deid(self):
+        return self.recipe.deid
+
+
+def compile_recipe(recipe=None):
+    """
+    Compile a recipe (a DeidRecipe, path, or name) for a DicomParser.
+
+    A recipe that is already compiled is returned as is.
+    """
+    if isinstance(recipe, CompiledRecipe):
+        return recipe
+    return CompiledRecipe(recipe)
+
+
+class CompiledCriterion:
+    """
+    One criterion of a %filter LABEL (e.g., contains Manufacturer GE).
+
+    The filter function and field (name or tag number) are resolved once,
+    so a criterion is evaluated by calling it with the dicom.
+    """
+
+    __slots__ = ("action", "field", "value", "description", "func", "tag")
+
+    def __init__(self, action, field, value=""):
+        self.action = action
+        self.field = field
+        self.value = value
+        self.description = "%s %s %s" % (field, action, value)
+        self.tag = get_filter_field(field)
+        self.func = get_filter(action)
+        if self.func is None:
+            bot.warning("%s is not a valid filter name, returning False" % action)
+
+    def __str__(self):
+        return "[compiled-criterion:%s]" % self.description
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __call__(self, dicom):
+        if self.func is None:
+            return False
+        return self.func(dicom, self.tag, self.value or None)
+
+
+def evaluate_criteria(dicom, criteria):
+    """
+    Evaluate a group of criteria (a list of (operator, criterion)) for a dicom.
+
+    The operator ("and" or "or") combines a criterion with the result of
+    the criteria before it, read left to right, and a criterion is only
+    called (with the dicom) when it can change the result. A group
+    without criteria is False.
+    """
+    flagged = None
+    for operator, criterion in criteria:
+        if flagged is None:
+            flagged = criterion(dicom)
+        elif operator == "or":
+            if not flagged:
+                flagged = criterion(dicom)
+        elif flagged:
+            flagged = criterion(dicom)
+    return bool(flagged)
+
+
+class CompiledLabel:
+    """
+    A %filter LABEL, resolved once into groups of criteria.
+
+    Each group (a line of the LABEL) is a list of (operator, criterion),
+    where the operator ("and" or "or") combines the criterion with the
+    result of the criteria before it, read left to right. The LABEL
+    matches if every group is True, and a criterion is only evaluated when
+    it can change the result of its group. A LABEL without criteria but
+    with coordinates always matches. The reason for a match is only built
+    when it's first needed.
+    """
+
+    def __init__(self, item):
+        self.name = item.get("name", "")
+        self.coordinates = item.get("coordinates", [])
+        self.always = not item.get("filters") and bool(self.coordinates)
+        self.groups = []
+        self.operator = ""
+        self.tags = set()
+        self._descriptions = []
+        self._reason = None
+
+        # Fields to get coordinates from are read for a match
+        for _, coordinate in self.coordinates:
+            if isinstance(coordinate, str) and "from:" in coordinate:
+                self._add_tag(coordinate.replace("from:", "", 1))
+
+        if self.always:
+            self._descriptions.append(self.name)
+            return
+
+        for group in item["filters"]:
+            inner_operators = group["InnerOperators"]
+            criteria = []
+            for idx, action in enumerate(group["action"]):
+                value = group["value"][idx] if len(group["value"]) > idx else ""
+                criterion = CompiledCriterion(action, group["field"][idx], value)
+                description = criterion.description
+
+                # The operator before a criterion combines it with the ones before
+                operator = "and"
+                if idx > 0 and len(inner_operators) > idx - 1:
+                    operator = inner_operators[idx - 1]
+                if len(inner_operators) > idx:
+                    description = "%s %s" % (description, inner_operators[idx])
+
+                criteria.append((operator, criterion))
+                self._add_tag(criterion.field)
+                self._descriptions.append(description)
+            self.groups.append(criteria)
+
+            # The operator of the last group is reported with the reason
+            self.operator = group.get("operator") or ""
+
+    def __str__(self):
+        return "[compiled-label:%s]" % self.name
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _add_tag(self, field):
+        """
+        Add the tag of a field (a keyword, or a tag number 0xGGGGEEEE).
+
+        A keyword that isn't known is not in the dicom, so it has no tag.
+        """
+        tag = get_field_tag(field)
+        if tag is not None:
+            self.tags.add(tag)
+
+    @property
+    def reason(self):
+        """
+        The reason reported when the LABEL matches.
+        """
+        if self._reason is None:
+            self._reason = (
+                "%s %s" % (self.operator, " ".join(self._descriptions))
+            ).replace("\n", " ")
+        return self._reason
+
+    def matches(self, dicom):
+        """
+        Determine if the dicom matches the LABEL.
+        """
+        if self.always:
+            return True
+        if not self.groups:
+            return False
+
+        for criteria in self.groups:
+            if not evaluate_criteria(dicom, criteria):
+                return False
+        return True
+
+    def get_coordinates(self, dicom):
+        """
+        Get the coordinates for a dicom that matches, resolving from: fields.
+
+        Each coordinate is a list with [value, coordinate], and if from: is
+        in the coordinate, it is extracted from a field of the dicom.
+        """
+        coordinates = []
+        for value, coordinate in self.coordinates:
+            if isinstance(coordinate, str) and "from:" in coordinate:
+                coordinate = extract_coordinates(dicom, coordinate)
+            coordinates.append([value, coordinate])
+        return coordinates
+
+
+class CompiledFilters:
+    """
+    The %filter section of a recipe, with each LABEL compiled once.
+
+    Usage:
+
+    filters = compile_filters(DeidRecipe("dicom"))
+    for name, label in filters.labels:
+        if label.matches(dicom):
+            ...
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.labels = []
+        for name, items in (filters or {}).items():
+            for item in items:
+                self.labels.append((name, CompiledLabel(item)))
+
+        # The tags the criteria (and from: coordinates) reference
+        self.tags = set()
+        for _, label in self.labels:
+            self.tags.update(label.tags)
+
+    def __str__(self):
+        return "[compiled-filters:%s labels]" % len(self.labels)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return len(self.labels)
+
+
+# Compiled filters by recipe (dropped when a recipe is garbage collected)
+compiled_filters = weakref.WeakKeyDictionary()
+
+
+def compile_filters(recipe):
+    """
+    Compile (once per DeidRecipe) the %filter section of a recipe.
+
+    The filters are compiled again if the recipe loads a new %filter section.
+    """
+    filters = recipe.get_filters()
+    compiled = compiled_filters.get(recipe)
+    if compiled is None or compiled.filters is not filters:
+        compiled = CompiledFilters(filters)
+        compiled_filters[recipe] = compiled
+    return compiled
@@ -0,0 +1,391 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from pydicom.dataset import Dataset
+
+from deid.dicom.batch import iter_ordered
+from deid.dicom.compiled import compile_recipe
+from deid.dicom.parser import DicomParser
+from deid.logger import bot
+
+# Columns of a header table, one row per (flattened) field of a file
+columns = ("file", "uid", "name", "keyword", "tag", "VR", "value")
+
+# Columns with strings, stored as utf-8 bytes with offsets (as Arrow does)
+string_columns = ("uid", "name", "keyword", "VR", "value")
+
+# Numeric columns, and their types
+numeric_columns = {"file": numpy.int32, "tag": numpy.uint32}
+
+# State shared by all tasks in an export worker process, set by _init_exporter
+_exporter = {}
+
+
+def get_value_string(element):
+    """
+    Get the value of an element as a string for a header table.
+
+    A sequence is flattened to its own fields, so its value is empty, and
+    bytes are decoded (replacing what isn't utf-8) so they can be searched.
+    """
+    if element.VR == "SQ" or element.value is None:
+        return ""
+    value = element.value
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, (list, tuple)) or hasattr(value, "_list"):
+        return "\\".join(str(x) for x in value)
+    return str(value)
+
+
+def get_header_columns(dicom_file, force=True, expand_sequences=True, recipe=None):
+    """
+    Get the flattened fields of a dicom file as columns.
+
+    This returns the path of the file (None for a dataset without one),
+    and a dictionary of lists with the string columns and the tag.
+    """
+    parser = DicomParser(
+        dicom_file,
+        force=force,
+        recipe=recipe or compile_recipe(),
+        disable_skip=False,
+        header_only=True,
+    )
+    fields = parser.get_fields(expand_sequences=expand_sequences).fields
+    rows = {name: [] for name in string_columns + ("tag",)}
+    for field in fields.values():
+        element = field.element
+        rows["uid"].append(field.uid)
+        rows["name"].append(field.name)
+        rows["keyword"].append(element.keyword)
+        rows["tag"].append(int(element.tag))
+        rows["VR"].append(element.VR)
+        rows["value"].append(get_value_string(element))
+    return parser.dicom_file, rows
+
+
+def _init_exporter(recipe, options):
+    """
+    Set the recipe and options once in an export worker process.
+    """
+    _exporter["recipe"] = recipe
+    _exporter["options"] = options
+
+
+def _get_columns_one(dicom_file):
+    """
+    Get the columns for a single dicom file in a worker process.
+    """
+    return get_header_columns(
+        dicom_file, recipe=_exporter["recipe"], **_exporter["options"]
+    )
+
+
+def encode_strings(values):
+    """
+    Encode a list of strings as utf-8 data and offsets.
+
+    The string at index i is data[offsets[i]:offsets[i + 1]].
+    """
+    encoded = [value.encode("utf-8", errors="surrogatepass") for value in values]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+    return data, offsets
+
+
+def decode_strings(data, offsets):
+    """
+    Decode utf-8 data and offsets (from encode_strings) to a list of strings.
+    """
+    data = data.tobytes()
+    offsets = offsets.tolist()
+    return [
+        data[start:end].decode("utf-8", errors="surrogatepass")
+        for start, end in zip(offsets, offsets[1:])
+    ]
+
+
+class HeaderTableWriter:
+    """
+    Write the rows of a header table in record batches.
+
+    Rows are added per file, and a batch (batch-00000.npz, ...) is written to
+    the output folder each time batch_size rows are pending, so memory use
+    doesn't grow with the number of files. The list of files is written to
+    files.npz when the writer is closed. An output folder that isn't empty
+    is only written to if overwrite is True, and then the table files of
+    an earlier export (and nothing else) are removed.
+    """
+
+    def __init__(self, output, batch_size=100000, overwrite=False):
+        self.output = output
+        self.batch_size = batch_size
+        self.files = []
+        self.batches = 0
+        self.rows = 0
+        self._pending = self._empty()
+        self._pending_rows = 0
+        os.makedirs(output, exist_ok=True)
+
+        existing = os.listdir(output)
+        if existing and not overwrite:
+            bot.exit("%s is not empty, set overwrite to replace its contents." % output)
+
+        # The table of an earlier export to the same folder is replaced
+        for name in existing:
+            if name == "files.npz" or (
+                name.startswith("batch-") and name.endswith(".npz")
+            ):
+                os.remove(os.path.join(output, name))
+
+    def _empty(self):
+        return {name: [] for name in columns}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, dicom_file, rows):
+        """
+        Add the rows for a file (from get_header_columns).
+        """
+        index = len(self.files)
+        self.files.append(dicom_file or "")
+        count = len(rows["uid"])
+        self._pending["file"].append(numpy.full(count, index, dtype=numpy.int32))
+        for name in string_columns + ("tag",):
+            self._pending[name].extend(rows[name])
+        self._pending_rows += count
+        if self._pending_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending rows as a record batch.
+        """
+        if not self._pending_rows:
+            return
+        # Numeric columns are saved as <name>_values ("file" is taken by numpy)
+        arrays = {
+            "file_values": numpy.concatenate(self._pending["file"]),
+            "tag_values": numpy.array(self._pending["tag"], dtype=numpy.uint32),
+        }
+        for name in string_columns:
+            data, offsets = encode_strings(self._pending[name])
+            arrays["%s_data" % name] = data
+            arrays["%s_offsets" % name] = offsets
+
+        path = os.path.join(self.output, "batch-%05d.npz" % self.batches)
+        numpy.savez_compressed(path, **arrays)
+        self.batches += 1
+        self.rows += self._pending_rows
+        self._pending = self._empty()
+        self._pending_rows = 0
+
+    def close(self):
+        """
+        Write any pending rows, and the list of files.
+        """
+        self.flush()
+        data, offsets = encode_strings(self.files)
+        numpy.savez_compressed(
+            os.path.join(self.output, "files.npz"),
+            files_data=data,
+            files_offsets=offsets,
+        )
+
+
+class HeaderTable:
+    """
+    A header table written by export_identifiers, read without the dicom.
+
+    Each column is read from the record batches (and decompressed) the
+    first time it is used, so a search of one column doesn't load the
+    others. Numeric columns (file and tag) are numpy arrays, and string
+    columns are lists. The file column is an index into files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(os.path.join(path, "files.npz")):
+            bot.exit("%s is not a header table (missing files.npz)" % path)
+        with numpy.load(os.path.join(path, "files.npz")) as files:
+            self.files = decode_strings(files["files_data"], files["files_offsets"])
+
+        self._batches = [
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.startswith("batch-") and name.endswith(".npz")
+        ]
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.column("file"))
+
+    def __repr__(self):
+        return "[deid.HeaderTable][%s files, %s rows]" % (len(self.files), len(self))
+
+    def _load_column(self, name):
+        """
+        Read a column from each record batch.
+        """
+        if name in numeric_columns:
+            arrays = []
+            for path in self._batches:
+                with numpy.load(path) as batch:
+                    arrays.append(batch["%s_values" % name])
+            return numpy.concatenate(
+                arrays or [numpy.zeros(0, dtype=numeric_columns[name])]
+            )
+
+        values = []
+        for path in self._batches:
+            with numpy.load(path) as batch:
+                values += decode_strings(
+                    batch["%s_data" % name], batch["%s_offsets" % name]
+                )
+        return values
+
+    def column(self, name):
+        """
+        Get a column by name, a numpy array or a list of strings.
+        """
+        if name not in columns:
+            bot.exit("%s is not a column, choices are %s" % (name, ", ".join(columns)))
+        if name not in self._columns:
+            self._columns[name] = self._load_column(name)
+        return self._columns[name]
+
+    def iter_rows(self):
+        """
+        Yield each row as a dictionary, with the file path for the file.
+        """
+        values = [
+            self.column(name).tolist() if name in numeric_columns else self.column(name)
+            for name in columns
+        ]
+        for row in zip(*values):
+            row = dict(zip(columns, row))
+            row["file"] = self.files[row["file"]]
+            yield row
+
+    def find(self, pattern, column="value"):
+        """
+        Find the rows where a (string) column matches a regular expression.
+
+        The search is case insensitive, and the indices of matching rows
+        are returned as a numpy array.
+
+        Parameters
+        ==========
+        pattern: the regular expression to search for
+        column: the string column to search (defaults to value)
+        """
+        search = re.compile(pattern, re.IGNORECASE).search
+        return numpy.fromiter(
+            (i for i, value in enumerate(self.column(column)) if search(value)),
+            dtype=numpy.int64,
+        )
+
+    def tags_matching(self, pattern, column="value"):
+        """
+        Count the files where each field matches a regular expression.
+
+        This answers "which tags ever contain this pattern" across a corpus.
+        The counter is indexed by keyword, or by tag (e.g., (0009,0010))
+        for a field without a keyword.
+
+        Parameters
+        ==========
+        pattern: the regular expression to search for
+        column: the string column to search (defaults to value)
+        """
+        keywords = self.column("keyword")
+        tags = self.column("tag")
+        files = self.column("file")
+        seen = set()
+        for i in self.find(pattern, column).tolist():
+            keyword = keywords[i]
+            if not keyword:
+                keyword = "(%04X,%04X)" % (tags[i] >> 16, tags[i] & 0xFFFF)
+            seen.add((keyword, files[i]))
+        return Counter(keyword for keyword, _ in seen)
+
+
+def read_header_table(path):
+    """
+    Read a header table written by export_identifiers.
+    """
+    return HeaderTable(path)
+
+
+def export_identifiers(
+    dicom_files,
+    output,
+    force=True,
+    expand_sequences=True,
+    batch_size=100000,
+    workers=None,
+    overwrite=False,
+):
+    """
+    Export the identifiers of dicom files as a columnar header table.
+
+    Instead of a lookup of fields per file (as get_identifiers returns), the
+    flattened fields of every file are written as rows (the file, uid, name,
+    keyword, tag, VR and value) to record batches in an output folder. The
+    table can be read with read_header_table and searched without reading
+    the dicom files again. If workers is greater than 1, files are read in
+    parallel, and rows keep the order of the input.
+
+    Parameters
+    ==========
+    dicom_files: the dicom file(s) (or datasets) to export
+    output: the folder to write the table to
+    force: force reading the file (default True)
+    expand_sequences: if True, expand sequences. otherwise, skips
+    batch_size: the number of rows to write per record batch
+    workers: the number of processes to use (default is 1)
+    overwrite: replace a table in an output folder that isn't empty (default False)
+    """
+    if isinstance(dicom_files, (str, Dataset)):
+        dicom_files = [dicom_files]
+
+    # The default recipe (for KEEP actions) is loaded once for all files
+    recipe = compile_recipe()
+    options = {"force": force, "expand_sequences": expand_sequences}
+
+    with HeaderTableWriter(
+        output, batch_size=batch_size, overwrite=overwrite
+    ) as writer:
+        if workers and workers > 1:
+            bot.debug("Exporting identifiers with %s workers" % workers)
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_exporter,
+                initargs=(recipe, options),
+            ) as executor:
+                items = ((dicom_file,) for dicom_file in dicom_files)
+                for result in iter_ordered(
+                    executor, _get_columns_one, items, workers * 4
+                ):
+                    writer.add(*result)
+        else:
+            for dicom_file in dicom_files:
+                writer.add(*get_header_columns(dicom_file, recipe=recipe, **options))
+
+    bot.debug(
+        "Exported %s rows for %s files to %s" % (writer.rows, len(writer.files), output)
+    )
+    return output
@@ -3,12 +3,12 @@ __copyright__ = "Copyright 2016-2025, Vanessa Sochat"
 __license__ = "MIT"
 
 import re
-from collections import defaultdict
-from contextlib import contextmanager
-from copy import deepcopy
-from functools import cache
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
 
-from pydicom import FileDataset
 from pydicom.dataelem import DataElement
 from pydicom.dataset import Dataset, FileMetaDataset, RawDataElement
 from pydicom.sequence import Sequence
@@ -19,40 +19,89 @@ from deid.logger import bot
 _EXPANDER_SPLIT_RE = re.compile(r'^([^:"]*(?:"[^"]*"[^:"]*)*):(.*)$')
 
 
+def _get_key(value):
+    """
+    Get the lowercase (interned) lookup key for a string, or None if empty.
+
+    Interned keys are shared by the many fields with the same name or tag
+    (e.g., the same element in every item of a functional groups sequence).
+    """
+    if value:
+        return sys.intern(value.lower())
+
+
 class DicomField:
     """
     A dicom field.
 
     A dicom field holds the element, and a string that represents the entire
-    nested structure (e.g., SequenceName__CodeValue).
+    nested structure (e.g., SequenceName__CodeValue). A header can have tens
+    of thousands of fields, so a field is a slotted record, and the strings
+    used to search for it (the tag forms, element name and keyword, and the
+    private creator forms of a private tag) are derived once, when it's
+    created. The element of a field is not expected to be replaced.
     """
 
+    # The lookup tables for the keys in lookup_keys, in order
+    lookup_table_names = (
+        "name",
+        "tag",
+        "stripped_tag",
+        "element_name",
+        "element_keyword",
+        "uid",
+    )
+
+    __slots__ = (
+        "element",
+        "name",
+        "uid",
+        "is_filemeta",
+        "tag",
+        "stripped_tag",
+        "private_tags",
+        "lookup_keys",
+    )
+
     def __init__(self, element, name, uid, is_filemeta=False):
         self.element = element
         self.name = name  # nested names (might not be unique)
         self.uid = uid  # unique id includes parent tags
         self.is_filemeta = is_filemeta
 
+        # The string tag (0010,0010) and the stripped tag 00100010
+        tag = element.tag
+        self.tag = sys.intern(f"({tag.group:04X},{tag.element:04X})")
+        self.stripped_tag = sys.intern(f"{tag.group:04X}{tag.element:04X}")
+
+        # Private tag syntax (lowercase), (GROUP,"PRIVATE_CREATOR",ELEMENT_OFFSET)
+        # and GROUP,"PRIVATE_CREATOR",ELEMENT_OFFSET, where the GROUP is the
+        # 4-digit hex group number (e.g., 0033) and ELEMENT_OFFSET is the
+        # 2-digit hex element number (masked to last 8 bits)
+        self.private_tags = ()
+        if element.is_private and element.private_creator is not None:
+            stripped_private_tag = f'{tag.group:04X},"{element.private_creator}",{(tag.element & 0xFF):02X}'
+            self.private_tags = (
+                _get_key("(" + stripped_private_tag + ")"),
+                _get_key(stripped_private_tag),
+            )
+
+        # Lowercase keys for each of lookup_table_names (None if empty)
+        self.lookup_keys = (
+            _get_key(name),
+            _get_key(self.tag),
+            _get_key(self.stripped_tag),
+            _get_key(element.name),
+            _get_key(element.keyword),
+            uid.lower() if uid else None,
+        )
+
     def __str__(self):
         return "%s  [%s]" % (self.element, self.name)
 
     def __repr__(self):
         return self.__str__()
 
-    @property
-    def tag(self):
-        """
-        Return a string of the element tag.
-        """
-        return str(self.element.tag)
-
-    @property
-    def stripped_tag(self):
-        """
-        Return the stripped element tag
-        """
-        return re.sub("([(]|[)]|,| )", "", str(self.element.tag))
-
     # Contains
 
     def name_contains(self, expression):
@@ -86,39 +135,16 @@ class DicomField:
         if isinstance(expression, str):
             expression = re.compile(expression, re.IGNORECASE)
 
-        if (
-            expression.search(self.name.lower())
-            or expression.search(
-                f"({self.element.tag.group:04X},{self.element.tag.element:04X})".lower()
-            )
-            or expression.search(self.stripped_tag)
-            or expression.search(self.element.name)
-            or expression.search(self.element.keyword)
-        ):
-            return True
-
-        if self.element.is_private and (self.element.private_creator is not None):
-            # Handle private tag syntax matching
-            # Private tags can be referenced using two formats:
-            # 1. Stripped format: GROUP,"PRIVATE_CREATOR",ELEMENT_OFFSET
-            #    Example: 0033,"MITRA OBJECT UTF8 ATTRIBUTES 1.0",1E
-            # 2. Parentheses format: (GROUP,"PRIVATE_CREATOR",ELEMENT_OFFSET)
-            #    Example: (0033,"MITRA OBJECT UTF8 ATTRIBUTES 1.0",1E)
-            #
-            # The GROUP is the 4-digit hex group number (e.g., 0033)
-            # The PRIVATE_CREATOR is the private creator string in quotes
-            # The ELEMENT_OFFSET is the 2-digit hex element number (masked to last 8 bits)
-            stripped_private_tag = f'{self.element.tag.group:04X},"{self.element.private_creator}",{(self.element.tag.element & 0xFF):02X}'
-            private_tag = "(" + stripped_private_tag + ")"
-            if re.search(expression, stripped_private_tag) or re.search(
-                expression, private_tag
-            ):
+        # The name, tag, stripped tag, element name and keyword, and
+        # private tag forms (all lowercase)
+        for key in self.lookup_keys[:5] + self.private_tags:
+            if key is not None and expression.search(key):
                 return True
         return False
 
-    def value_contains(self, expression):
+    def value_strings(self):
         """
-        Use re to search a field value for a regular expression
+        Return the value of the field as a list of strings (one per value)
         """
         values = self.element.value
 
@@ -126,13 +152,26 @@ class DicomField:
         if not isinstance(values, list):
             values = [values]
 
-        values = [str(x) for x in values]
+        return [str(x) for x in values]
 
-        for value in values:
+    def value_contains(self, expression):
+        """
+        Use re to search a field value for a regular expression
+        """
+        for value in self.value_strings():
             if re.search(expression, value, re.IGNORECASE):
                 return True
         return False
 
+    def value_matches(self, matcher):
+        """
+        Determine if a field value contains any literal of a LiteralMatcher
+        """
+        for value in self.value_strings():
+            if matcher.search(value):
+                return True
+        return False
+
     def select_matches(self, expression):
         """
         Determine whether the element has a specific selected attribute
@@ -242,6 +281,106 @@ def _split_expander_expression(field):
     return [field]
 
 
+class FieldExpression:
+    """
+    A field expression from a recipe, parsed once.
+
+    A field expression is either a specific field (e.g., PatientID or
+    (0010,0020)), the "all" expander, or an expander with an argument
+    (e.g., contains:Patient). Parsing it once means that expanding it for
+    each dicom does not need to split the string or compile regular
+    expressions again.
+    """
+
+    # Expanders that filter fields using a regular expression on the name
+    regex_expanders = ["endswith", "startswith", "contains", "except"]
+
+    def __init__(self, field):
+        self.field = field
+        self.expander = None
+        self.expression = None
+        self.expression_re = None
+
+        # Case 1: field is an expander without an argument (e.g., no :)
+        if field.lower() == "all":
+            self.expander = "all"
+            return
+
+        # Case 2: The field is a specific field OR an expander with argument (A:B)
+        # Split on the first colon that's not inside quotes to handle private tags
+        # with colons in their creator names (e.g., "Siemens: Thorax/...")
+        parts = _split_expander_expression(field)
+        if len(parts) == 1:
+            return
+
+        # if we get down here, we have an expander and expression
+        expander, expression = parts
+        self.expander = expander.lower()
+        expression = expression.lower()
+
+        # Derive expression based on field expander
+        if self.expander == "endswith":
+            expression = "(%s)$" % expression
+        elif self.expander == "startswith":
+            expression = "^(%s)" % expression
+        self.expression = expression
+
+        if self.expander in self.regex_expanders:
+            self.expression_re = re.compile(expression, re.IGNORECASE)
+
+    def __str__(self):
+        return "[field-expression:%s]" % self.field
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def is_exact(self):
+        """
+        Determine if the expression names a specific field (no expander)
+        """
+        return self.expander is None
+
+    def expand(self, dicom, contenders=None):
+        """
+        Get the fields matched by the expression.
+
+        Returns: a dictionary of DicomField objects, indexed by uid
+        """
+        # if no contenders provided, use top level of dicom headers
+        if contenders is None:
+            contenders = get_fields_with_lookup(dicom)
+
+        # A shallow copy, so the contenders can change as fields are removed
+        if self.expander == "all":
+            return dict(contenders.fields)
+
+        if self.expander is None:
+            return {
+                field.uid: field for field in contenders.get_exact_matches(self.field)
+            }
+
+        fields = {}
+        for uid, field in contenders.items():
+            if isinstance(field, str) and string_matches_expander(
+                self.expander, self.expression, field
+            ):
+                fields[uid] = field
+            elif isinstance(field, DicomField) and field_matches_expander(
+                self.expander, self.expression, self.expression_re, field
+            ):
+                fields[uid] = field
+        return fields
+
+
+@lru_cache(maxsize=4096)
+def compile_field_expression(field):
+    """
+    Parse (and cache) a field expression from a recipe.
+    """
+    return FieldExpression(field)
+
+
 def expand_field_expression(field, dicom, contenders=None):
     """
     Get a list of fields based on an expression.
@@ -257,50 +396,7 @@ def expand_field_expression(field, dicom, contenders=None):
 
     Returns: a dictionary of DicomField objects
     """
-    # Expanders that don't have a : must be checked for
-    expanders = ["all"]
-
-    # if no contenders provided, use top level of dicom headers
-    if contenders is None:
-        contenders = get_fields_with_lookup(dicom)
-
-    # Case 1: field is an expander without an argument (e.g., no :)
-    if field.lower() in expanders:
-        if field.lower() == "all":
-            fields = deepcopy(contenders.fields)
-        return fields
-
-    # Case 2: The field is a specific field OR an expander with argument (A:B)
-    # Split on the first colon that's not inside quotes to handle private tags
-    # with colons in their creator names (e.g., "Siemens: Thorax/...")
-    fields = _split_expander_expression(field)
-    if len(fields) == 1:
-        return {field.uid: field for field in contenders.get_exact_matches(fields[0])}
-
-    # if we get down here, we have an expander and expression
-    expander, expression = fields
-    expression = expression.lower()
-    fields = {}
-
-    # Derive expression based on field expander
-    if expander.lower() == "endswith":
-        expression = "(%s)$" % expression
-    elif expander.lower() == "startswith":
-        expression = "^(%s)" % expression
-
-    expression_re = None
-    # Loop through fields, all are strings STOPPED HERE NEED TO ADDRESS EMPTY NAME
-    for uid, field in contenders.items():
-        if isinstance(field, str) and string_matches_expander(
-            expander, expression, field
-        ):
-            fields[uid] = field
-        elif isinstance(field, DicomField) and field_matches_expander(
-            expander, expression, expression_re, field
-        ):
-            fields[uid] = field
-
-    return fields
+    return compile_field_expression(field).expand(dicom, contenders=contenders)
 
 
 def string_matches_expander(expander, expression_string, string):
@@ -345,21 +441,27 @@ class FieldsWithLookups:
     """
     This class is a wrapper around a dictionary of DicomField objects keyed by uid,
     with some supplemental lookup tables to enable rapid field lookup.
+
+    Each lookup table maps a (lowercase) key to a dictionary of the fields with
+    that key, indexed by uid, so a field is added or removed in constant time.
+    The fields are also indexed as a tree by uid, where the uid of a nested
+    field is the path to it (e.g., (0008,1110)__0__(0008,1150) is a child of
+    item 0 of the sequence (0008,1110)), so the fields nested under a field
+    are found (and removed) without looking at the fields that are not.
     """
 
+    lookup_table_names = DicomField.lookup_table_names
+
     def __init__(self, fields):
         self.fields = fields
+        self.lookup_tables = {name: {} for name in self.lookup_table_names}
+
+        # Children of each node in the tree (a field or a sequence item) by path
+        self.children = {}
 
-        self.lookup_tables = {
-            "name": defaultdict(list),
-            "tag": defaultdict(list),
-            "stripped_tag": defaultdict(list),
-            "element_name": defaultdict(list),
-            "element_keyword": defaultdict(list),
-            "uid": defaultdict(list),
-        }
         for uid, field in fields.items():
-            self._add_field_to_lookup(field)
+            self._add_field_to_lookup(uid, field)
+            self._add_to_tree(uid)
 
     def get_exact_matches(self, field):
         """
@@ -369,14 +471,9 @@ class FieldsWithLookups:
         """
         if isinstance(field, str):
             field = field.lower()
-        exact_match_contenders = (
-            self.lookup_tables["name"][field]
-            + self.lookup_tables["tag"][field]
-            + self.lookup_tables["stripped_tag"][field]
-            + self.lookup_tables["element_name"][field]
-            + self.lookup_tables["element_keyword"][field]
-            + self.lookup_tables["uid"][field]
-        )
+        exact_match_contenders = []
+        for table in self.lookup_tables.values():
+            exact_match_contenders.extend(table.get(field, {}).values())
         return exact_match_contenders
 
     def __getitem__(self, key):
@@ -385,6 +482,12 @@ class FieldsWithLookups:
     def __setitem__(self, key, value):
         self.fields[key] = value
 
+    def __contains__(self, key):
+        return key in self.fields
+
+    def __len__(self):
+        return len(self.fields)
+
     def __iter__(self):
         return iter(self.fields)
 
@@ -395,70 +498,186 @@ class FieldsWithLookups:
         return self.fields.values()
 
     def add(self, uid, field):
+        if uid in self.fields:
+            self._remove_field_from_lookup(uid, self.fields[uid])
         self.fields[uid] = field
-        self._add_field_to_lookup(field)
+        self._add_field_to_lookup(uid, field)
+        self._add_to_tree(uid)
 
     def _get_field_lookup_keys(self, field):
-        if not isinstance(field, DicomField):
-            case_insensitive_field = field.lower()
-            self.lookup_tables["name"][case_insensitive_field].append(
-                case_insensitive_field
-            )
-            return {"name": [case_insensitive_field]}
-        lookup_keys = {}
-        if field.name:
-            lookup_keys["name"] = [field.name.lower()]
-        if field.tag:
-            lookup_keys["tag"] = [field.tag.lower()]
-        if field.stripped_tag:
-            lookup_keys["stripped_tag"] = [field.stripped_tag.lower()]
-        if field.element.name:
-            lookup_keys["element_name"] = [field.element.name.lower()]
-        if field.element.keyword:
-            lookup_keys["element_keyword"] = [field.element.keyword.lower()]
-        if field.uid:
-            lookup_keys["uid"] = [field.uid.lower()]
-        if field.element.is_private:
-            lookup_keys["name"] = lookup_keys.get("name", []) + [
-                f'({field.element.tag.group:04X},"{field.element.private_creator}",{(field.element.tag.element & 0x00FF):02X})'.lower(),
-                f'{field.element.tag.group:04X},"{field.element.private_creator}",{(field.element.tag.element & 0x00FF):02X}'.lower(),
-            ]
-        return lookup_keys
-
-    def _add_field_to_lookup(self, field):
-        for table_name, lookup_keys in self._get_field_lookup_keys(field).items():
-            for key in lookup_keys:
-                self.lookup_tables[table_name][key].append(field)
+        """
+        Yield the (lookup table name, key) pairs of a field.
+        """
+        for table_name, key in zip(self.lookup_table_names, field.lookup_keys):
+            if key is not None:
+                yield table_name, key
+        for key in field.private_tags:
+            yield "name", key
+
+    def _add_field_to_lookup(self, uid, field):
+        lookup_tables = self.lookup_tables
+        for table_name, key in self._get_field_lookup_keys(field):
+            lookup_tables[table_name].setdefault(key, {})[uid] = field
+
+    def _remove_field_from_lookup(self, uid, field):
+        for table_name, key in self._get_field_lookup_keys(field):
+            table = self.lookup_tables[table_name]
+            bucket = table.get(key)
+            if bucket is None or uid not in bucket:
+                continue
+            del bucket[uid]
+            if not bucket:
+                del table[key]
+
+    def _add_to_tree(self, uid):
+        """
+        Add a uid to the tree, with any missing parents (e.g., sequence items).
+        """
+        while "__" in uid:
+            parent = uid.rsplit("__", 1)[0]
+            siblings = self.children.setdefault(parent, {})
+            if uid in siblings:
+                return
+            siblings[uid] = None
+            uid = parent
+
+    def get_descendants(self, uid):
+        """
+        Get the uids of all fields nested under a field (e.g., a sequence).
+        """
+        descendants = []
+        nodes = list(self.children.get(uid, {}))
+        while nodes:
+            node = nodes.pop()
+            if node in self.fields:
+                descendants.append(node)
+            nodes.extend(self.children.get(node, {}))
+        return descendants
 
     def remove(self, uid):
         if uid not in self.fields:
             return
-        field = self.fields[uid]
-        for table_name, lookup_keys in self._get_field_lookup_keys(field).items():
-            for key in lookup_keys:
-                if field not in self.lookup_tables[table_name][key]:
-                    continue
-                self.lookup_tables[table_name][key].remove(field)
-                if not self.lookup_tables[table_name][key]:
-                    del self.lookup_tables[table_name][key]
-        del self.fields[uid]
-
-
-@contextmanager
-def override_attr(obj, attr, value):
+        field = self.fields.pop(uid)
+        self._remove_field_from_lookup(uid, field)
+
+    def remove_descendants(self, uid):
+        """
+        Remove all fields nested under a field, and their part of the tree.
+        """
+        for descendant in self.get_descendants(uid):
+            self.remove(descendant)
+
+        nodes = [uid]
+        while nodes:
+            for node in self.children.pop(nodes.pop(), {}):
+                nodes.append(node)
+
+    def remove_tree(self, uid):
+        """
+        Remove a field, all fields nested under it, and its part of the tree.
+        """
+        self.remove(uid)
+        self.remove_descendants(uid)
+        if "__" in uid:
+            parent = uid.rsplit("__", 1)[0]
+            self.children.get(parent, {}).pop(uid, None)
+
+
+class FieldsCache:
     """
-    Temporarily override an attribute of an object.
+    A bounded (least recently used) cache of the fields of datasets.
+
+    Fields are cached by the identity of the dataset and the arguments used
+    to extract them. The cache holds a weak reference to each dataset, so it
+    does not keep datasets alive, an entry is dropped when its dataset is
+    garbage collected, and an entry is never returned for a new dataset
+    that happens to have the id of an old one. Callers get a copy of the
+    cached fields, so they can add and remove fields freely. A caller that
+    changes the structure of a dataset (adding or removing elements) should
+    call invalidate for the dataset. Hits and misses are counted (see info).
     """
-    attribute_undefined = not hasattr(obj, attr)
-    try:
-        original_value = getattr(obj, attr, None)
-        setattr(obj, attr, value)
-        yield
-    finally:
-        if attribute_undefined:
-            delattr(obj, attr)
-        else:
-            setattr(obj, attr, original_value)
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        return "[fields-cache:%s/%s]" % (len(self._entries), self.maxsize)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def info(self):
+        """
+        Return a dictionary of hits, misses, and the current and maximum size.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def get(self, dicom, skip=None, expand_sequences=True, seen=None):
+        """
+        Get the fields of a dataset (a dictionary indexed by uid).
+        """
+        key = (id(dicom), skip, expand_sequences, seen)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is dicom:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            self.misses += 1
+
+        fields = _get_fields_inner(
+            dicom, skip=skip, expand_sequences=expand_sequences, seen=seen
+        )
+        if self.maxsize <= 0:
+            return fields
+
+        try:
+            ref = weakref.ref(dicom, lambda ref: self._discard(key, ref))
+        except TypeError:
+            return fields
+
+        with self._lock:
+            self._entries[key] = (ref, fields)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return dict(fields)
+
+    def _discard(self, key, ref):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del self._entries[key]
+
+    def invalidate(self, dicom):
+        """
+        Remove the cached fields of a dataset, e.g., after it is changed.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == id(dicom)]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Remove all entries, and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# The cache shared by get_fields_with_lookup
+fields_cache = FieldsCache()
 
 
 def get_fields_with_lookup(dicom, skip=None, expand_sequences=True, seen=None):
@@ -466,36 +685,23 @@ def get_fields_with_lookup(dicom, skip=None, expand_sequences=True, seen=None):
     different field properties.
 
     Each entry is a DicomField. If we find a sequence, we unwrap it and
-    represent the location with the name (e.g., Sequence__Child)
+    represent the location with the name (e.g., Sequence__Child). The
+    fields are cached for the dataset (see FieldsCache).
     """
-    # NOTE: this hashing function is required to enable caching on
-    # `get_fields_inner`. While it is not ideal to override the hashing
-    # behavior of the PyDicom FileDataset class, it appears to be the
-    # only way to enable the use of caching without incurring significant
-    # performance overhead. Note that adding a proxy class around this
-    # decreases performance substantially (50% slowdown measured).
-    with override_attr(FileDataset, "__hash__", lambda self: id(self)):
-        fields, new_seen, new_skip = _get_fields_inner(
-            dicom,
-            skip=tuple(skip) if skip else None,
-            expand_sequences=expand_sequences,
-            seen=tuple(seen) if seen else None,
-        )
-        skip = new_skip
-        seen = new_seen
+    fields = fields_cache.get(
+        dicom,
+        skip=tuple(skip) if skip else None,
+        expand_sequences=expand_sequences,
+        seen=tuple(seen) if seen else None,
+    )
+    return FieldsWithLookups(fields)
 
-        return FieldsWithLookups(fields)
 
-
-@cache
 def _get_fields_inner(dicom, skip=None, expand_sequences=True, seen=None):
-    skip = list(skip) if skip else []
-    seen = list(seen) if seen else []
+    skip = set(skip) if skip else set()
+    seen = set(seen) if seen else set()
     fields = {}  # indexed by nested tag
 
-    if not isinstance(skip, list):
-        skip = [skip]
-
     # Retrieve both dicom and file meta fields if dicom came from a file
     datasets = [d for d in [dicom, dicom.get("file_meta")] if d]
 
@@ -509,7 +715,7 @@ def _get_fields_inner(dicom, skip=None, expand_sequences=True, seen=None):
         """
         if uid not in seen:
             fields[uid] = DicomField(element, name, uid, is_filemeta)
-            seen.append(uid)
+            seen.add(uid)
 
     while datasets:
         # Grab the first dataset, usually just the dicom
@@ -562,4 +768,4 @@ def _get_fields_inner(dicom, skip=None, expand_sequences=True, seen=None):
                     "Unrecognized type %s in extract sequences, skipping." % type(item)
                 )
 
-    return fields, seen, skip
+    return fields
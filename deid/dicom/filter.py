@@ -5,6 +5,7 @@ __license__ = "MIT"
 import re
 
 from pydicom.dataset import DataElement, Dataset
+from pydicom.sequence import Sequence
 
 from deid.logger import bot
 
@@ -30,33 +31,80 @@ def apply_filter(dicom, field, filter_name, value):
     value: the value to set, if filter_name is valid
 
     """
-    if "0x" in field:
-        field = int(field, 0)  # 0=decode hex with 0x prefix
-    filter_name = filter_name.lower().strip()
-
-    if filter_name == "contains":
-        return dicom.contains(field, value)
+    func = get_filter(filter_name)
+    if func is None:
+        bot.warning("%s is not a valid filter name, returning False" % filter_name)
+        return False
+    return func(dicom, get_filter_field(field), value)
 
-    if filter_name == "notcontains":
-        return dicom.notContains(field, value)
 
-    elif filter_name == "equals":
-        return dicom.equals(field, value)
+def get_filter(filter_name):
+    """
+    Get the function for a filter name (e.g., contains), or None if not valid.
 
-    elif filter_name == "missing":
-        return dicom.missing(field)
+    The function takes the dicom, field and value, as apply_filter does.
+    """
+    return filters.get(filter_name.lower().strip())
 
-    elif filter_name == "present":
-        return not dicom.missing(field)
 
-    elif filter_name == "empty":
-        return dicom.empty(field)
+def get_filter_field(field):
+    """
+    Get the field for a filter, a name or a tag number from a string '0xGGGGEEEE'
+    """
+    if "0x" in field:
+        return int(field, 0)  # 0=decode hex with 0x prefix
+    return field
 
-    elif filter_name == "notequals":
-        return dicom.notEquals(field, value)
 
-    bot.warning("%s is not a valid filter name, returning False" % filter_name)
-    return False
+def extract_coordinates(dicom, field):
+    """
+    Given a field that is provided for a dicom, extract coordinates
+    """
+    field = field.replace("from:", "", 1)
+    coordinates = []
+    if field not in dicom:
+        return coordinates
+
+    regions = []
+    region = dicom.get(field)
+
+    # First put list of attributes together
+    if isinstance(region, Sequence):
+        for entry in region:
+            regions.append(entry)
+    else:
+        regions.append(region)
+
+    # Now extract coordinates
+    for region in regions:
+        if (
+            "RegionLocationMinX0" in region
+            and "RegionLocationMinY0" in region
+            and "RegionLocationMaxX1" in region
+            and "RegionLocationMaxY1" in region
+        ):
+            # https://gist.github.com/vsoch/df6957be12c34e62b21000603f1687e5
+            # minr, minc, maxr, maxc = coordinate
+            # self.cleaned[minc:maxc, minr:maxr] = 0  # should fill with black
+            # self.cleaned[A:B, C:D]
+            # image[A:B,C:D]
+            # A: refers to ymin
+            # B: refers to ymax
+            # C: refers xmin
+            # D: refers to xmax
+            # self.cleaned[ymin:ymax, xmin:xmax]
+            # coordinate must be [xmin, ymin, xmax, ymax]
+            # x0,y0,x1,y1.
+            coordinates.append(
+                "%s,%s,%s,%s"
+                % (
+                    region.RegionLocationMinX0,
+                    region.RegionLocationMinY0,
+                    region.RegionLocationMaxX1,
+                    region.RegionLocationMaxY1,
+                )
+            )
+    return coordinates
 
 
 ################################################################################
@@ -272,3 +320,15 @@ def endsWith(self, field, term):
 
 Dataset.startsWith = startsWith
 Dataset.endsWith = endsWith
+
+
+# Filters by name, each called with the dicom, field and value
+filters = {
+    "contains": lambda dicom, field, value: dicom.contains(field, value),
+    "notcontains": lambda dicom, field, value: dicom.notContains(field, value),
+    "equals": lambda dicom, field, value: dicom.equals(field, value),
+    "missing": lambda dicom, field, value: dicom.missing(field),
+    "present": lambda dicom, field, value: not dicom.missing(field),
+    "empty": lambda dicom, field, value: dicom.empty(field),
+    "notequals": lambda dicom, field, value: dicom.notEquals(field, value),
+}
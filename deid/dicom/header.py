@@ -4,8 +4,18 @@ __license__ = "MIT"
 
 
 import os
+import time
+
+from pydicom.dataset import Dataset
 
 import deid.dicom.utils as utils
+from deid.dicom.batch import (
+    get_file_lookup,
+    replace_identifiers_batch,
+    replace_identifiers_single,
+)
+from deid.dicom.cache import get_fingerprint, get_run_cache
+from deid.dicom.compiled import compile_recipe
 from deid.dicom.parser import DicomParser
 from deid.dicom.utils import save_dicom
 from deid.logger import bot
@@ -44,9 +54,19 @@ def get_identifiers(
     bot.debug("Extracting identifiers for %s dicom" % len(dicom_files))
     lookup = dict()
 
+    # The default recipe (for KEEP actions) is loaded once for all files
+    recipe = compile_recipe()
+
     # Parse each dicom file
     for dicom_file in dicom_files:
-        parser = DicomParser(dicom_file, force=force, config=config, disable_skip=False)
+        parser = DicomParser(
+            dicom_file,
+            force=force,
+            config=config,
+            recipe=recipe,
+            disable_skip=False,
+            header_only=True,
+        )
         lookup[parser.dicom_file] = parser.get_fields(
             expand_sequences=expand_sequences
         ).fields
@@ -98,6 +118,10 @@ def replace_identifiers(
     strip_sequences=False,
     remove_private=False,
     disable_skip=False,
+    workers=None,
+    cache=None,
+    profile=None,
+    metrics=None,
 ):
     """
     Replace identifiers.
@@ -105,6 +129,17 @@ def replace_identifiers(
     replace identifiers using pydicom, can be slow when writing
     and saving new files. If you want to replace sequences, they need
     to be extracted with get_identifiers and expand_sequences to True.
+    If workers is greater than 1, files are processed in parallel by
+    a pool of that many processes (results keep the input order).
+    If a cache (a RunCache or path to one) is given and save is True,
+    a file that was saved before with the same recipe, options and
+    lookup (and hasn't changed) isn't processed again, and the path of
+    the output is returned (if it still exists). If a profile (an
+    ActionProfile, see deid.dicom.profile) is given, the time, calls and
+    matched fields of each recipe action and deid_func are added to it,
+    for files processed here and in workers (not files found in a cache).
+    If metrics (a MetricsRegistry, see deid.dicom.metrics) are given, the
+    files, bytes, errors and seconds of each stage are counted in them.
     """
     if not isinstance(dicom_files, list):
         dicom_files = [dicom_files]
@@ -113,36 +148,147 @@ def replace_identifiers(
     if not deid:
         bot.warning("No deid specification provided, will use defaults.")
 
+    # Load and compile the recipe once, instead of once per file
+    deid = compile_recipe(deid)
+
     # ids (a lookup) is not required
     ids = ids or {}
 
+    options = {
+        "save": save,
+        "overwrite": overwrite,
+        "output_folder": output_folder,
+        "force": force,
+        "config": config,
+        "strip_sequences": strip_sequences,
+        "remove_private": remove_private,
+        "disable_skip": disable_skip,
+    }
+
+    # Only saved outputs can be reused, so only then is a cache used
+    cache = get_run_cache(cache)
+    if cache is not None and save is True:
+        options["config"] = config and os.path.abspath(config)
+        options["output_folder"] = output_folder and os.path.abspath(output_folder)
+        fingerprint = get_fingerprint(
+            deid.recipe.deid, {k: v for k, v in options.items() if k != "overwrite"}
+        )
+        items = [
+            (x, get_fingerprint(fingerprint, get_file_lookup(ids, x)))
+            for x in dicom_files
+        ]
+        return cache.run(
+            "replace",
+            items,
+            lambda files: replace_identifiers(
+                files,
+                ids=ids,
+                deid=deid,
+                workers=workers,
+                profile=profile,
+                metrics=metrics,
+                **options,
+            ),
+            is_valid=os.path.exists,
+        )
+
+    if workers is not None and workers > 1:
+        return list(
+            replace_identifiers_batch(
+                dicom_files,
+                ids=ids,
+                deid=deid,
+                workers=workers,
+                profile=profile,
+                metrics=metrics,
+                **options,
+            )
+        )
+
     # Parse through dicom files, update headers, and save
     updated_files = []
     for dicom_file in dicom_files:
-        parser = DicomParser(
-            dicom_file,
-            force=force,
-            config=config,
-            recipe=deid,
-            disable_skip=disable_skip,
+        updated_files.append(
+            replace_identifiers_single(
+                dicom_file,
+                recipe=deid,
+                lookup=get_file_lookup(ids, dicom_file),
+                profile=profile,
+                metrics=metrics,
+                **options,
+            )
         )
+    return updated_files
 
-        # If a custom lookup was provided, update the parser
-        if parser.dicom_file in ids:
-            parser.lookup.update(ids[parser.dicom_file])
 
-        parser.parse(strip_sequences=strip_sequences, remove_private=remove_private)
+def iter_replace_identifiers(
+    dicom_files,
+    ids=None,
+    deid=None,
+    save=False,
+    overwrite=False,
+    output_folder=None,
+    force=True,
+    config=None,
+    strip_sequences=False,
+    remove_private=False,
+    disable_skip=False,
+    lookahead=2,
+    profile=None,
+    metrics=None,
+):
+    """
+    Replace identifiers, yielding one file at a time.
 
-        # Save to file, otherwise return updated objects
-        if save is True:
-            ds = save_dicom(
-                dicom=parser.dicom,
-                dicom_file=parser.dicom_file,
-                output_folder=output_folder,
-                overwrite=overwrite,
-            )
-            updated_files.append(ds)
-        else:
-            updated_files.append(parser.dicom)
+    This is a streaming version of replace_identifiers. Instead of returning
+    a list of every result, it yields a tuple for each file, in order:
 
-    return updated_files
+    (input_path, output_path_or_dataset, report)
+
+    where the report is a dictionary with the dicom name, whether it was
+    saved, and the seconds taken to process it. Files are read in a
+    background thread at most lookahead files ahead, so memory does not
+    grow with the size of the input. dicom_files can be a generator.
+    If a profile (an ActionProfile) is given, actions are recorded in it,
+    and if metrics (a MetricsRegistry) are given, files are counted in them.
+    """
+    if isinstance(dicom_files, (str, Dataset)):
+        dicom_files = [dicom_files]
+
+    # Load and compile the recipe once, instead of once per file
+    deid = compile_recipe(deid)
+    ids = ids or {}
+
+    for dicom_file, dicom, error in utils.read_ahead(
+        dicom_files, force=force, lookahead=lookahead
+    ):
+        if error is not None:
+            if metrics is not None:
+                metrics.inc("deid_errors", kind="replace")
+            raise error
+
+        start = time.time()
+        result = replace_identifiers_single(
+            dicom,
+            recipe=deid,
+            lookup=get_file_lookup(ids, dicom_file),
+            save=save,
+            overwrite=overwrite,
+            output_folder=output_folder,
+            config=config,
+            strip_sequences=strip_sequences,
+            remove_private=remove_private,
+            disable_skip=disable_skip,
+            profile=profile,
+            metrics=metrics,
+        )
+        input_path = dicom_file
+        if isinstance(dicom_file, Dataset):
+            input_path = dicom_file.get("filename")
+            input_path = input_path if isinstance(input_path, str) else None
+        report = {
+            "dicom_name": os.path.basename(input_path) if input_path else None,
+            "saved": save is True,
+            "seconds": time.time() - start,
+        }
+        yield input_path, result, report
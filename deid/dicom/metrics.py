@@ -0,0 +1,425 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from deid.logger import bot
+
+# Upper bounds (seconds) of the buckets of latency histograms
+latency_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Metrics of a batch run, (kind, name, help)
+deid_metrics = (
+    ("counter", "deid_files", "Files processed, by kind of run."),
+    ("counter", "deid_errors", "Files that failed, by kind of run."),
+    ("counter", "deid_bytes_read", "Bytes of input files, by kind of run."),
+    ("counter", "deid_bytes_written", "Bytes of output files, by kind of run."),
+    ("counter", "deid_detected", "Files checked for burned pixels, by result."),
+    ("histogram", "deid_file_seconds", "Seconds to process a file, by kind of run."),
+    ("histogram", "deid_stage_seconds", "Seconds spent in a stage, for one file."),
+)
+
+
+def get_labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=None):
+    """
+    Format labels (a key from get_labels_key) for OpenMetrics.
+    """
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ""
+    values = [
+        '%s="%s"'
+        % (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    ]
+    return "{%s}" % ",".join(values)
+
+
+def format_number(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    A counter, a total that only goes up, for each set of labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = get_labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(get_labels_key(labels), 0)
+
+    def to_dict(self):
+        return [
+            {"labels": dict(key), "value": value} for key, value in self.values.items()
+        ]
+
+    def merge(self, samples):
+        for sample in samples:
+            self.inc(sample["value"], **sample["labels"])
+
+    def to_openmetrics(self):
+        return [
+            "%s_total%s %s" % (self.name, format_labels(key), format_number(value))
+            for key, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """
+    A histogram of observed values (e.g., seconds), for each set of labels.
+
+    The count of values in each bucket (the values at most its upper bound,
+    and more than the bound before it) is kept, with the sum and count of
+    all values. Buckets are cumulative in OpenMetrics.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=latency_buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.values = {}
+
+    def _get(self, key):
+        value = self.values.get(key)
+        if value is None:
+            value = {"buckets": [0] * len(self.buckets), "sum": 0, "count": 0}
+            self.values[key] = value
+        return value
+
+    def observe(self, value, **labels):
+        counts = self._get(get_labels_key(labels))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts["buckets"][index] += 1
+                break
+        counts["sum"] += value
+        counts["count"] += 1
+
+    def get(self, **labels):
+        return self.values.get(get_labels_key(labels))
+
+    def to_dict(self):
+        return [
+            {
+                "labels": dict(key),
+                "buckets": [
+                    [format_number(bound), count]
+                    for bound, count in zip(self.buckets, value["buckets"])
+                ],
+                "sum": value["sum"],
+                "count": value["count"],
+            }
+            for key, value in self.values.items()
+        ]
+
+    def merge(self, samples):
+        for sample in samples:
+            counts = self._get(get_labels_key(sample["labels"]))
+            for index, (_, count) in enumerate(sample["buckets"]):
+                counts["buckets"][index] += count
+            counts["sum"] += sample["sum"]
+            counts["count"] += sample["count"]
+
+    def to_openmetrics(self):
+        lines = []
+        for key, value in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets, value["buckets"]):
+                total += count
+                lines.append(
+                    "%s_bucket%s %s"
+                    % (
+                        self.name,
+                        format_labels(key, [("le", format_number(bound))]),
+                        total,
+                    )
+                )
+            lines.append(
+                "%s_sum%s %s"
+                % (self.name, format_labels(key), format_number(value["sum"]))
+            )
+            lines.append(
+                "%s_count%s %s" % (self.name, format_labels(key), value["count"])
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """
+    A registry of counters and histograms for batch runs.
+
+    Give a registry as metrics to replace_identifiers, has_burned_pixels or
+    a DicomCleaner, and it records the files processed, bytes read and
+    written, errors, files flagged (or clean), and the latency of each file
+    and stage (read, parse, actions, detect, pixel_clean and write). Work
+    done in worker processes is merged as each file finishes. A snapshot
+    can be written as json or as OpenMetrics text (e.g., for the textfile
+    collector of a Prometheus node exporter), and a MetricsExporter writes
+    one periodically, so no external service is needed.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.RLock()
+        self.created = time.time()
+        for kind, name, help in deid_metrics:
+            if kind == "counter":
+                self.counter(name, help)
+            else:
+                self.histogram(name, help)
+
+    def __str__(self):
+        return "[deid.MetricsRegistry][%s metrics]" % len(self.metrics)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    def counter(self, name, help=""):
+        """
+        Get (or create) a counter by name.
+        """
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Counter(name, help)
+            return self.metrics[name]
+
+    def histogram(self, name, help="", buckets=latency_buckets):
+        """
+        Get (or create) a histogram by name.
+        """
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(name, help, buckets)
+            return self.metrics[name]
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            self.metrics[name].inc(amount, **labels)
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            self.metrics[name].observe(value, **labels)
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Time a stage (e.g., read or write) of processing a file.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("deid_stage_seconds", time.perf_counter() - start, stage=stage)
+
+    @contextmanager
+    def track_file(self, kind, dicom_file=None):
+        """
+        Count a file (and its latency, and size if it's a path) for a kind of run.
+
+        An exception (or exit) is counted as an error (and raised). The context is a
+        dictionary, set "bytes_written" (or "output", a path) in it to count
+        the bytes of the output.
+        """
+        context = {"bytes_written": 0, "output": None}
+        start = time.perf_counter()
+        try:
+            yield context
+        except (Exception, SystemExit):  # bot.exit raises SystemExit
+            self.inc("deid_errors", kind=kind)
+            raise
+        bytes_written = context["bytes_written"]
+        output = context["output"]
+        if not bytes_written and isinstance(output, str) and os.path.exists(output):
+            bytes_written = os.path.getsize(output)
+        with self.lock:
+            self.inc("deid_files", kind=kind)
+            self.observe("deid_file_seconds", time.perf_counter() - start, kind=kind)
+            if isinstance(dicom_file, str) and os.path.exists(dicom_file):
+                self.inc("deid_bytes_read", os.path.getsize(dicom_file), kind=kind)
+            if bytes_written:
+                self.inc("deid_bytes_written", bytes_written, kind=kind)
+
+    def to_dict(self):
+        """
+        Get a snapshot of the metrics as a (json serializable) dictionary.
+        """
+        with self.lock:
+            metrics = {}
+            for name, metric in self.metrics.items():
+                metrics[name] = {
+                    "type": metric.kind,
+                    "help": metric.help,
+                    "samples": metric.to_dict(),
+                }
+                if metric.kind == "histogram":
+                    metrics[name]["buckets"] = list(metric.buckets[:-1])
+            return {
+                "created": self.created,
+                "timestamp": time.time(),
+                "metrics": metrics,
+            }
+
+    def merge(self, snapshot):
+        """
+        Add the samples of another registry (or its to_dict) to this one.
+        """
+        if isinstance(snapshot, MetricsRegistry):
+            snapshot = snapshot.to_dict()
+        with self.lock:
+            for name, metric in snapshot["metrics"].items():
+                if metric["type"] == "counter":
+                    target = self.counter(name, metric["help"])
+                else:
+                    target = self.histogram(name, metric["help"], metric["buckets"])
+                target.merge(metric["samples"])
+        return self
+
+    def to_openmetrics(self):
+        """
+        Get a snapshot of the metrics as OpenMetrics text.
+        """
+        lines = []
+        with self.lock:
+            for name, metric in self.metrics.items():
+                lines.append("# TYPE %s %s" % (name, metric.kind))
+                if metric.help:
+                    lines.append("# HELP %s %s" % (name, metric.help))
+                lines += metric.to_openmetrics()
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, format=None):
+        """
+        Write a snapshot of the metrics to a file, replacing it at once.
+
+        The format is json or openmetrics (by default, json for a path that
+        ends with .json). The snapshot is written to a temporary file that
+        replaces the path, so a reader never sees part of a snapshot.
+        """
+        format = format or ("json" if path.endswith(".json") else "openmetrics")
+        if format not in ["json", "openmetrics"]:
+            bot.exit(
+                "%s is not a metrics format, choices are json, openmetrics" % format
+            )
+        if format == "json":
+            content = json.dumps(self.to_dict(), indent=4)
+        else:
+            content = self.to_openmetrics()
+        tmp = "%s.tmp-%s" % (path, os.getpid())
+        with open(tmp, "w") as fd:
+            fd.write(content)
+        os.replace(tmp, path)
+        return path
+
+
+class MetricsExporter:
+    """
+    Write a snapshot of a registry to a file every interval seconds.
+
+    Snapshots are written by a (daemon) thread, and once more when the
+    exporter is stopped. Usage:
+
+    metrics = MetricsRegistry()
+    with MetricsExporter(metrics, "/var/lib/node_exporter/deid.prom", interval=15):
+        replace_identifiers(dicom_files, save=True, metrics=metrics)
+
+    Parameters
+    ==========
+    metrics: the MetricsRegistry to export
+    path: the file to write (json if it ends with .json, otherwise OpenMetrics)
+    interval: the seconds between snapshots (default 15)
+    format: json or openmetrics (default is by the extension of the path)
+    """
+
+    def __init__(self, metrics, path, interval=15, format=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.format = format
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.metrics.write(self.path, format=self.format)
+        except OSError as e:
+            bot.warning("Cannot write metrics to %s: %s" % (self.path, e))
+
+    def stop(self):
+        """
+        Stop the exporter, and write a last snapshot.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+
+def timer(metrics, stage):
+    """
+    Time a stage with metrics (a MetricsRegistry), or do nothing if it's None.
+    """
+    if metrics is None:
+        return nullcontext()
+    return metrics.timer(stage)
+
+
+def track_file(metrics, kind, dicom_file=None):
+    """
+    Track a file with metrics (a MetricsRegistry), or do nothing if it's None.
+
+    The context is a dictionary either way, to set the output in.
+    """
+    if metrics is None:
+        return nullcontext({})
+    return metrics.track_file(kind, dicom_file)
@@ -2,9 +2,11 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2016-2025, Vanessa Sochat"
 __license__ = "MIT"
 
+import copy
 import os
 import re
-from copy import deepcopy
+import time
+from functools import lru_cache
 from io import BytesIO
 
 from pydicom.dataelem import DataElement
@@ -12,25 +14,58 @@ from pydicom.dataset import Dataset
 from pydicom.tag import Tag
 
 import deid.dicom.utils as utils
-from deid.config import DeidRecipe
-from deid.config.standards import actions as valid_actions
 from deid.dicom.actions import deid_funcs, jitter_timestamp
+from deid.dicom.compiled import (
+    CompiledAction,
+    compile_actions,
+    compile_recipe,
+    get_action_tags,
+)
 from deid.dicom.fields import (
     DicomField,
     expand_field_expression,
+    fields_cache,
     get_fields_with_lookup,
 )
 from deid.dicom.groups import extract_fields_list, extract_values_list
+from deid.dicom.metrics import timer
 from deid.dicom.tags import add_tag, get_private, get_tag, remove_sequences
 from deid.dicom.utils import save_dicom
 from deid.logger import bot
 from deid.utils import parse_value, read_json
+from deid.utils.matcher import LiteralMatcher
 
 here = os.path.dirname(os.path.abspath(__file__))
 parentheses_hex_tag_format = re.compile(r"\(([0-9A-Fa-f]{4}),([0-9A-Fa-f]{4})\)")
 bare_hex_tag_format = re.compile(r"[0-9A-Fa-f]{8}")
 
 
+@lru_cache(maxsize=8)
+def _read_config(config):
+    """
+    Read (and cache) a parser config, once per process. It isn't modified.
+    """
+    return read_json(config, ordered_dict=True)
+
+
+def load_config(config):
+    """
+    Load a parser config.
+
+    The file is read once per process, and each parser gets its own copy,
+    so changing the config of one parser doesn't change the others.
+    """
+    return copy.deepcopy(_read_config(config))
+
+
+@lru_cache(maxsize=8)
+def load_config_actions(config):
+    """
+    Load (and cache) the compiled put actions of a parser config.
+    """
+    return compile_actions(_read_config(config)["put"]["actions"])
+
+
 class DicomParser:
     """
     Parse a dicom, performing one or more actions on fields.
@@ -44,22 +79,50 @@ class DicomParser:
     """
     _excluded_fields = None
 
+    """
+    set of field uids (for the loaded dicom) excluded from remove, see excluded_uids
+    """
+    _excluded_uids = None
+
     def __init__(
-        self, dicom_file, recipe=None, config=None, force=True, disable_skip=False
+        self,
+        dicom_file,
+        recipe=None,
+        config=None,
+        force=True,
+        disable_skip=False,
+        header_only=False,
+        projection=False,
+        profile=None,
+        metrics=None,
     ):
         """
         Create new instance of DicomParser
 
         :param dicom_file: Path to a dicom file or instance of a pydicom.Dataset
-        :param recipe: a deid recipe, defaults to None
+        :param recipe: a deid recipe (or a CompiledRecipe), defaults to None
         :param config: deid config, defaults to None
         :param force: ignore errors when reading a dicom file, defaults to True
         :param disable_skip: _description_, defaults to False
+        :param header_only: read the file without the pixel data, defaults to False.
+            The pixel data is loaded from the file if the dicom is saved.
+        :param projection: read only the tags the recipe references, defaults to
+            False. This is for inspection (the dicom cannot be saved), and is only
+            done for a recipe without expanders, lists or functions. A keyword
+            nested in a sequence is only found in sequences the recipe references.
+        :param profile: an ActionProfile (see deid.dicom.profile) to record the
+            time, calls and matched fields of each action and deid_func, defaults
+            to None (no profile is recorded).
+        :param metrics: a MetricsRegistry (see deid.dicom.metrics) to record the
+            seconds to read, parse and perform actions, defaults to None.
         """
 
         # Lookup for the dicom
         self.lookup = {}
 
+        # Matchers for values lists in the lookup, built when first used
+        self._values_matchers = {}
+
         # Will be a list of DicomField
         self.fields = {}
 
@@ -70,17 +133,24 @@ class DicomParser:
         config = config or os.path.join(here, "config.json")
         if not os.path.exists(config):
             bot.error("Cannot find config %s, exiting" % (config))
-        self.config = read_json(config, ordered_dict=True)
+        self.config = load_config(config)
+        self.config_actions = load_config_actions(config)
 
-        # Keep a lookup of deid provided functions
+        # Keep a lookup of deid provided functions (timed for a profile)
+        self.profile = profile
         self.deid_funcs = deid_funcs
+        if profile is not None:
+            self.deid_funcs = profile.wrap_funcs(deid_funcs)
 
-        # Deid can be a recipe or filename
-        if not isinstance(recipe, DeidRecipe):
-            recipe = DeidRecipe(recipe)
+        # Deid can be a recipe or filename, we compile the actions once
+        self.plan = compile_recipe(recipe)
 
-        self.load(dicom_file, force=force)
-        self.recipe = recipe
+        self.metrics = metrics
+        with timer(metrics, "read"):
+            self.load(
+                dicom_file, force=force, header_only=header_only, projection=projection
+            )
+        self.recipe = self.plan.recipe
 
     def __str__(self):
         return "[dicom-parser:%s]" % self.dicom_name
@@ -88,12 +158,15 @@ class DicomParser:
     def __repr__(self):
         return self.__str__()
 
-    def load(self, dicom_file, force=True):
+    def load(self, dicom_file, force=True, header_only=False, projection=False):
         """
         Load the dicom file.
 
         Ensure that the dicom file exists, and use full path. Here
         we load the file, and save the dicom, dicom_file, and dicom_name.
+        If header_only is True, the pixel data is skipped (see read_header), and if
+        projection is True, only the tags the recipe references are read
+        (see get_projection).
         """
         # Reset seen, which is generated when we parse
         self.seen = []
@@ -105,7 +178,13 @@ class DicomParser:
             # If we must read the file, the path must exist
             if not os.path.exists(dicom_file):
                 bot.exit("%s does not exist." % dicom_file)
-            self.dicom = utils.dcmread(dicom_file, force=force)
+            specific_tags = self.get_projection() if projection else None
+            self.dicom = utils.load_dicom(
+                dicom_file,
+                force=force,
+                header_only=header_only,
+                specific_tags=specific_tags,
+            )
 
         # Set class variables that might be helpful later
         df = self.dicom.get("filename")
@@ -113,6 +192,20 @@ class DicomParser:
         self.dicom_file = None if not df else os.path.abspath(df)
         self.dicom_name = None if not df else os.path.basename(self.dicom_file)
 
+    def get_projection(self):
+        """
+        Get the tags that the recipe (and config) actions reference.
+
+        Returns None if the actions could reference any field, in which
+        case the whole header is needed.
+        """
+        tags = self.plan.tags
+        config_tags = get_action_tags(self.config_actions)
+        if tags is None or config_tags is None:
+            bot.debug("The recipe references fields that need the whole header.")
+            return
+        return tags | config_tags
+
     def define(self, name, value):
         """
         Add a function or variable to the lookup for later usage.
@@ -120,6 +213,7 @@ class DicomParser:
         This can be used for functions, lists, or variables.
         """
         self.lookup[name] = value
+        self._values_matchers.pop(name, None)
 
     def reset_preamble(self):
         """reset the preamble"""
@@ -181,11 +275,10 @@ class DicomParser:
         Return a list of child field UIDs for a given field.
 
         This method identifies all field UIDs in self.fields that are nested under the provided field,
-        based on the UID prefix convention (parent UID + '__').
+        based on the UID prefix convention (parent UID + '__'), using the tree index of self.fields.
         It is used to find and remove all child fields when blanking or deleting a parent field (e.g., a sequence).
         """
-        field_uid_prefix = field.uid + "__"
-        return [uid for uid in self.fields if uid.startswith(field_uid_prefix)]
+        return self.fields.get_descendants(field.uid)
 
     def delete_field(self, field):
         """
@@ -199,11 +292,9 @@ class DicomParser:
         parent, desired = self.get_nested_field(field, return_parent=True)
         if parent and desired in parent:
             del parent[desired]
-            # Remove the field itself from the lookup
-            self.fields.remove(field.uid)
-            # Also remove any child fields that were nested under this field
-            for child_uid in self.get_child_fields(field):
-                self.fields.remove(child_uid)
+            fields_cache.invalidate(self.dicom)
+            # Remove the field itself, and any child fields nested under it
+            self.fields.remove_tree(field.uid)
 
     def blank_field(self, field):
         """
@@ -217,9 +308,9 @@ class DicomParser:
         parent, desired = self.get_nested_field(field, return_parent=True)
         if parent and desired in parent:
             parent[desired].value = None
+            fields_cache.invalidate(self.dicom)
             # Also remove any child fields that were nested under this field
-            for child_uid in self.get_child_fields(field):
-                self.fields.remove(child_uid)
+            self.fields.remove_descendants(field.uid)
 
     def replace_field(self, field, value):
         """
@@ -240,9 +331,12 @@ class DicomParser:
         easy to search over, and also build up actions for the lookup
         on the first parsing.
         """
+        start = time.perf_counter()
+
         # Remove sequences first, maintained in DataStore
         if strip_sequences is True:
             remove_sequences(self.dicom)
+            fields_cache.invalidate(self.dicom)
 
         # Remove private tags at the onset, if requested
         if remove_private:
@@ -250,40 +344,45 @@ class DicomParser:
 
         # In the parsing, we generate a list of DicomField objects.
         fields = self.get_fields(expand_sequences=True)
+        if self.profile is not None:
+            self.profile.files += 1
+        if self.metrics is not None:
+            parsed = time.perf_counter()
+            self.metrics.observe("deid_stage_seconds", parsed - start, stage="parse")
 
         # if we loaded a deid recipe
         if self.recipe.deid is not None:
             # Prepare additional lists of values and lookup fields (index by nested uid)
-            if self.recipe.has_values_lists():
-                for group, actions in self.recipe.get_values_lists().items():
-                    self.lookup[group] = extract_values_list(
-                        dicom=self.dicom,
-                        actions=actions,
-                        fields=fields,
-                    )
+            self._values_matchers = {}
+            for group, actions in self.plan.values_lists.items():
+                start = time.perf_counter()
+                self.lookup[group] = extract_values_list(
+                    dicom=self.dicom,
+                    actions=actions,
+                    fields=fields,
+                )
+                self._profile_list("%values", group, start)
 
-            if self.recipe.has_fields_lists():
-                for group, actions in self.recipe.get_fields_lists().items():
-                    self.lookup[group] = extract_fields_list(
-                        dicom=self.dicom,
-                        actions=actions,
-                        fields=fields,
-                    )
+            for group, actions in self.plan.fields_lists.items():
+                start = time.perf_counter()
+                self.lookup[group] = extract_fields_list(
+                    dicom=self.dicom,
+                    actions=actions,
+                    fields=fields,
+                )
+                self._profile_list("%fields", group, start)
 
             # actions on the header
-            for action in self.recipe.get_actions():
-                self.perform_action(
-                    field=action.get("field"),
-                    value=action.get("value"),
-                    action=action.get("action"),
-                )
+            for action in self.plan.actions:
+                self._perform_action(action)
 
         # Next perform actions in default config, only if not done
-        for action in self.config["put"]["actions"]:
-            self.perform_action(
-                field=action.get("field"),
-                value=action.get("value"),
-                action=action.get("action"),
+        for action in self.config_actions:
+            self._perform_action(action)
+
+        if self.metrics is not None:
+            self.metrics.observe(
+                "deid_stage_seconds", time.perf_counter() - parsed, stage="actions"
             )
 
         # At this point the self.dicom should be updated fully
@@ -319,22 +418,14 @@ class DicomParser:
         Those fields are not impacted by REPLACE/JITTER actions
         """
         keeps = []
-        if self.recipe.deid is not None:
+        if self.recipe.deid is not None and self.plan.keep:
             # Build field contenders ONCE and reuse for all KEEP actions
-            contenders = None
-            for action in self.recipe.get_actions(action="KEEP"):
-                if action and action.get("field"):
-                    # Only build contenders on first iteration
-                    if contenders is None:
-                        contenders = get_fields_with_lookup(self.dicom)
-
-                    fields = expand_field_expression(
-                        field=action.get("field"),
-                        dicom=self.dicom,
-                        contenders=contenders,  # Reuse the same contenders
-                    )
-                    # keys are in the format "(1234,5678)"
-                    keeps.extend(fields.keys())
+            contenders = get_fields_with_lookup(self.dicom)
+            for expression in self.plan.keep:
+                fields = expression.expand(self.dicom, contenders=contenders)
+
+                # keys are in the format "(1234,5678)"
+                keeps.extend(fields.keys())
         return keeps
 
     @property
@@ -348,52 +439,75 @@ class DicomParser:
             self._excluded_fields = []
             if self.recipe.deid is not None:
                 self._excluded_fields = [
-                    action.get("field")
-                    for action in (
-                        self.recipe.get_actions(action="JITTER")
-                        + self.recipe.get_actions(action="REPLACE")
-                    )
-                    if action and action.get("field")
+                    expression.field for expression in self.plan.excluded_from_deletion
                 ]
         return self._excluded_fields
 
+    @property
+    def excluded_uids(self):
+        """
+        Return the set of field uids that REMOVE must not delete.
+
+        These are the fields matched by the REPLACE and JITTER actions of
+        the recipe. Expanding the field expressions normalizes how the
+        field was specified in the recipe (e.g., "(0008,0020)" or
+        "StudyDate") to field uids. The set is built once per dataset, and
+        again only if a field is added to the dicom.
+        """
+        if self._excluded_uids is None:
+            self._excluded_uids = set()
+            for expression in self.plan.excluded_from_deletion:
+                self._excluded_uids.update(
+                    expression.expand(self.dicom, contenders=self.fields)
+                )
+        return self._excluded_uids
+
     def get_fields(self, expand_sequences=True):
         """expand all dicom fields into a list, where each entry is
         a DicomField. If we find a sequence, we unwrap it and
         represent the location with the name (e.g., Sequence__Child)
         """
-        if not self.fields or not self.fields_by_name:
+        if not self.fields:
             self.fields = get_fields_with_lookup(
                 dicom=self.dicom,
                 expand_sequences=expand_sequences,
                 seen=self.seen,
                 skip=self.skip + self.keep,
             )
+            self._excluded_uids = None
         return self.fields
 
     def find_by_values(self, values):
         """
         Find fields by values.
 
-        Given a list of values, find fields in the dicom that contain any
-        of those values, as determined by a regular expression search.
+        Given a list of values (or a LiteralMatcher built from them), find
+        fields in the dicom that contain any of those values. Values are
+        matched as literal strings, ignoring case.
         """
-        # Values must be strings
-        values = [str(x) for x in values]
+        matcher = values
+        if not isinstance(matcher, LiteralMatcher):
+            matcher = LiteralMatcher(values)
 
         fields = {}
 
-        if values:
-            # Create single regular expression to search by
-            regexp = "(%s)" % "|".join(values)
+        if matcher:
             for uid, field in self.fields.items():
-                if field.value_contains(regexp):
+                if field.value_matches(matcher):
                     fields[uid] = field
         else:
             bot.warning("Empty values list encountered.  No fields will be identified.")
 
         return fields
 
+    def get_values_matcher(self, group):
+        """
+        Get the matcher for a values list, built once for the dicom.
+        """
+        if group not in self._values_matchers:
+            self._values_matchers[group] = LiteralMatcher(self.lookup.get(group, []))
+        return self._values_matchers[group]
+
     def find_by_name(self, name):
         """
         Find fields by name.
@@ -431,26 +545,40 @@ class DicomParser:
            "action" (eg, REPLACE) what to do with the field
            "value": if needed, the field from the response to replace with
         """
-        # Validate the action
-        if action not in valid_actions:
-            bot.warning("%s in not a valid choice. Defaulting to blanked." % action)
-            action = "BLANK"
+        self._perform_action(CompiledAction(action=action, field=field, value=value))
+
+    def _profile_list(self, section, group, start):
+        """
+        Record the extraction of a %values or %fields list in the profile.
+        """
+        if self.profile is not None:
+            seconds = time.perf_counter() - start
+            self.profile.add_action(
+                "%s %s" % (section, group),
+                matched=len(self.lookup[group]),
+                seconds=seconds,
+                expand_seconds=seconds,
+            )
+
+    def _perform_action(self, action):
+        """
+        Perform a compiled action (see deid.dicom.compiled) on the dicom.
+        """
+        if self.profile is not None:
+            start = time.perf_counter()
 
         # A values list returns fields with the value (can be private tags if not removed)
-        if re.search("^values", field):
-            values = self.lookup.get(re.sub("^values:", "", field), [])
-            fields = self.find_by_values(values=values)
+        if action.kind == "values":
+            fields = self.find_by_values(values=self.get_values_matcher(action.group))
 
         # A fields list is used verbatim
         # In expand_field_expression below, the stripped_tag is being passed in to field.  At this point,
         # expanders for %fields lists have already been processed and each of the contenders is an
         # identified, unique field.  It is important to use stripped_tag at this point instead of
         # element.keyword as private tags will not have a keyword and can only be identified by tag number.
-        elif re.search("^fields", field):
+        elif action.kind == "fields":
             listing = {}
-            for uid, contender in self.lookup.get(
-                re.sub("^fields:", "", field), {}
-            ).items():
+            for uid, contender in self.lookup.get(action.group, {}).items():
                 listing.update(
                     expand_field_expression(
                         field=contender.stripped_tag,
@@ -462,22 +590,30 @@ class DicomParser:
 
         else:
             # If there is an expander applied to field, we iterate over
-            fields = expand_field_expression(
-                field=field,
-                dicom=self.dicom,
-                contenders=self.fields,
-            )
+            fields = action.expression.expand(self.dicom, contenders=self.fields)
+
+        if self.profile is not None:
+            expanded = time.perf_counter()
 
         # If it's an addition, we might not have fields
-        if action == "ADD":
-            self.add_field(field, value)
+        if action.action == "ADD":
+            self.add_field(action.field, action.value)
 
         # Otherwise, these are operations on existing fields
         else:
-            # without deepcopy - "dictionary changed size during iterations"
-            temp_fields = deepcopy(fields)
-            for uid, field in temp_fields.items():
-                self._run_action(field=field, action=action, value=value)
+            # Actions find the element to change by uid, and can remove fields,
+            # so we iterate over a snapshot of the matched fields (not copies)
+            for uid, field in list(fields.items()):
+                self._run_action(field=field, action=action.action, value=action.value)
+
+        if self.profile is not None:
+            self.profile.add_action(
+                action.line,
+                source=action.source,
+                matched=1 if action.action == "ADD" else len(fields),
+                seconds=time.perf_counter() - start,
+                expand_seconds=expanded - start,
+            )
 
     def add_field(self, field, value):
         """
@@ -582,7 +718,11 @@ class DicomParser:
                     element = DataElement(tag["tag"], tag["VR"], value)
                     is_filemeta = str(element.tag).startswith("(0002")
                     update_dicom(element, is_filemeta)
+                    fields_cache.invalidate(self.dicom)
                     self.fields.add(uid, DicomField(element, name, uid, is_filemeta))
+
+                    # A new field might be one that REMOVE should not delete
+                    self._excluded_uids = None
             else:
                 bot.warning("Cannot find tag for field %s, skipping." % name)
 
@@ -646,31 +786,12 @@ class DicomParser:
             # This ensures that fields marked for REPLACE or JITTER actions are not
             # removed before they can be processed, maintaining the correct action hierarchy:
             # KEEP > ADD > REPLACE > JITTER > REMOVE > BLANK
-            is_excluded = False
-            if do_removal:
-                for excluded_field in self.excluded_from_deletion:
-                    # Use expand_field_expression to properly match field identifiers
-                    # This resolves the format mismatch issue where excluded_from_deletion
-                    # contains recipe format identifiers (e.g., "(0008,0020)", "StudyDate")
-                    # but field.uid is in internal format. expand_field_expression normalizes
-                    # all field identifier formats for proper comparison.
-                    excluded_fields = expand_field_expression(
-                        field=excluded_field,
-                        dicom=self.dicom,
-                        contenders=self.fields,
-                    )
-                    # Check if the current field's UID matches any of the expanded
-                    # excluded fields. This ensures format-agnostic matching regardless
-                    # of how the field was specified in the deid recipe.
-                    if field.uid in excluded_fields:
-                        is_excluded = True
-                        break
-
-                # Only proceed with removal if both conditions are met:
-                # 1. do_removal is True (field passes any filter conditions)
-                # 2. is_excluded is False (field is not marked for later REPLACE/JITTER)
-                if not is_excluded:
-                    self.delete_field(field)
+            #
+            # Only proceed with removal if both conditions are met:
+            # 1. do_removal is True (field passes any filter conditions)
+            # 2. the field is not marked for later REPLACE/JITTER
+            if do_removal and field.uid not in self.excluded_uids:
+                self.delete_field(field)
 
     def remove_private(self):
         """
@@ -686,3 +807,4 @@ class DicomParser:
             )
             for ptag in get_private(self.dicom):
                 del self.dicom[ptag.tag]
+        fields_cache.invalidate(self.dicom)
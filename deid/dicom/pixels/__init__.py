@@ -1,2 +1,4 @@
 from .clean import DicomCleaner, clean_pixel_data
 from .detect import has_burned_pixels
+from .inplace import clean_pixel_data_inplace
+from .stream import clean_pixel_data_chunked
@@ -8,23 +8,42 @@ import os
 import random
 import re
 import sys
+from functools import cache
 from typing import Optional
 
-import matplotlib
-import numpy
 from numpy.typing import NDArray
-from pydicom.pixel_data_handlers.util import get_expected_length
+from pydicom.pixels.utils import get_expected_length
 
 from deid.config import DeidRecipe
 from deid.dicom import utils
+from deid.dicom.cache import get_run_cache
+from deid.dicom.metrics import timer, track_file
+from deid.dicom.pixels.mask import (
+    get_coordinates,
+    get_frame_shape,
+    is_multiframe,
+    mask_pixels,
+)
 from deid.logger import bot
 from deid.utils import get_temporary_name
 
-matplotlib.use("pdf")
+bot.level = 3
 
-from matplotlib import pyplot as plt  # noqa
 
-bot.level = 3
+@cache
+def get_pyplot():
+    """
+    Get matplotlib's pyplot, importing it (with the pdf backend) when first used.
+
+    Importing matplotlib is slow, and it's only needed to plot, so we don't
+    import it with the module.
+    """
+    import matplotlib
+
+    matplotlib.use("pdf")
+    from matplotlib import pyplot
+
+    return pyplot
 
 
 class DicomCleaner:
@@ -38,6 +57,11 @@ class DicomCleaner:
     summary = cleaner.detect(dicom_file)
 
     cleaner.clean()
+
+    If a cache (a RunCache or path to one) is given, the result of detect
+    for a file that was checked before (with the same filters) is reused.
+    If metrics (a MetricsRegistry) are given, files detected and cleaned,
+    bytes, errors and the seconds of each stage are counted in them.
     """
 
     def __init__(
@@ -48,6 +72,8 @@ class DicomCleaner:
         deid=None,
         font=None,
         force=True,
+        cache=None,
+        metrics=None,
     ):
         if output_folder is None:
             output_folder = get_temporary_name(prefix="clean")
@@ -60,6 +86,8 @@ class DicomCleaner:
         self.recipe = DeidRecipe(deid)
         self.results = None
         self.force = force
+        self.cache = get_run_cache(cache)
+        self.metrics = metrics
         self.dicom_file: Optional[str] = None
         self.cleaned: Optional[NDArray] = None
 
@@ -79,7 +107,11 @@ class DicomCleaner:
         from deid.dicom.pixels.detect import has_burned_pixels
 
         self.results = has_burned_pixels(
-            dicom_file, deid=self.recipe.deid, force=self.force
+            dicom_file,
+            deid=self.recipe.deid,
+            force=self.force,
+            cache=self.cache,
+            metrics=self.metrics,
         )
         self.dicom_file = dicom_file
         return self.results
@@ -94,13 +126,103 @@ class DicomCleaner:
             return
 
         bot.info("Scrubbing %s." % self.dicom_file)
-        self.cleaned = clean_pixel_data(
+        with track_file(self.metrics, "clean", self.dicom_file):
+            with timer(self.metrics, "pixel_clean"):
+                self.cleaned = clean_pixel_data(
+                    dicom_file=self.dicom_file,
+                    results=self.results,
+                    fix_interpretation=fix_interpretation,
+                    pixel_data_attribute=pixel_data_attribute,
+                )
+        return self.cleaned
+
+    def clean_chunked(
+        self,
+        output_folder=None,
+        frames_per_chunk: int = 16,
+        preserve_compression: bool = False,
+        compression=None,
+    ) -> Optional[str]:
+        """
+        Clean and save a dicom a few frames at a time.
+
+        This is an alternative to clean() --> save_dicom() for large multi-frame
+        files, where the pixel data should not be loaded all at once. The cleaned
+        frames are written to the output file as they are done, and the path to
+        the file is returned (self.cleaned is not set). See
+        clean_pixel_data_chunked for details.
+        """
+        if not self.results:
+            bot.warning(
+                "Use %s.detect() with a dicom file to find coordinates first." % self
+            )
+            return
+
+        with track_file(self.metrics, "clean", self.dicom_file) as tracked:
+            with timer(self.metrics, "pixel_clean"):
+                tracked["output"] = self._clean_chunked(
+                    output_folder, frames_per_chunk, preserve_compression, compression
+                )
+        return tracked["output"]
+
+    def _clean_chunked(
+        self, output_folder, frames_per_chunk, preserve_compression, compression
+    ):
+        """
+        Clean and save a dicom a few frames at a time (see clean_chunked).
+        """
+        from deid.dicom.pixels.stream import clean_pixel_data_chunked
+
+        if preserve_compression and compression is None:
+            transfer_syntax = utils.read_header(self.dicom_file).file_meta
+            transfer_syntax = transfer_syntax.TransferSyntaxUID
+            if transfer_syntax.is_compressed:
+                compression = transfer_syntax
+
+        bot.info(
+            "Scrubbing %s in chunks of %s frames." % (self.dicom_file, frames_per_chunk)
+        )
+        return clean_pixel_data_chunked(
             dicom_file=self.dicom_file,
             results=self.results,
-            fix_interpretation=fix_interpretation,
-            pixel_data_attribute=pixel_data_attribute,
+            output_file=self._get_clean_name(output_folder),
+            frames_per_chunk=frames_per_chunk,
+            compression=compression,
         )
-        return self.cleaned
+
+    def clean_inplace(self, output_folder=None) -> Optional[str]:
+        """
+        Clean and save a dicom without decoding the pixel data.
+
+        For uncompressed pixel data, the dicom file is copied to the output
+        folder, and only the pixels to clean are set to zero in the (memory
+        mapped) copy. This is much faster than clean() --> save_dicom() when
+        the regions to clean are small. If the pixel data cannot be cleaned
+        in place (e.g., it's compressed), we fall back to clean_chunked.
+        The path to the file is returned (self.cleaned is not set).
+        """
+        from deid.dicom.pixels.inplace import clean_pixel_data_inplace
+
+        if not self.results:
+            bot.warning(
+                "Use %s.detect() with a dicom file to find coordinates first." % self
+            )
+            return
+
+        bot.info("Scrubbing %s in place." % self.dicom_file)
+        with track_file(self.metrics, "clean", self.dicom_file) as tracked:
+            with timer(self.metrics, "pixel_clean"):
+                output_file = clean_pixel_data_inplace(
+                    dicom_file=self.dicom_file,
+                    results=self.results,
+                    output_file=self._get_clean_name(output_folder),
+                )
+                if output_file is None:
+                    output_file = self._clean_chunked(
+                        output_folder, 16, preserve_compression=True, compression=None
+                    )
+            tracked["output"] = output_file
+        return output_file
 
     def get_figure(self, show=False, image_type="cleaned", title=None):
         """
@@ -111,6 +233,7 @@ class DicomCleaner:
         randomly choose a slice.
         """
         if hasattr(self, image_type):
+            plt = get_pyplot()
             _, ax = plt.subplots(figsize=(10, 6))
 
             # Retrieve full image
@@ -183,6 +306,8 @@ class DicomCleaner:
         if hasattr(self, image_type):
             from matplotlib import animation
 
+            plt = get_pyplot()
+
             animation.rcParams["animation.writer"] = "ffmpeg"
 
             image = getattr(self, image_type)
@@ -278,7 +403,12 @@ class DicomCleaner:
                         % compression
                     )
 
-            dicom.save_as(dicom_name)
+            with timer(self.metrics, "write"):
+                dicom.save_as(dicom_name)
+            if self.metrics is not None:
+                self.metrics.inc(
+                    "deid_bytes_written", os.path.getsize(dicom_name), kind="clean"
+                )
             return dicom_name
         else:
             bot.warning("use detect() --> clean() before saving is possible.")
@@ -306,8 +436,8 @@ def clean_pixel_data(
     """
     cleaned = None
 
-    # Load in dicom file, and image data
-    dicom = utils.load_dicom(dicom_file)
+    # Load in dicom file, and image data (deferred if only the header was read)
+    dicom = utils.load_pixels(utils.load_dicom(dicom_file))
     pixel_data = getattr(dicom, pixel_data_attribute)
 
     # Get expected and actual length of the pixel data (bytes, expected does not include trailing null byte)
@@ -333,107 +463,22 @@ def clean_pixel_data(
     else:
         original = dicom.pixel_array
 
-    # Compile coordinates from result, generate list of tuples with coordinate and value
-    # keepcoordinates == 1 (included in mask) and coordinates == 0 (remove).
-    coordinates = []
-
-    for item in results["results"]:
-        # We iterate through coordinates in order specified in file
-        for coordinate_set in item.get("coordinates", []):
-            # Each is a list with [value, coordinate]
-            mask_value, new_coordinates = coordinate_set
-
-            if not isinstance(new_coordinates, list):
-                new_coordinates = [new_coordinates]
-
-            for new_coordinate in new_coordinates:
-                # Case 1: an "all" indicates applying to entire image
-                if new_coordinate.lower() == "all":
-                    # 2D - Greyscale Image - Shape = (X, Y) OR 3D - RGB Image - Shape = (X, Y, Channel)
-                    if len(original.shape) == 2 or (
-                        len(original.shape) == 3 and dicom.SamplesPerPixel == 3
-                    ):
-                        # minr, minc, maxr, maxc = [0, 0, Y, X]
-                        new_coordinate = [
-                            0,
-                            0,
-                            original.shape[1],
-                            original.shape[0],
-                        ]
-
-                    # 4D - RGB Cine Clip - Shape = (frames, X, Y, channel) OR 3D - Greyscale Cine Clip - Shape = (frames, X, Y)
-                    if len(original.shape) == 4 or (
-                        len(original.shape) == 3 and dicom.SamplesPerPixel == 1
-                    ):
-                        new_coordinate = [
-                            0,
-                            0,
-                            original.shape[2],
-                            original.shape[1],
-                        ]
-                else:
-                    new_coordinate = [int(x) for x in new_coordinate.split(",")]
-                coordinates.append(
-                    (mask_value, new_coordinate)
-                )  # [(1, [1,2,3,4]),...(0, [1,2,3,4])]
-
-    # Instead of writing directly to data, create a mask of 1s (start keeping all)
-    # For 4D RGB Cine - (frames, X, Y, channel) or 3D Greyscale Cine - (frames, X, Y)
-    if len(original.shape) == 4 or (
-        len(original.shape) == 3 and dicom.SamplesPerPixel == 1
-    ):
-        mask = numpy.ones(original.shape[1:3], dtype=numpy.uint8)
-    # For 2D Greyscale image (X, Y) or 3D RGB Image (X, Y channel)
-    else:
-        mask = numpy.ones(original.shape[0:2], dtype=numpy.uint8)
-
-    # Here we apply the coordinates to the mask, 1==keep, 0==clean
-    for coordinate_value, coordinate in coordinates:
-        minr, minc, maxr, maxc = coordinate
-
-        # Update the mask: values set to 0 to be black
-        mask[minc:maxc, minr:maxr] = coordinate_value
-
-    # Now apply finished mask to the data
-    # RGB cine clip
-    if len(original.shape) == 4:
-        # np.tile does the copying and stacking of masks into the channel dim to produce 3D masks
-        # transposition to convert tile output (channel, X, Y)  into (X, Y, channel)
-        # see: https://github.com/nquach/anonymize/blob/master/anonymize.py#L154
-        channel3mask = numpy.transpose(numpy.tile(mask, (3, 1, 1)), (1, 2, 0))
-
-        # use numpy.tile to copy and stack the 3D masks into 4D array to apply to 4D pixel data
-        # tile converts (X, Y, channels) -> (frames, X, Y, channels), presumed ordering for 4D pixel data
-        final_mask = numpy.tile(channel3mask, (original.shape[0], 1, 1, 1))
-
-        # apply final 4D mask to 4D pixel data
-        cleaned = final_mask * original
-
-    # RGB image or Greyscale cine clip
-    elif len(original.shape) == 3:
-        # This condition is ambiguous.  If the image shape is 3, we may have a single frame RGB image: size (X, Y, channel)
-        # or a multiframe greyscale image: size (frames, X, Y).  Interrogate the SamplesPerPixel field.
-        if dicom.SamplesPerPixel == 3:
-            # RGB Image
-            # Convert (X, Y) -> (X, Y, channel)
-            final_mask = numpy.transpose(
-                numpy.tile(mask, (original.shape[2], 1, 1)), (1, 2, 0)
-            )
-        else:
-            # Greyscale cine clip
-            # Convert (X, Y) -> (frames, X, Y)
-            final_mask = numpy.tile(mask, (original.shape[0], 1, 1))
-
-        # apply final 3D mask to 3D pixel data
-        cleaned = final_mask * original
-
-    # greyscale image: no need to stack into the channel dim since it doesn't exist
-    elif len(original.shape) == 2:
-        cleaned = mask * original
-
-    else:
+    if original.ndim not in [2, 3, 4]:
         bot.warning(
             "Pixel array dimension %s is not recognized." % (str(original.shape))
         )
+        return cleaned
+
+    # The pixel array of a dataset provided by the caller is not changed
+    if dicom is dicom_file or not original.flags.writeable:
+        original = original.copy()
+
+    # For 4D RGB Cine - (frames, X, Y, channel) or 3D Greyscale Cine - (frames, X, Y)
+    # For 2D Greyscale image (X, Y) or 3D RGB Image (X, Y channel)
+    multiframe = is_multiframe(original, dicom.SamplesPerPixel)
+    coordinates = get_coordinates(results, get_frame_shape(original, multiframe))
+
+    # Pixels are set to 0 directly, without a full size mask
+    cleaned = mask_pixels(original, coordinates, multiframe=multiframe)
 
     return cleaned
@@ -6,16 +6,23 @@ __license__ = "MIT"
 from typing import List, Optional, Union
 
 from pydicom import FileDataset
-from pydicom.sequence import Sequence
 
 import deid.dicom.utils as utils
 from deid.config import DeidRecipe
-from deid.dicom.filter import apply_filter
+from deid.dicom.cache import get_fingerprint, get_run_cache
+from deid.dicom.compiled import compile_filters, evaluate_criteria
+from deid.dicom.filter import extract_coordinates  # noqa
+from deid.dicom.metrics import timer, track_file
 from deid.logger import bot
 
 
 def has_burned_pixels(
-    dicom_files, force: bool = True, deid: Optional[DeidRecipe] = None
+    dicom_files,
+    force: bool = True,
+    deid: Optional[DeidRecipe] = None,
+    projection: bool = False,
+    cache=None,
+    metrics=None,
 ):
     """
     Determine if a dicom file has burned pixels.
@@ -26,7 +33,12 @@ def has_burned_pixels(
     original scripts used by CTP) to determine if an image is likely to have
     PHI, based on fields in the header alone. This script does NOT perform
     pixel cleaning, but returns a dictionary of results (for multi) or one
-    detailed result (for single)
+    detailed result (for single). If projection is True, only the tags
+    that the filters reference are read from each file. If a cache (a
+    RunCache or path to one) is given, the result for a file that was
+    checked before with the same filters (and hasn't changed) is reused.
+    If metrics (a MetricsRegistry) are given, the files checked, flagged
+    and clean, and the seconds to read and check each, are counted.
     """
     # if the user has provided a custom deid, load it
     if not isinstance(deid, DeidRecipe):
@@ -34,12 +46,47 @@ def has_burned_pixels(
             deid = "dicom"
         deid = DeidRecipe(deid)
 
+    cache = get_run_cache(cache)
     if isinstance(dicom_files, list):
-        return _has_burned_pixels_multi(dicom_files, force, deid)
-    return _has_burned_pixels_single(dicom_files, force, deid)
+        return _has_burned_pixels_multi(
+            dicom_files, force, deid, projection, cache, metrics
+        )
+    if cache is not None:
+        results = _has_burned_pixels_cached(
+            [dicom_files], force, deid, projection, cache, metrics
+        )
+        return results[0]
+    return _has_burned_pixels_single(dicom_files, force, deid, projection, metrics)
+
 
+def _has_burned_pixels_cached(
+    dicom_files, force, deid, projection, cache, metrics=None
+):
+    """
+    Determine if dicom files have burned pixels, reusing cached results.
 
-def _has_burned_pixels_multi(dicom_files: List[Union[str, FileDataset]], force, deid):
+    A result is cached for the filters of the recipe (a projection
+    gives the same result, so it isn't part of the fingerprint).
+    """
+    fingerprint = get_fingerprint(deid.get_filters(), force)
+    return cache.run(
+        "detect",
+        [(dicom_file, fingerprint) for dicom_file in dicom_files],
+        lambda files: [
+            _has_burned_pixels_single(x, force, deid, projection, metrics)
+            for x in files
+        ],
+    )
+
+
+def _has_burned_pixels_multi(
+    dicom_files: List[Union[str, FileDataset]],
+    force,
+    deid,
+    projection=False,
+    cache=None,
+    metrics=None,
+):
     """
     Determine if one or more dicom files have burned pixels.
 
@@ -52,11 +99,23 @@ def _has_burned_pixels_multi(dicom_files: List[Union[str, FileDataset]], force,
     # Store decisions in lookup based on filter groups
     decision = {"clean": [], "flagged": {}}
 
-    for dicom_file in dicom_files:
-        result = _has_burned_pixels_single(
-            dicom_file=dicom_file, force=force, deid=deid
+    if cache is not None:
+        results = _has_burned_pixels_cached(
+            dicom_files, force, deid, projection, cache, metrics
+        )
+    else:
+        results = (
+            _has_burned_pixels_single(
+                dicom_file=dicom_file,
+                force=force,
+                deid=deid,
+                projection=projection,
+                metrics=metrics,
+            )
+            for dicom_file in dicom_files
         )
 
+    for dicom_file, result in zip(dicom_files, results):
         if result["flagged"] is False:
             # In this case, group is None
             decision["clean"].append(dicom_file)
@@ -66,7 +125,9 @@ def _has_burned_pixels_multi(dicom_files: List[Union[str, FileDataset]], force,
     return decision
 
 
-def _has_burned_pixels_single(dicom_file, force: bool, deid):
+def _has_burned_pixels_single(
+    dicom_file, force: bool, deid, projection=False, metrics=None
+):
     """
     Determine if a single dicom has burned pixels.
 
@@ -85,6 +146,8 @@ def _has_burned_pixels_single(dicom_file, force: bool, deid):
     dicom_file: the fullpath to the file to evaluate
     force: force reading of a potentially erroneous file
     deid: the full path to a deid specification. if not defined, only default used
+    projection: if True, read only the tags the filters reference
+    metrics: a MetricsRegistry to count the file (and its result) in
 
     deid['filter']['dangerouscookie'] <-- filter list "dangerouscookie"
 
@@ -112,100 +175,41 @@ def _has_burned_pixels_single(dicom_file, force: bool, deid):
             ]
         }
     """
-    dicom = utils.load_dicom(dicom_file, force=force)
-
-    # Return list with lookup as dicom_file
-    results = []
-    global_flagged = False
-
-    # Load criteria (actions) for flagging
-    filters = deid.get_filters()
-    if not filters:
-        bot.warning("Deid provided does not have %filter.")
-        return {"flagged": global_flagged, "results": results}
-
-    for name, items in filters.items():
-        for item in items:
-            flags = []
-
-            descriptions = []  # description for each group across items
-
-            # If there aren't any filters but we have coordinates, assume True
-            if not item.get("filters") and item.get("coordinates"):
-                this_item_flags = [True]
-                group_descriptions = [item.get("name", "")]
-
-            else:
-                this_item_flags = []  # evaluation for a single line
-                group_descriptions = []
-                for group in item["filters"]:
-                    this_group_flags = []
-                    # You cannot pop from the list
-                    for a in range(len(group["action"])):
-                        action = group["action"][a]
-                        field = group["field"][a]
-                        value = ""
-
-                        if len(group["value"]) > a:
-                            value = group["value"][a]
-
-                        flag = apply_filter(
-                            dicom=dicom,
-                            field=field,
-                            filter_name=action,
-                            value=value or None,
-                        )
-                        this_group_flags.append(flag)
-                        description = "%s %s %s" % (field, action, value)
-
-                        if len(group["InnerOperators"]) > a:
-                            inner_operator = group["InnerOperators"][a]
-                            this_group_flags.append(inner_operator)
-                            description = "%s %s" % (description, inner_operator)
-
-                        group_descriptions.append(description)
-
-                    overall_group_flag = evaluate_group(this_group_flags)
-                    this_item_flags.append(overall_group_flag)
-
-            # At the end of a group, evaluate the inner group
-            flag = evaluate_group(this_item_flags)
-
-            # "Operator" is relevant for the outcome of the list of actions
-            operator = ""
-            if "operator" in group:
-                if group["operator"] is not None:
-                    operator = group["operator"]
-                    flags.append(operator)
-
-            flags.append(flag)
-            reason = ("%s %s" % (operator, " ".join(group_descriptions))).replace(
-                "\n", " "
+    # Load criteria (compiled once per recipe) for flagging
+    filters = compile_filters(deid)
+
+    with track_file(metrics, "detect", dicom_file):
+        # The criteria only look at the header, so the pixel data isn't read
+        # (and with a projection, only the fields the criteria look at)
+        with timer(metrics, "read"):
+            dicom = utils.load_dicom(
+                dicom_file,
+                force=force,
+                header_only=True,
+                specific_tags=filters.tags if projection else None,
             )
-            descriptions.append(reason)
-
-            # When we parse through a group, we evaluate based on all flags
-            flagged = evaluate_group(flags=flags)
-
-            if flagged is True:
-                global_flagged = True
-                reason = " ".join(descriptions)
-
-                # Each coordinate is a list with [value, [coordinate]]
-                # and if from: in the coordinate value, it indicates we get
-                # the coordinate from some field (done here)
-                for coordset in item["coordinates"]:
-                    if "from:" in coordset[1]:
-                        coordset[1] = extract_coordinates(dicom, coordset[1])
-
-                result = {
-                    "reason": reason,
-                    "group": name,
-                    "coordinates": item["coordinates"],
-                }
-
-                results.append(result)
 
+        # Return list with lookup as dicom_file
+        results = []
+        global_flagged = False
+        if not filters:
+            bot.warning("Deid provided does not have %filter.")
+
+        with timer(metrics, "detect"):
+            for name, label in filters.labels:
+                if label.matches(dicom):
+                    global_flagged = True
+                    results.append(
+                        {
+                            "reason": label.reason,
+                            "group": name,
+                            "coordinates": label.get_coordinates(dicom),
+                        }
+                    )
+
+    # A file is counted as clean when there are no filters, too
+    if metrics is not None:
+        metrics.inc("deid_detected", result="flagged" if global_flagged else "clean")
     results = {"flagged": global_flagged, "results": results}
     return results
 
@@ -217,81 +221,15 @@ def evaluate_group(flags):
      [True, and, False, or, True]
 
     And read through the logic to determine if the image result
-    is to be flagged. This is how we combine a set of criteria in
-    a group to come to a final decision.
-    """
-    flagged = False
-    first_entry = True
-
-    # If it starts with and and/or, remove it
-    if flags and flags[0] in ["and", "or"]:
-        flags.pop(0)
-
-    while len(flags) > 0:
-        flag = flags.pop(0)
-        if flag == "and":
-            flag = flags.pop(0)
-            flagged = flag and flagged
-        elif flag == "or":
-            flag = flags.pop(0)
-            flagged = flag or flagged
-        else:
-            # If it's the first entry
-            if first_entry is True:
-                flagged = flag
-            else:
-                flagged = flagged and flag
-        first_entry = False
-
-    return flagged
-
-
-def extract_coordinates(dicom, field):
+    is to be flagged. The flags are read (left to right) as one group
+    of criteria, with evaluate_criteria, as a compiled %filter does.
     """
-    Given a field that is provided for a dicom, extract coordinates
-    """
-    field = field.replace("from:", "", 1)
-    coordinates = []
-    if field not in dicom:
-        return coordinates
-
-    regions = []
-    region = dicom.get(field)
-
-    # First put list of attributes together
-    if isinstance(region, Sequence):
-        for entry in region:
-            regions.append(entry)
-    else:
-        regions.append(region)
-
-    # Now extract coordinates
-    for region in regions:
-        if (
-            "RegionLocationMinX0" in region
-            and "RegionLocationMinY0" in region
-            and "RegionLocationMaxX1" in region
-            and "RegionLocationMaxY1" in region
-        ):
-            # https://gist.github.com/vsoch/df6957be12c34e62b21000603f1687e5
-            # minr, minc, maxr, maxc = coordinate
-            # self.cleaned[minc:maxc, minr:maxr] = 0  # should fill with black
-            # self.cleaned[A:B, C:D]
-            # image[A:B,C:D]
-            # A: refers to ymin
-            # B: refers to ymax
-            # C: refers xmin
-            # D: refers to xmax
-            # self.cleaned[ymin:ymax, xmin:xmax]
-            # coordinate must be [xmin, ymin, xmax, ymax]
-            # x0,y0,x1,y1.
-            coordinates.append(
-                "%s,%s,%s,%s"
-                % (
-                    region.RegionLocationMinX0,
-                    region.RegionLocationMinY0,
-                    region.RegionLocationMaxX1,
-                    region.RegionLocationMaxY1,
-                )
-            )
-    return coordinates
+    criteria = []
+    operator = "and"
+    for flag in flags:
+        if flag in ["and", "or"]:
+            operator = flag
+            continue
+        criteria.append((operator, lambda dicom, flag=flag: flag))
+        operator = "and"
+    return evaluate_criteria(None, criteria)
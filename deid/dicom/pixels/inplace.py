@@ -0,0 +1,128 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+
+import mmap
+import os
+import shutil
+import struct
+
+import numpy
+import pydicom
+from pydicom.uid import ExplicitVRBigEndian, ImplicitVRLittleEndian
+
+from deid.dicom.pixels.mask import get_coordinates, mask_pixels
+from deid.logger import bot
+
+PIXEL_DATA = (0x7FE0, 0x0010)
+
+# Explicit VRs with a 2 byte reserved field and 4 byte length
+LONG_VRS = [b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"UC", b"UN", b"UR", b"UT"]
+
+
+def get_pixel_layout(dicom_file):
+    """
+    Find where the (uncompressed) pixel data is in a dicom file.
+
+    Returns a dictionary with the byte offset of the PixelData value in the
+    file, and the dtype and shape to view it as an array, or None if the
+    pixel data cannot be cleaned in place. This is the case for compressed
+    (encapsulated) pixel data, 1 bit pixel data, YBR data (where zero is not
+    black) or pixel data with a length that isn't the expected one.
+
+    Parameters
+    ==========
+    dicom_file: the path to the dicom file
+    """
+    with open(dicom_file, "rb") as fd:
+        # Reading stops (and the file is left) at the start of the pixel data
+        dicom = pydicom.dcmread(fd, force=True, stop_before_pixels=True)
+        transfer_syntax = dicom.file_meta.TransferSyntaxUID
+        if transfer_syntax.is_compressed:
+            return
+
+        endian = ">" if transfer_syntax == ExplicitVRBigEndian else "<"
+        header = fd.read(8)
+        if len(header) < 8:
+            return
+        group, element = struct.unpack(endian + "HH", header[:4])
+        if (group, element) != PIXEL_DATA:
+            return
+
+        if transfer_syntax == ImplicitVRLittleEndian:
+            length = struct.unpack(endian + "I", header[4:])[0]
+        elif header[4:6] in LONG_VRS:
+            length = struct.unpack(endian + "I", fd.read(4))[0]
+        else:
+            length = struct.unpack(endian + "H", header[6:])[0]
+        offset = fd.tell()
+
+    if (
+        "Rows" not in dicom
+        or dicom.get("BitsAllocated") not in [8, 16, 32, 64]
+        or dicom.get("PhotometricInterpretation", "").startswith("YBR")
+    ):
+        return
+
+    frames = int(dicom.get("NumberOfFrames") or 1)
+    samples = dicom.SamplesPerPixel
+    kind = "i" if dicom.get("PixelRepresentation") == 1 else "u"
+    dtype = numpy.dtype("%s%s%s" % (endian, kind, dicom.BitsAllocated // 8))
+
+    # With planar configuration 1, each frame has a plane for each sample
+    if samples > 1 and dicom.get("PlanarConfiguration") == 1:
+        shape = (frames * samples, dicom.Rows, dicom.Columns)
+    else:
+        shape = (frames, dicom.Rows, dicom.Columns, samples)
+
+    expected = int(numpy.prod(shape)) * dtype.itemsize
+    if length not in [expected, expected + 1]:
+        return
+    return {"offset": offset, "dtype": dtype, "shape": shape}
+
+
+def clean_pixel_data_inplace(dicom_file, results: dict, output_file=None):
+    """
+    Clean uncompressed pixel data in place, in a memory mapped file.
+
+    The dicom file is copied to the output file (or cleaned in place if no
+    output file is provided), and the pixel data of the copy is memory
+    mapped and viewed as an array. Only the pixels in regions to clean are
+    set to zero, so the pixel data is never decoded or copied, and only the
+    pages of the file with cleaned pixels are written. Returns the path to
+    the cleaned file, or None if the pixel data cannot be cleaned in place
+    (see get_pixel_layout).
+
+    Parameters
+    ==========
+    dicom_file: the path to the dicom file to clean
+    results: Result of the .has_burned_pixels() method
+    output_file: the path to write the cleaned dicom to (default in place)
+    """
+    layout = get_pixel_layout(dicom_file)
+    if layout is None:
+        bot.debug("Pixel data of %s cannot be cleaned in place." % dicom_file)
+        return
+
+    shape = layout["shape"]
+    coordinates = get_coordinates(results, shape[1:3])
+
+    if output_file is None:
+        output_file = dicom_file
+    elif os.path.abspath(output_file) != os.path.abspath(dicom_file):
+        shutil.copyfile(dicom_file, output_file)
+
+    # Without coordinates to clean, there is nothing to write
+    if not coordinates:
+        return output_file
+
+    with open(output_file, "r+b") as fd:
+        with mmap.mmap(fd.fileno(), 0) as mapped:
+            pixels = numpy.ndarray(
+                shape, dtype=layout["dtype"], buffer=mapped, offset=layout["offset"]
+            )
+            mask_pixels(pixels, coordinates, multiframe=True)
+            del pixels
+            mapped.flush()
+    return output_file
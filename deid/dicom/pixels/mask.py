@@ -0,0 +1,104 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+
+import numpy
+from numpy.typing import NDArray
+
+
+def is_multiframe(pixels: NDArray, samples_per_pixel: int = 1) -> bool:
+    """
+    Determine if a pixel array has frames as the first dimension.
+
+    A 4D array is an RGB cine clip (frames, X, Y, channel). A 3D array is
+    ambiguous: it's a greyscale cine clip (frames, X, Y) for one sample per
+    pixel, or a single frame RGB image (X, Y, channel) otherwise.
+    """
+    return pixels.ndim == 4 or (pixels.ndim == 3 and samples_per_pixel == 1)
+
+
+def get_frame_shape(pixels: NDArray, multiframe: bool = False):
+    """
+    Get the (X, Y) shape of one frame of a pixel array.
+    """
+    return pixels.shape[1:3] if multiframe else pixels.shape[0:2]
+
+
+def get_coordinates(results: dict, frame_shape):
+    """
+    Compile coordinates from the result of has_burned_pixels.
+
+    Returns a list of tuples with value and coordinate, in the order they
+    are specified in the recipe, where keepcoordinates have a value of 1
+    (included in mask) and coordinates a value of 0 (remove). "all" is
+    resolved to the entire frame, with shape frame_shape (X, Y).
+    """
+    coordinates = []
+
+    for item in results["results"]:
+        # We iterate through coordinates in order specified in file
+        for coordinate_set in item.get("coordinates", []):
+            # Each is a list with [value, coordinate]
+            mask_value, new_coordinates = coordinate_set
+
+            if not isinstance(new_coordinates, list):
+                new_coordinates = [new_coordinates]
+
+            for new_coordinate in new_coordinates:
+                # Case 1: an "all" indicates applying to entire image
+                # minr, minc, maxr, maxc = [0, 0, Y, X]
+                if new_coordinate.lower() == "all":
+                    new_coordinate = [0, 0, frame_shape[1], frame_shape[0]]
+                else:
+                    new_coordinate = [int(x) for x in new_coordinate.split(",")]
+                coordinates.append(
+                    (mask_value, new_coordinate)
+                )  # [(1, [1,2,3,4]),...(0, [1,2,3,4])]
+
+    return coordinates
+
+
+def get_mask(coordinates, frame_shape) -> NDArray:
+    """
+    Resolve coordinates to a boolean mask for one frame (True to keep).
+
+    The coordinates are applied in order, so a keepcoordinates region
+    can restore part of a region to be cleaned before it.
+    """
+    mask = numpy.ones(frame_shape, dtype=bool)
+    for coordinate_value, coordinate in coordinates:
+        minr, minc, maxr, maxc = coordinate
+        mask[minc:maxc, minr:maxr] = bool(coordinate_value)
+    return mask
+
+
+def mask_pixels(pixels: NDArray, coordinates, multiframe: bool = False) -> NDArray:
+    """
+    Clean a pixel array in place, setting pixels not kept to zero.
+
+    No mask the size of the pixel data is created, and the dtype of the
+    pixel array is kept. If there are only regions to remove, each is set
+    to zero with a slice that broadcasts over frames and channels. If there
+    are regions to keep, the mask for one frame is resolved first, and
+    applied to every frame.
+
+    Parameters
+    ==========
+    pixels: the pixel array (X, Y), (X, Y, channel), (frames, X, Y) or
+            (frames, X, Y, channel) to clean
+    coordinates: a list of (value, [minr, minc, maxr, maxc]) from
+                 get_coordinates
+    multiframe: True if the first dimension of the array is frames
+    """
+    frames = (slice(None),) if multiframe else ()
+
+    if all(value == 0 for value, _ in coordinates):
+        for _, coordinate in coordinates:
+            minr, minc, maxr, maxc = coordinate
+            pixels[frames + (slice(minc, maxc), slice(minr, maxr))] = 0
+        return pixels
+
+    mask = get_mask(coordinates, get_frame_shape(pixels, multiframe))
+    pixels[frames + (~mask,)] = 0
+    return pixels
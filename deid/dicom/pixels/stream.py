@@ -0,0 +1,189 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+
+import struct
+
+import numpy
+import pydicom
+from pydicom.pixels import as_pixel_options, get_encoder, iter_pixels
+from pydicom.uid import UID, ExplicitVRLittleEndian, ImplicitVRLittleEndian
+
+from deid.dicom import utils
+from deid.dicom.pixels.mask import get_coordinates, mask_pixels
+from deid.logger import bot
+
+# Tags written directly to the file, after the header
+PIXEL_DATA = (0x7FE0, 0x0010)
+ITEM = (0xFFFE, 0xE000)
+SEQUENCE_DELIMITER = (0xFFFE, 0xE0DD)
+UNDEFINED_LENGTH = 0xFFFFFFFF
+
+
+def clean_pixel_data_chunked(
+    dicom_file,
+    results: dict,
+    output_file: str,
+    frames_per_chunk: int = 16,
+    compression=None,
+):
+    """
+    Clean a dicom file a few frames at a time, writing frames as they are done.
+
+    Unlike clean_pixel_data, the pixel data is never loaded all at once.
+    The header is written to the output file first, and then frames
+    are decoded (one by one, for encapsulated data), cleaned and written
+    to the output file frames_per_chunk at a time, so memory use is bounded
+    by the size of a chunk. A compressed file is written uncompressed
+    (as Explicit VR Little Endian) unless compression is provided, in
+    which case each frame is encoded as it's written. If the photometric
+    interpretation is YBR, the frames are converted to RGB (as pydicom
+    does when it decompresses).
+
+    Elements after the pixel data (e.g., trailing padding) are not written.
+
+    Parameters
+    ==========
+    dicom_file: the path to the dicom file to clean
+    results: Result of the .has_burned_pixels() method
+    output_file: the path to write the cleaned dicom file to
+    frames_per_chunk: the number of frames to clean and write at once
+    compression: a transfer syntax uid to encode the cleaned frames with
+    """
+    dicom = utils.read_header(dicom_file)
+    transfer_syntax = dicom.file_meta.TransferSyntaxUID
+
+    # The header is written before the pixel data, so elements after it are not
+    for tag in [tag for tag in dicom.keys() if tag > max(utils.PIXEL_DATA_TAGS)]:
+        del dicom[tag]
+
+    if dicom.BitsAllocated == 1:
+        bot.exit("Chunked cleaning does not support pixel data with 1 bit allocated.")
+
+    encoder = None
+    if compression is not None:
+        try:
+            encoder = get_encoder(UID(compression))
+        except NotImplementedError:
+            encoder = None
+        if encoder is None or not encoder.is_available:
+            bot.warning(
+                "Could not compress dicom with %s, saving uncompressed." % compression
+            )
+            encoder = None
+
+    # Decoded frames are written little endian, so we keep the transfer syntax
+    # of an uncompressed little endian file, and use Explicit VR otherwise
+    if encoder is not None:
+        dicom.file_meta.TransferSyntaxUID = UID(compression)
+    elif transfer_syntax not in [ExplicitVRLittleEndian, ImplicitVRLittleEndian]:
+        dicom.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    # Frames are decoded as RGB, and with the samples for a pixel together
+    if dicom.PhotometricInterpretation in ["YBR_FULL", "YBR_FULL_422"]:
+        dicom.PhotometricInterpretation = "RGB"
+    if dicom.SamplesPerPixel > 1:
+        dicom.PlanarConfiguration = 0
+
+    options = None
+    if encoder is not None:
+        options = as_pixel_options(dicom, number_of_frames=1)
+
+    coordinates = get_coordinates(results, (dicom.Rows, dicom.Columns))
+
+    with open(output_file, "wb") as fd:
+        pydicom.dcmwrite(fd, dicom, enforce_file_format=True)
+        writer = PixelDataWriter(fd, dicom, encoder=encoder, options=options)
+        writer.start()
+
+        # Frames are cleaned (in place) and written a chunk at a time
+        chunk = []
+        for frame in iter_pixels(dicom_file):
+            chunk.append(frame)
+            if len(chunk) == frames_per_chunk:
+                writer.write(mask_pixels(numpy.stack(chunk), coordinates, True))
+                chunk = []
+        if chunk:
+            writer.write(mask_pixels(numpy.stack(chunk), coordinates, True))
+        writer.finish()
+
+    return output_file
+
+
+class PixelDataWriter:
+    """
+    Write a PixelData element to an open file, frame by frame.
+
+    Uncompressed frames are written as one element with a defined length
+    (the expected length of all frames), and encoded frames are written
+    as an encapsulated element with one fragment per frame.
+    """
+
+    def __init__(self, fd, dicom, encoder=None, options=None):
+        self.fd = fd
+        self.encoder = encoder
+        self.options = options or {}
+        self.implicit_vr = dicom.file_meta.TransferSyntaxUID == ImplicitVRLittleEndian
+        self.vr = b"OB" if encoder is not None or dicom.BitsAllocated <= 8 else b"OW"
+        self.length = UNDEFINED_LENGTH
+        if encoder is None:
+            self.length = (
+                int(dicom.get("NumberOfFrames") or 1)
+                * dicom.Rows
+                * dicom.Columns
+                * dicom.SamplesPerPixel
+                * (dicom.BitsAllocated // 8)
+            )
+        self.written = 0
+
+    def _write_tag(self, tag, length):
+        self.fd.write(struct.pack("<HHI", tag[0], tag[1], length))
+
+    def start(self):
+        """
+        Write the PixelData tag, VR and length (and the basic offset table).
+        """
+        if self.implicit_vr:
+            self._write_tag(PIXEL_DATA, self.length + self.length % 2)
+        else:
+            length = self.length + self.length % 2
+            if self.length == UNDEFINED_LENGTH:
+                length = UNDEFINED_LENGTH
+            self.fd.write(struct.pack("<HH2sHI", *PIXEL_DATA, self.vr, 0, length))
+
+        # An empty basic offset table is the first item of encapsulated data
+        if self.encoder is not None:
+            self._write_tag(ITEM, 0)
+
+    def write(self, frames):
+        """
+        Write a chunk of frames (frames, X, Y[, channel]).
+        """
+        if self.encoder is None:
+            frames = frames.astype(frames.dtype.newbyteorder("<"), copy=False)
+            data = frames.tobytes()
+            self.written += len(data)
+            self.fd.write(data)
+            return
+
+        for frame in frames:
+            data = self.encoder.encode(frame, **self.options)
+            if len(data) % 2:
+                data += b"\x00"
+            self._write_tag(ITEM, len(data))
+            self.fd.write(data)
+
+    def finish(self):
+        """
+        Pad uncompressed data to an even length, or end encapsulated data.
+        """
+        if self.encoder is not None:
+            self._write_tag(SEQUENCE_DELIMITER, 0)
+        elif self.written != self.length:
+            bot.exit(
+                "Wrote %s bytes of pixel data, expected %s."
+                % (self.written, self.length)
+            )
+        elif self.length % 2:
+            self.fd.write(b"\x00")
@@ -0,0 +1,177 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import time
+
+# Counts kept for each recipe action (or %values / %fields list), and deid_func
+action_counts = ("calls", "matched", "seconds", "expand_seconds")
+func_counts = ("calls", "seconds")
+
+
+class ActionProfile:
+    """
+    A profile of the time spent on each line of a recipe, and each deid_func.
+
+    A DicomParser given a profile records, for each header action, the
+    number of times it was run (once per file), the number of fields it
+    matched, the wall time it took (in seconds, including any deid_func it
+    calls) and the part of that time spent finding the fields it matched
+    (e.g., by an expander like contains:). Actions are indexed by their
+    source (the file and line number from load_deid) and the line itself.
+    Each deid_func records its number of calls and time. Profiles can be
+    merged (e.g., across files and workers), and saved as a dictionary
+    (see to_dict). Usage:
+
+    profile = ActionProfile()
+    replace_identifiers(dicom_files, deid=recipe, profile=profile)
+    print(profile.table())
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.actions = {}
+        self.funcs = {}
+
+    def __str__(self):
+        return "[deid.ActionProfile][%s files, %s actions]" % (
+            self.files,
+            len(self.actions),
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+    def add_action(self, line, source=None, matched=0, seconds=0, expand_seconds=0):
+        """
+        Record one run of an action (or the extraction of a list).
+
+        Parameters
+        ==========
+        line: the action as a recipe line (e.g., REMOVE contains:Date)
+        source: the file and line number of the line (e.g., deid.dicom:12)
+        matched: the number of fields the action matched
+        seconds: the wall time of the action
+        expand_seconds: the part of seconds spent finding the fields
+        """
+        key = "%s %s" % (source, line) if source else line
+        counts = self.actions.get(key)
+        if counts is None:
+            counts = {"source": source, "line": line}
+            counts.update({name: 0 for name in action_counts})
+            self.actions[key] = counts
+        counts["calls"] += 1
+        counts["matched"] += matched
+        counts["seconds"] += seconds
+        counts["expand_seconds"] += expand_seconds
+
+    def add_func(self, name, seconds):
+        """
+        Record one call of a deid_func.
+        """
+        counts = self.funcs.get(name)
+        if counts is None:
+            counts = self.funcs[name] = {name: 0 for name in func_counts}
+        counts["calls"] += 1
+        counts["seconds"] += seconds
+
+    def wrap_funcs(self, funcs):
+        """
+        Wrap a lookup of deid_funcs, so each call is recorded.
+        """
+        return {name: self._wrap_func(name, func) for name, func in funcs.items()}
+
+    def _wrap_func(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_func(name, time.perf_counter() - start)
+
+        return timed
+
+    def merge(self, other):
+        """
+        Add the counts of another profile (or its to_dict) to this one.
+        """
+        if isinstance(other, ActionProfile):
+            other = other.to_dict()
+        self.files += other["files"]
+        for key, counts in other["actions"].items():
+            if key not in self.actions:
+                self.actions[key] = {"source": counts["source"], "line": counts["line"]}
+                self.actions[key].update({name: 0 for name in action_counts})
+            for name in action_counts:
+                self.actions[key][name] += counts[name]
+        for key, counts in other["funcs"].items():
+            if key not in self.funcs:
+                self.funcs[key] = {name: 0 for name in func_counts}
+            for name in func_counts:
+                self.funcs[key][name] += counts[name]
+        return self
+
+    def to_dict(self):
+        """
+        Get the profile as a (json serializable) dictionary.
+        """
+        return {
+            "files": self.files,
+            "actions": {key: dict(counts) for key, counts in self.actions.items()},
+            "funcs": {key: dict(counts) for key, counts in self.funcs.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Load a profile from a dictionary (from to_dict).
+        """
+        return cls().merge(data)
+
+    def top(self, count=10, sort_by="seconds"):
+        """
+        Get the (key, counts) of the count actions with the most sort_by.
+        """
+        ranked = sorted(
+            self.actions.items(), key=lambda item: item[1][sort_by], reverse=True
+        )
+        return ranked[:count]
+
+    def table(self, count=20, sort_by="seconds"):
+        """
+        Get a table (a string) of the top actions, and the deid_funcs.
+        """
+        rows = [
+            "%10s %10s %8s %10s  %s"
+            % ("seconds", "expand", "calls", "matched", "action")
+        ]
+        for key, counts in self.top(count, sort_by=sort_by):
+            rows.append(
+                "%10.4f %10.4f %8s %10s  %s"
+                % (
+                    counts["seconds"],
+                    counts["expand_seconds"],
+                    counts["calls"],
+                    counts["matched"],
+                    key,
+                )
+            )
+        if self.funcs:
+            rows += ["", "%10s %8s  %s" % ("seconds", "calls", "deid_func")]
+            for name, counts in sorted(
+                self.funcs.items(), key=lambda item: item[1]["seconds"], reverse=True
+            ):
+                rows.append(
+                    "%10.4f %8s  %s" % (counts["seconds"], counts["calls"], name)
+                )
+        return "\n".join(rows)
+
+
+def merge_profiles(profiles):
+    """
+    Merge profiles (or their to_dict) into a new ActionProfile.
+    """
+    merged = ActionProfile()
+    for profile in profiles:
+        merged.merge(profile)
+    return merged
@@ -0,0 +1,391 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+import os
+import random
+from functools import cache
+
+import numpy
+from pydicom.datadict import DicomDictionary
+from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from deid.logger import bot
+
+# The manufacturer of synthetic data, used by the filter for burned in text
+manufacturer = "SYNTHETIC"
+
+# Photometric interpretations, and their samples per pixel
+photometric_interpretations = {
+    "MONOCHROME1": 1,
+    "MONOCHROME2": 1,
+    "RGB": 3,
+    "YBR_FULL": 3,
+}
+
+# SOP classes by (color, multiframe)
+sop_classes = {
+    (False, False): "1.2.840.10008.5.1.4.1.1.2",  # CT Image Storage
+    (False, True): "1.2.840.10008.5.1.4.1.1.7.3",  # Multi-frame Grayscale Word SC
+    (True, False): "1.2.840.10008.5.1.4.1.1.7",  # Secondary Capture
+    (True, True): "1.2.840.10008.5.1.4.1.1.7.4",  # Multi-frame True Color SC
+}
+
+# Value representations of the (string) fields used to widen a header
+header_vrs = ("AS", "CS", "DA", "DS", "IS", "LO", "LT", "PN", "SH", "ST", "TM", "UI")
+
+# Groups that are set for every file (pixels), or not valid in a dataset
+reserved_groups = (0x0000, 0x0002, 0x0004, 0x0028, 0x7FE0)
+
+first_names = ("Ada", "Grace", "Alan", "Edsger", "Barbara", "Donald", "Frances")
+last_names = ("Cookie", "Monster", "Bread", "Muffin", "Scone", "Waffle", "Crumpet")
+
+# Generated fields, in the order they are added to each file
+standard_fields = (
+    "SpecificCharacterSet",
+    "SOPClassUID",
+    "SOPInstanceUID",
+    "PatientName",
+    "PatientID",
+    "PatientBirthDate",
+    "PatientSex",
+    "StudyInstanceUID",
+    "SeriesInstanceUID",
+    "StudyDate",
+    "StudyTime",
+    "AccessionNumber",
+    "InstitutionName",
+    "ReferringPhysicianName",
+    "StudyDescription",
+    "SeriesDescription",
+    "SeriesNumber",
+    "InstanceNumber",
+    "Modality",
+    "Manufacturer",
+    "ImageType",
+    "BurnedInAnnotation",
+)
+
+
+@cache
+def get_header_keywords():
+    """
+    Get the (keyword, VR) of standard fields that can widen a header.
+
+    These are fields of the dictionary that are not retired, have a string
+    value representation, and are not in a reserved group (e.g., pixel data).
+    They are sorted by tag.
+    """
+    keywords = []
+    for tag, (vr, _, _, retired, keyword) in sorted(DicomDictionary.items()):
+        if (
+            keyword
+            and not retired
+            and vr in header_vrs
+            and tag >> 16 not in reserved_groups
+            and keyword not in standard_fields
+        ):
+            keywords.append((keyword, vr))
+    return tuple(keywords)
+
+
+def get_value(vr, rng, seed, name):
+    """
+    Get a (deterministic, with rng) value for a value representation.
+    """
+    if vr == "PN":
+        return "%s^%s" % (rng.choice(last_names), rng.choice(first_names))
+    if vr == "DA":
+        return "20%02d%02d%02d" % (
+            rng.randrange(25),
+            rng.randrange(1, 13),
+            rng.randrange(1, 29),
+        )
+    if vr == "TM":
+        return "%02d%02d%02d" % (
+            rng.randrange(24),
+            rng.randrange(60),
+            rng.randrange(60),
+        )
+    if vr == "AS":
+        return "%03dY" % rng.randrange(1, 100)
+    if vr == "DS":
+        return "%.2f" % rng.uniform(0, 100)
+    if vr == "IS":
+        return str(rng.randrange(1000))
+    if vr == "UI":
+        return generate_uid(entropy_srcs=[str(seed), name, str(rng.random())])
+    if vr == "CS":
+        return "SYNTH%s" % rng.randrange(100)
+    value = "synthetic %s %s" % (name, rng.randrange(10000))
+    return value[:16] if vr == "SH" else value[:64]
+
+
+def get_burned_in_coordinates(rows, columns, count=1):
+    """
+    Get the coordinates (xmin,ymin,xmax,ymax) of burned in text rectangles.
+
+    Rectangles are bands of text along the top of a frame, the same for each
+    file of a size, so the filter from get_synthetic_recipe can clean them.
+    """
+    height = max(2, rows // 16)
+    coordinates = []
+    for index in range(count):
+        ymin = min(rows - 1, index * (height + 2))
+        xmin = (index % 2) * (columns // 2)
+        coordinates.append(
+            "%s,%s,%s,%s"
+            % (xmin, ymin, min(columns, xmin + columns // 2), min(rows, ymin + height))
+        )
+    return coordinates
+
+
+def get_synthetic_recipe(rows=64, columns=64, burned_in=1):
+    """
+    Get the text of a deid recipe with a filter for synthetic burned in text.
+
+    The filter flags synthetic files marked with BurnedInAnnotation, with the
+    coordinates of the rectangles of burned in text.
+    """
+    lines = [
+        "FORMAT dicom",
+        "",
+        "%filter graylist",
+        "",
+        "LABEL Synthetic Burned In Text",
+        "  contains Manufacturer %s" % manufacturer,
+        "  + contains BurnedInAnnotation YES",
+    ]
+    for coordinate in get_burned_in_coordinates(rows, columns, burned_in):
+        lines.append("  coordinates %s" % coordinate)
+    return "\n".join(lines) + "\n"
+
+
+def add_sequences(dataset, rng, seed, depth, fanout, level=0):
+    """
+    Add a ContentSequence of fanout items, nested depth levels deep.
+    """
+    if level >= depth:
+        return
+    items = []
+    for index in range(fanout):
+        item = Dataset()
+        item.CodeValue = "%s.%s" % (level, index)
+        item.CodingSchemeDesignator = "DCM"
+        item.CodeMeaning = "Synthetic level %s item %s" % (level, index)
+        item.ObservationDateTime = "%s120000" % get_value("DA", rng, seed, "date")
+        item.PersonName = get_value("PN", rng, seed, "PersonName")
+        item.ReferencedSOPInstanceUID = get_value("UI", rng, seed, "sop")
+        add_sequences(item, rng, seed, depth, fanout, level + 1)
+        items.append(item)
+    dataset.ContentSequence = Sequence(items)
+
+
+def add_private_blocks(dataset, rng, blocks, elements=4):
+    """
+    Add blocks of private tags, each with a private creator.
+
+    Blocks are in groups 0009, 0011, 0013 (and so on), and the first element
+    of each block holds the name of the patient.
+    """
+    for index in range(blocks):
+        group = 0x0009 if index == 0 else 0x0011 + 2 * (index - 1)
+        block = dataset.private_block(
+            group, "SYNTHETIC CREATOR %02d" % index, create=True
+        )
+        block.add_new(0x10, "PN", str(dataset.PatientName))
+        for offset in range(1, elements):
+            block.add_new(
+                0x10 + offset, "LO", "private %s.%s %s" % (index, offset, rng.random())
+            )
+
+
+def get_pixels(rng, shape, samples_per_pixel, coordinates):
+    """
+    Get pixel data of a shape, with rectangles of burned in text.
+    """
+    if samples_per_pixel > 1:
+        pixels = rng.integers(0, 200, size=shape, dtype=numpy.uint8)
+        text = 255
+    else:
+        pixels = rng.integers(0, 3000, size=shape, dtype=numpy.uint16)
+        text = 4095
+
+    # Burned in "text" is a pattern of bright pixels in each rectangle
+    multiframe = len(shape) - (samples_per_pixel > 1) == 3
+    for coordinate in coordinates:
+        xmin, ymin, xmax, ymax = [int(x) for x in coordinate.split(",")]
+        region = (slice(ymin, ymax), slice(xmin, xmax))
+        if multiframe:
+            region = (slice(None),) + region
+        rows = numpy.arange(ymin, ymax)[:, None]
+        columns = numpy.arange(xmin, xmax)[None, :]
+        pattern = (rows // 2 + columns // 3) % 2 == 0
+        if samples_per_pixel > 1:
+            pattern = pattern[..., None]
+        pixels[region] = numpy.where(pattern, text, pixels[region])
+    return pixels
+
+
+def generate_dataset(
+    index=0,
+    seed=0,
+    width=50,
+    depth=2,
+    fanout=3,
+    private_blocks=1,
+    frames=1,
+    rows=64,
+    columns=64,
+    photometric="MONOCHROME2",
+    burned_in=1,
+    series_size=10,
+    modality="CT",
+):
+    """
+    Generate a synthetic dicom dataset.
+
+    The same arguments (and seed) always generate the same dataset. Files
+    with an index in the same series_size share a series (and every two
+    series share a study and patient), so identifiers repeat as they do
+    in real data.
+
+    Parameters
+    ==========
+    index: the index of the file in the corpus
+    seed: the seed for the corpus
+    width: the number of (standard) fields to add to the header
+    depth: the number of levels of nested sequences (0 for none)
+    fanout: the number of items in each sequence
+    private_blocks: the number of private blocks, each with a private creator
+    frames: the number of frames (more than 1 is a multi-frame image)
+    rows: the number of rows of a frame
+    columns: the number of columns of a frame
+    photometric: the photometric interpretation (e.g., MONOCHROME2 or RGB)
+    burned_in: the number of rectangles of burned in text
+    series_size: the number of files in each series
+    modality: the modality of the file
+    """
+    if photometric not in photometric_interpretations:
+        bot.exit(
+            "%s is not a supported photometric interpretation, choices are %s"
+            % (photometric, ", ".join(photometric_interpretations))
+        )
+    samples_per_pixel = photometric_interpretations[photometric]
+    color = samples_per_pixel > 1
+
+    # Series, studies and patients (each two series) repeat across files
+    series = index // max(1, series_size)
+    study = series // 2
+    rng = random.Random("%s-study-%s" % (seed, study))
+    patient = [get_value("PN", rng, seed, "patient")] + [
+        get_value(vr, rng, seed, name)
+        for vr, name in [("LO", "PatientID"), ("DA", "birth"), ("DA", "study")]
+    ]
+    rng = random.Random("%s-file-%s" % (seed, index))
+
+    file_meta = FileMetaDataset()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    file_meta.MediaStorageSOPClassUID = sop_classes[(color, frames > 1)]
+    file_meta.MediaStorageSOPInstanceUID = generate_uid(
+        entropy_srcs=[str(seed), "instance", str(index)]
+    )
+    ds = FileDataset(
+        "synthetic-%05d.dcm" % index, {}, file_meta=file_meta, preamble=b"\0" * 128
+    )
+    ds.SpecificCharacterSet = "ISO_IR 100"
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+
+    ds.PatientName = patient[0]
+    ds.PatientID = patient[1]
+    ds.PatientBirthDate = patient[2]
+    ds.PatientSex = "O"
+    ds.StudyInstanceUID = generate_uid(entropy_srcs=[str(seed), "study", str(study)])
+    ds.SeriesInstanceUID = generate_uid(entropy_srcs=[str(seed), "series", str(series)])
+    ds.StudyDate = patient[3]
+    ds.StudyTime = "120000"
+    ds.AccessionNumber = "SYN%08d" % study
+    ds.InstitutionName = "Synthetic Hospital"
+    ds.ReferringPhysicianName = get_value("PN", rng, seed, "physician")
+    ds.StudyDescription = "Synthetic study %s" % study
+    ds.SeriesDescription = "Synthetic series %s" % series
+    ds.SeriesNumber = series + 1
+    ds.InstanceNumber = index % max(1, series_size) + 1
+    ds.Modality = modality
+    ds.Manufacturer = manufacturer
+    ds.ImageType = ["ORIGINAL", "PRIMARY", "AXIAL"]
+    ds.BurnedInAnnotation = "YES" if burned_in else "NO"
+
+    # Widen the header with standard fields (the same for every file)
+    keywords = get_header_keywords()
+    chosen = random.Random("%s-keywords" % seed).sample(
+        range(len(keywords)), min(width, len(keywords))
+    )
+    for keyword_index in sorted(chosen):
+        keyword, vr = keywords[keyword_index]
+        setattr(ds, keyword, get_value(vr, rng, seed, keyword))
+
+    add_sequences(ds, rng, seed, depth, fanout)
+    add_private_blocks(ds, rng, private_blocks)
+
+    # Image pixel module
+    shape = (rows, columns)
+    if frames > 1:
+        ds.NumberOfFrames = frames
+        shape = (frames,) + shape
+    if color:
+        shape = shape + (samples_per_pixel,)
+        ds.PlanarConfiguration = 0
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.SamplesPerPixel = samples_per_pixel
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = 8 if color else 16
+    ds.BitsStored = 8 if color else 12
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = 0
+    coordinates = get_burned_in_coordinates(rows, columns, burned_in)
+    pixels = get_pixels(
+        numpy.random.default_rng([seed, index]), shape, samples_per_pixel, coordinates
+    )
+    ds.PixelData = pixels.tobytes()
+    return ds
+
+
+def generate_corpus(output_folder, count=10, recipe=True, **kwargs):
+    """
+    Generate a corpus of synthetic dicom files in an output folder.
+
+    Files are named synthetic-<index>.dcm, and the paths are returned. If
+    recipe is True and the files have burned in text, a recipe with a
+    filter to clean it is written to deid.dicom.synthetic in the folder.
+    All other arguments are given to generate_dataset.
+
+    Parameters
+    ==========
+    output_folder: the folder to write the files to (created if needed)
+    count: the number of files to generate
+    recipe: write a recipe to clean burned in text (default True)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = os.path.join(output_folder, "synthetic-%05d.dcm" % index)
+        generate_dataset(index=index, **kwargs).save_as(path, enforce_file_format=True)
+        paths.append(path)
+
+    burned_in = kwargs.get("burned_in", 1)
+    if recipe and burned_in:
+        with open(os.path.join(output_folder, "deid.dicom.synthetic"), "w") as fd:
+            fd.write(
+                get_synthetic_recipe(
+                    rows=kwargs.get("rows", 64),
+                    columns=kwargs.get("columns", 64),
+                    burned_in=burned_in,
+                )
+            )
+    bot.debug("Generated %s synthetic dicom files in %s" % (count, output_folder))
+    return paths
@@ -3,6 +3,7 @@ __copyright__ = "Copyright 2016-2025, Vanessa Sochat"
 __license__ = "MIT"
 
 import re
+from functools import cache, lru_cache
 
 from pydicom._dicom_dict import DicomDictionary, RepeatersDictionary
 from pydicom.sequence import Sequence
@@ -15,10 +16,57 @@ from deid.logger import bot
 ################################################################################
 
 
+@cache
+def get_keyword_index():
+    """get_keyword_index returns a lookup of tags in the DicomDictionary,
+    indexed by keyword. It's built the first time it's needed, and shared
+    by get_tag and add_tag so they don't scan the dictionary for each call.
+    """
+    index = {}
+    for tag, value in DicomDictionary.items():
+        # Keep the first, in the case of keywords that are not unique
+        index.setdefault(value[4], tag)
+    return index
+
+
+@cache
+def get_name_index():
+    """get_name_index returns a lookup of tags in the DicomDictionary, indexed
+    by lowercase keyword and lowercase name (e.g., "patientid" and "patient id"),
+    to find the tag of a field in a recipe, which is matched without case.
+    """
+    index = {}
+    for tag, value in DicomDictionary.items():
+        index.setdefault(value[4].lower(), tag)
+        index.setdefault(value[2].lower(), tag)
+    index.pop("", None)
+    return index
+
+
+def get_field_tag(field):
+    """get_field_tag returns the (top level) tag number for a field in a recipe,
+    or None if the field is not a known keyword, name or tag. A field can be a
+    keyword (PatientID), a name (Patient ID), a tag ((0010,0020), 00100020 or
+    0x00100020), or a nested field (e.g., ReferencedImageSequence__0__(0008,1155)),
+    in which case the tag of the top level sequence is returned.
+    """
+    field = field.split("__", 1)[0].strip()
+    match = re.fullmatch(r"[(]([0-9A-Fa-f]{4}),\s*([0-9A-Fa-f]{4})[)]", field)
+    if match:
+        return int(match.group(1) + match.group(2), 16)
+    if re.fullmatch("(0x)?[0-9A-Fa-f]{8}", field):
+        return int(field, 16)
+    return get_name_index().get(field.lower())
+
+
 def add_tag(identifier, VR="ST", VM=None, name=None, keyword=None):
     """Add tag will take a string for a tag (e.g., ) and define a new tag for it.
-    By default, we give the type "Short Text."
+    By default, we give the type "Short Text." If the identifier is the keyword
+    of a tag in the DicomDictionary, that tag is returned.
     """
+    if identifier in get_keyword_index():
+        return get_tag(identifier)
+
     tag = Tag("0x" + identifier)
     manifest = {
         "tag": tag,
@@ -39,16 +87,13 @@ def get_tag(field):
     field: the keyword to get tag for, eg "PatientIdentityRemoved"
 
     """
-    found = [
-        {key: value} for key, value in DicomDictionary.items() if value[4] == field
-    ]
+    found = get_keyword_index().get(field)
     manifest = None
 
-    if len(found) > 0:
+    if found is not None:
         # (VR, VM, Name, Retired, Keyword
-        found = found[0]  # shouldn't ever have length > 1
-        tag = Tag(list(found)[0])
-        VR, VM, longName, _, keyword = found[tag]
+        tag = Tag(found)
+        VR, VM, longName, _, keyword = DicomDictionary[found]
 
         manifest = {
             "tag": tag,
@@ -65,15 +110,7 @@ def find_tag(term, VR=None, VM=None, retired=False):
     """find_tag will search over tags in the DicomDictionary and return the tags found
     to match some term.
     """
-    searchin = DicomDictionary
-    if retired:
-        searchin = RepeatersDictionary
-
-    found = [
-        value
-        for key, value in searchin.items()
-        if re.search(term, value[4]) or re.search(term, value[2])
-    ]
+    found = list(_search_tags(term, retired))
 
     # Filter by VR, VM, name, these are exact
     if VR is not None:
@@ -83,6 +120,24 @@ def find_tag(term, VR=None, VM=None, retired=False):
     return found
 
 
+@lru_cache(maxsize=256)
+def _search_tags(term, retired=False):
+    """search tags is a helper function to find_tag, to search the keyword and
+    name of each tag for a term. The result is cached (as a tuple) by term,
+    since the same terms are often searched for many times.
+    """
+    searchin = DicomDictionary
+    if retired:
+        searchin = RepeatersDictionary
+
+    regex = re.compile(term)
+    return tuple(
+        value
+        for value in searchin.values()
+        if regex.search(value[4]) or regex.search(value[2])
+    )
+
+
 def _filter_tags(tags, idx, fields=None):
     """filter tags is a helper function to take some list of tags in the format
     [ (VR, VM, longname, retired, keyword).. ]
@@ -3,11 +3,14 @@ __copyright__ = "Copyright 2016-2025, Vanessa Sochat"
 __license__ = "MIT"
 
 import os
+import queue
 import tempfile
+import threading
 import zipfile
 
 import pydicom
 from pydicom import FileDataset
+from pydicom.dataset import Dataset
 
 from deid.logger import bot
 from deid.utils import recursive_find
@@ -19,12 +22,17 @@ from .validate import validate_dicoms
 ################################################################################
 
 
-def get_files(contenders, check=True, pattern=None, force=False, tempdir=None):
+def get_files(
+    contenders, check=True, pattern=None, force=False, tempdir=None, load=False
+):
     """
     Get a generator for files.
 
     get_files will take a list of single dicom files or directories,
-    and return a generator that yields complete paths to all files
+    and return a generator that yields complete paths to all files.
+    If load is True, the datasets read for validation (headers only,
+    see read_header) are yielded instead, so they can be given to
+    DicomParser or replace_identifiers without reading the files again.
 
     Parameters
     ==========
@@ -33,6 +41,7 @@ def get_files(contenders, check=True, pattern=None, force=False, tempdir=None):
     pattern: A pattern to use with fnmatch. If None, * is used
     force: force reading of the files, if some headers invalid.
            Not recommended, as many non-dicom will come through
+    load: yield header only datasets instead of paths (default False)
 
     """
     if not isinstance(contenders, list):
@@ -61,15 +70,29 @@ def get_files(contenders, check=True, pattern=None, force=False, tempdir=None):
                         continue  # ZIP file does not contain any file
 
             if check:
-                validated_files = validate_dicoms(dicom_file, force=force)
+                validated_files = validate_dicoms(dicom_file, force=force, load=load)
+            elif load:
+                validated_files = [read_header(dicom_file, force=force)]
             else:
                 validated_files = [dicom_file]
 
             for validated_file in validated_files:
-                bot.debug("Found contender file %s" % (validated_file))
+                bot.debug("Found contender file %s" % (dicom_file))
                 yield validated_file
 
 
+def has_dicom_prefix(filename):
+    """
+    Determine if a file has the DICM prefix, after the 128 byte preamble.
+
+    This only reads the first 132 bytes, and is a cheap check to skip
+    files that are not dicom (without force) before parsing them.
+    """
+    with open(filename, "rb") as fd:
+        fd.seek(128)
+        return fd.read(4) == b"DICM"
+
+
 def save_dicom(dicom, dicom_file, output_folder=None, overwrite=False):
     """
     Save a dicom file to an output folder.
@@ -102,16 +125,173 @@ def save_dicom(dicom, dicom_file, output_folder=None, overwrite=False):
             dowrite = False
 
     if dowrite:
+        if getattr(dicom, "tags_projected", False):
+            bot.exit(
+                "%s was read with only the tags a recipe references, and cannot be saved."
+                % dicom_name
+            )
+        load_pixels(dicom)
         dicom.save_as(output_dicom)
     return output_dicom
 
 
-def load_dicom(dcm_file, force=True):
+def load_dicom(dcm_file, force=True, header_only=False, specific_tags=None):
     if isinstance(dcm_file, FileDataset):
         return dcm_file
+    elif header_only or specific_tags is not None:
+        return read_header(dcm_file, force=force, specific_tags=specific_tags)
     else:
         return pydicom.dcmread(dcm_file, force=force)
 
 
+# The pixel data elements, deferred by read_header until a dataset is saved
+PIXEL_DATA_TAGS = (0x7FE00008, 0x7FE00009, 0x7FE00010)
+
+# Values of at least this many bytes are skipped on disk (and read when used)
+DEFER_SIZE = 65536
+
+
+def read_header(filename, force=True, specific_tags=None):
+    """
+    Read the header of a dicom file, without the pixel data.
+
+    Values of DEFER_SIZE bytes or more (e.g., the pixel data) are skipped
+    on disk, so header only operations don't read (often very large) pixel
+    bytes, and other large values are read if they are used. The pixel
+    data elements are dropped, and the dataset is marked with
+    pixels_deferred, so load_pixels (called when saving) adds them back
+    from the file it was read from. Elements after the pixel data (e.g.,
+    private groups or a digital signature) are read, so header actions
+    (and remove_private) see them. Compressed (encapsulated) pixel data
+    has no length to skip, so its bytes are read (and dropped).
+
+    If specific_tags are provided, only those (top level) elements are
+    read, and the values of other elements with a defined length are
+    skipped on disk. Such a dataset is a projection of the header for
+    inspection (marked with tags_projected), and cannot be saved.
+
+    Parameters
+    ==========
+    filename: the path to the dicom file to read
+    force: force reading of the file, if the header is invalid
+    specific_tags: if defined, a list of the tag numbers to read
+    """
+    # An empty list reads everything, so we ask for the character set only
+    stop_before_pixels = False
+    if specific_tags is not None:
+        specific_tags = list(specific_tags) or [0x00080005]
+
+        # Reading can stop at the pixel data if no tag is after it
+        stop_before_pixels = max(specific_tags) < min(PIXEL_DATA_TAGS)
+
+    dicom = pydicom.dcmread(
+        filename,
+        force=force,
+        defer_size=DEFER_SIZE,
+        stop_before_pixels=stop_before_pixels,
+        specific_tags=specific_tags,
+    )
+    for tag in PIXEL_DATA_TAGS:
+        if tag in dicom:
+            del dicom[tag]
+    dicom.pixels_deferred = True
+    if specific_tags is not None:
+        dicom.tags_projected = True
+    return dicom
+
+
+def load_pixels(dicom, force=True):
+    """
+    Load pixel data that read_header deferred, in place.
+
+    Only the pixel data elements are read from the file again and added
+    to the dataset, so header changes already made to the dataset (e.g.,
+    removing elements after the pixel data) are kept. A dataset that was
+    fully read is returned as is.
+
+    Parameters
+    ==========
+    dicom: the pydicom Dataset, possibly from read_header
+    force: force reading of the file, if the header is invalid
+    """
+    if not getattr(dicom, "pixels_deferred", False):
+        return dicom
+
+    filename = dicom.get("filename")
+    if not isinstance(filename, (str, os.PathLike)) or not os.path.exists(filename):
+        bot.exit("Cannot load pixel data, %s does not exist." % filename)
+
+    pixels = pydicom.dcmread(filename, force=force, specific_tags=list(PIXEL_DATA_TAGS))
+    for tag in PIXEL_DATA_TAGS:
+        if tag in pixels and tag not in dicom:
+            dicom.add(pixels[tag])
+    dicom.pixels_deferred = False
+    return dicom
+
+
 def dcmread(filename, **kwargs):
     return pydicom.dcmread(filename, **kwargs)
+
+
+def read_ahead(dicom_files, force=True, lookahead=2):
+    """
+    Read dicom files in a background thread, a bounded number ahead.
+
+    Yields tuples of (dicom_file, dataset, error) in input order, where
+    error is the exception raised while reading (and dataset is None)
+    if the file could not be read. At most lookahead datasets are held
+    in memory waiting to be consumed, so reading overlaps with processing
+    without loading the whole input. Datasets provided in the input are
+    passed through as is.
+
+    Parameters
+    ==========
+    dicom_files: an iterable of dicom file paths or datasets
+    force: force reading of the files
+    lookahead: the maximum number of files read ahead of the consumer
+    """
+    done = object()
+    results = queue.Queue(maxsize=max(1, lookahead))
+    stop = threading.Event()
+
+    def put(item):
+        # Give up if the consumer went away, instead of blocking forever
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for dicom_file in dicom_files:
+                if isinstance(dicom_file, Dataset):
+                    item = (dicom_file, dicom_file, None)
+                else:
+                    try:
+                        item = (dicom_file, dcmread(dicom_file, force=force), None)
+                    except Exception as e:
+                        item = (dicom_file, None, e)
+                if not put(item):
+                    return
+
+        # An error iterating over the input is raised to the consumer
+        except Exception as e:
+            put((done, None, e))
+            return
+        put((done, None, None))
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            dicom_file, dataset, error = results.get()
+            if dicom_file is done:
+                if error is not None:
+                    raise error
+                break
+            yield dicom_file, dataset, error
+    finally:
+        stop.set()
@@ -6,7 +6,7 @@ import deid.dicom.utils as utils
 from deid.logger import bot
 
 
-def validate_dicoms(dcm_files, force=False):
+def validate_dicoms(dcm_files, force=False, load=False):
     """
     Validate that dicom files can open and return valid set.
 
@@ -16,7 +16,13 @@ def validate_dicoms(dcm_files, force=False):
     Parameters
     ==========
     dcm_files: one or more dicom files to test
+    force: force reading of the files, if some headers invalid.
+    load: return the (header only) datasets read, instead of the paths
 
+    Only the header is read, the pixel data is not needed to validate.
+    Unless force is True, a file without the DICM prefix is skipped
+    without being parsed. With load, the datasets read to validate are
+    returned, so the files don't need to be read a second time.
     """
     if not isinstance(dcm_files, list):
         dcm_files = [dcm_files]
@@ -26,9 +32,10 @@ def validate_dicoms(dcm_files, force=False):
     bot.debug("Checking %s dicom files for validation." % (len(dcm_files)))
     for dcm_file in dcm_files:
         try:
-            with open(dcm_file, "rb") as filey:
-                utils.dcmread(filey, force=force)
-            valids.append(dcm_file)
+            if not force and not utils.has_dicom_prefix(dcm_file):
+                raise ValueError("%s is missing the DICM prefix" % dcm_file)
+            dicom = utils.read_header(dcm_file, force=force)
+            valids.append(dicom if load else dcm_file)
         except Exception:
             bot.warning("Cannot read input file {0!s}, skipping.".format(dcm_file))
 
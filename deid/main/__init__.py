@@ -148,6 +148,23 @@ def get_parser():
         default=None,
     )
 
+    ids.add_argument(
+        "--workers",
+        "-w",
+        dest="workers",
+        help="number of processes to use to replace identifiers (default is 1).",
+        type=int,
+        default=1,
+    )
+
+    ids.add_argument(
+        "--metrics",
+        dest="metrics",
+        help="write metrics to this file every 15 seconds (OpenMetrics text, or json for a .json file).",
+        type=str,
+        default=None,
+    )
+
     # Action
     ids.add_argument(
         "--action",
@@ -159,6 +176,107 @@ def get_parser():
         required=True,
     )
 
+    synthetic = subparsers.add_parser(
+        "synthetic", help="generate synthetic dicom files for load testing"
+    )
+
+    synthetic.add_argument(
+        "--count",
+        "-n",
+        dest="count",
+        help="number of files to generate (default is 10).",
+        type=int,
+        default=10,
+    )
+
+    synthetic.add_argument(
+        "--seed",
+        dest="seed",
+        help="seed for the corpus, the same seed generates the same files (default 0).",
+        type=int,
+        default=0,
+    )
+
+    synthetic.add_argument(
+        "--width",
+        dest="width",
+        help="number of standard fields to add to each header (default 50).",
+        type=int,
+        default=50,
+    )
+
+    synthetic.add_argument(
+        "--depth",
+        dest="depth",
+        help="levels of nested sequences (default 2).",
+        type=int,
+        default=2,
+    )
+
+    synthetic.add_argument(
+        "--fanout",
+        dest="fanout",
+        help="number of items in each sequence (default 3).",
+        type=int,
+        default=3,
+    )
+
+    synthetic.add_argument(
+        "--private-blocks",
+        dest="private_blocks",
+        help="number of private blocks, each with a private creator (default 1).",
+        type=int,
+        default=1,
+    )
+
+    synthetic.add_argument(
+        "--frames",
+        dest="frames",
+        help="number of frames in each file (default 1).",
+        type=int,
+        default=1,
+    )
+
+    synthetic.add_argument(
+        "--rows",
+        dest="rows",
+        help="number of rows of a frame (default 64).",
+        type=int,
+        default=64,
+    )
+
+    synthetic.add_argument(
+        "--columns",
+        dest="columns",
+        help="number of columns of a frame (default 64).",
+        type=int,
+        default=64,
+    )
+
+    synthetic.add_argument(
+        "--photometric",
+        dest="photometric",
+        help="photometric interpretation of the pixels (default MONOCHROME2).",
+        default="MONOCHROME2",
+        choices=["MONOCHROME1", "MONOCHROME2", "RGB", "YBR_FULL"],
+    )
+
+    synthetic.add_argument(
+        "--burned-in",
+        dest="burned_in",
+        help="number of rectangles of burned in text, 0 for none (default 1).",
+        type=int,
+        default=1,
+    )
+
+    synthetic.add_argument(
+        "--series-size",
+        dest="series_size",
+        help="number of files in each series (default 10).",
+        type=int,
+        default=10,
+    )
+
     return parser
 
 
@@ -185,6 +303,8 @@ def main():
         from .identifiers import main
     elif args.command == "inspect":
         from .inspect import main
+    elif args.command == "synthetic":
+        from .synthetic import main
     else:
         parser.print_help()
         sys.exit(1)
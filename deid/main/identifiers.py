@@ -12,6 +12,7 @@ from deid.config import load_deid
 from deid.data import get_dataset
 from deid.dicom import get_files
 from deid.dicom.header import get_identifiers, replace_identifiers
+from deid.dicom.metrics import MetricsExporter, MetricsRegistry
 from deid.logger import bot
 
 
@@ -63,13 +64,25 @@ def main(args, parser):
         ids = get_identifiers(dicom_files)
 
     if do_put is True:
-        cleaned_files = replace_identifiers(
-            dicom_files=dicom_files,
-            ids=ids,
-            deid=args.deid,
-            overwrite=args.overwrite,
-            output_folder=output_folder,
-            save=True,
-        )
+        # Metrics are written periodically, and when the run is done
+        metrics = exporter = None
+        if args.metrics is not None:
+            metrics = MetricsRegistry()
+            exporter = MetricsExporter(metrics, args.metrics).start()
+
+        try:
+            cleaned_files = replace_identifiers(
+                dicom_files=dicom_files,
+                ids=ids,
+                deid=args.deid,
+                overwrite=args.overwrite,
+                output_folder=output_folder,
+                save=True,
+                workers=args.workers,
+                metrics=metrics,
+            )
+        finally:
+            if exporter is not None:
+                exporter.stop()
 
         bot.info("%s %s files at %s" % (len(cleaned_files), args.format, output_folder))
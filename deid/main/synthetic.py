@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+
+import tempfile
+
+from deid.dicom.synthetic import generate_corpus
+from deid.logger import bot
+
+
+def main(args, parser):
+    # Global output folder
+    output_folder = args.outfolder
+    if output_folder is None:
+        output_folder = tempfile.mkdtemp()
+
+    paths = generate_corpus(
+        output_folder,
+        count=args.count,
+        seed=args.seed,
+        width=args.width,
+        depth=args.depth,
+        fanout=args.fanout,
+        private_blocks=args.private_blocks,
+        frames=args.frames,
+        rows=args.rows,
+        columns=args.columns,
+        photometric=args.photometric,
+        burned_in=args.burned_in,
+        series_size=args.series_size,
+    )
+    bot.info("%s synthetic %s files at %s" % (len(paths), args.format, output_folder))
+    return paths
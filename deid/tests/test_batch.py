@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from deid.data import get_dataset
+from deid.dicom import get_files, replace_identifiers, utils
+from deid.dicom.batch import replace_identifiers_batch
+from deid.tests.common import create_recipe
+from deid.utils import get_installdir
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.pwd = get_installdir()
+        self.deid = os.path.abspath("%s/../examples/deid/deid.dicom" % self.pwd)
+        self.dataset = get_dataset("dicom-cookies")
+        self.dicom_files = list(get_files(self.dataset))
+        self.tmpdir = tempfile.mkdtemp()
+        print("\n######################START######################")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        print("\n######################END########################")
+
+    def test_parallel_matches_serial(self):
+        """Parallel replace_identifiers returns the same datasets, in order"""
+        print("Test replace_identifiers with workers")
+        actions = [
+            {"action": "REPLACE", "field": "PatientID", "value": "cookie-monster"},
+            {"action": "REMOVE", "field": "StudyDate"},
+        ]
+        recipe = create_recipe(actions)
+
+        serial = replace_identifiers(self.dicom_files, deid=recipe)
+        parallel = replace_identifiers(self.dicom_files, deid=recipe, workers=2)
+
+        self.assertEqual(len(serial), len(parallel))
+        for expected, result in zip(serial, parallel):
+            self.assertEqual(expected.SOPInstanceUID, result.SOPInstanceUID)
+            self.assertEqual("cookie-monster", result.PatientID)
+            self.assertNotIn("StudyDate", result)
+
+    def test_batch_save(self):
+        """The batch generator yields saved paths in input order"""
+        print("Test replace_identifiers_batch with save")
+        actions = [{"action": "REPLACE", "field": "PatientID", "value": "cookie"}]
+        recipe = create_recipe(actions)
+
+        results = list(
+            replace_identifiers_batch(
+                (x for x in self.dicom_files),
+                deid=recipe,
+                save=True,
+                output_folder=self.tmpdir,
+                workers=2,
+            )
+        )
+        self.assertEqual(len(self.dicom_files), len(results))
+        for dicom_file, result in zip(self.dicom_files, results):
+            self.assertEqual(os.path.basename(dicom_file), os.path.basename(result))
+            self.assertEqual("cookie", utils.dcmread(result).PatientID)
+
+
+if __name__ == "__main__":
+    unittest.main()
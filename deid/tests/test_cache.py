@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from deid.data import get_dataset
+from deid.dicom import get_files, has_burned_pixels, replace_identifiers
+from deid.dicom.cache import RunCache, get_fingerprint
+from deid.tests.common import create_recipe
+
+
+class TestRunCache(unittest.TestCase):
+    def setUp(self):
+        self.dataset = get_dataset("dicom-cookies")
+        self.tmpdir = tempfile.mkdtemp()
+
+        # Copy the files, so we can change them
+        self.input = os.path.join(self.tmpdir, "input")
+        shutil.copytree(self.dataset, self.input)
+        self.dicom_files = sorted(get_files(self.input))
+        self.output = os.path.join(self.tmpdir, "output")
+        os.mkdir(self.output)
+        self.cache = RunCache(os.path.join(self.tmpdir, "cache.db"))
+        print("\n######################START######################")
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+        print("\n######################END########################")
+
+    def replace(self, recipe):
+        return replace_identifiers(
+            self.dicom_files,
+            deid=recipe,
+            save=True,
+            overwrite=True,
+            output_folder=self.output,
+            cache=self.cache,
+        )
+
+    def test_fingerprint(self):
+        """The fingerprint ignores action sources and function addresses"""
+        print("Test get_fingerprint")
+        action = {"action": "REPLACE", "field": "PatientID", "value": "var:id"}
+
+        print("Case 1: The source of an action is not fingerprinted")
+        moved = {"header": [dict(action, source="deid.dicom:12")]}
+        self.assertEqual(
+            get_fingerprint({"header": [dict(action, source="deid.dicom:40")]}),
+            get_fingerprint(moved),
+        )
+        changed = {"header": [dict(action, value="var:other", source="deid.dicom:12")]}
+        self.assertNotEqual(get_fingerprint(moved), get_fingerprint(changed))
+
+        print("Case 2: A function is fingerprinted by its name")
+
+        def generate_id(item, value, field, dicom):
+            return "id"
+
+        def make_func():
+            def generate_id(item, value, field, dicom):
+                return "id"
+
+            return generate_id
+
+        self.assertEqual(
+            get_fingerprint({"id": make_func()}), get_fingerprint({"id": make_func()})
+        )
+        self.assertNotEqual(
+            get_fingerprint({"id": generate_id}), get_fingerprint({"id": make_func()})
+        )
+
+    def test_replace_identifiers_cache(self):
+        """A re-run only processes the files (or recipe) that changed"""
+        print("Test replace_identifiers with a run cache")
+        recipe = create_recipe(
+            [{"action": "REPLACE", "field": "PatientID", "value": "cookie"}]
+        )
+        count = len(self.dicom_files)
+
+        print("Case 1: The first run processes every file")
+        outputs = self.replace(recipe)
+        self.assertEqual((0, count), (self.cache.hits, self.cache.misses))
+
+        print("Case 2: A re-run reuses the outputs")
+        self.assertEqual(outputs, self.replace(recipe))
+        self.assertEqual((count, count), (self.cache.hits, self.cache.misses))
+
+        print("Case 3: A changed file, or removed output, is processed again")
+        with open(self.dicom_files[0], "ab") as fd:
+            fd.write(b"\0\0")
+        os.remove(outputs[1])
+        self.assertEqual(outputs, self.replace(recipe))
+        self.assertEqual(
+            (2 * count - 2, count + 2), (self.cache.hits, self.cache.misses)
+        )
+        self.assertTrue(os.path.exists(outputs[1]))
+
+        print("Case 4: A changed recipe processes every file")
+        recipe = create_recipe(
+            [{"action": "REPLACE", "field": "PatientID", "value": "monster"}]
+        )
+        self.replace(recipe)
+        self.assertEqual(2 * count + 2, self.cache.misses)
+
+    def test_has_burned_pixels_cache(self):
+        """Cached decisions are the same as those that are not"""
+        print("Test has_burned_pixels with a run cache")
+        expected = has_burned_pixels(self.dicom_files)
+        self.assertEqual(
+            expected, has_burned_pixels(self.dicom_files, cache=self.cache)
+        )
+        self.assertEqual(
+            expected, has_burned_pixels(self.dicom_files, cache=self.cache)
+        )
+        self.assertEqual(len(self.dicom_files), self.cache.hits)
+
+        result = has_burned_pixels(self.dicom_files[0], cache=self.cache)
+        self.assertEqual(has_burned_pixels(self.dicom_files[0]), result)
+
+
+if __name__ == "__main__":
+    unittest.main()
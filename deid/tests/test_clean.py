@@ -254,6 +254,34 @@ class TestClean(unittest.TestCase):
         self.assertEqual(compressed_file.file_meta.TransferSyntaxUID, RLELossless)
         self.assertNotEqual(uncompressed_file.file_meta.TransferSyntaxUID, RLELossless)
 
+    def test_import_does_not_load_matplotlib(self):
+        """Matplotlib is only imported to save a figure"""
+        import subprocess
+        import sys
+
+        print("Test importing deid.dicom does not import matplotlib")
+        code = "import deid.dicom, sys; print('matplotlib' in sys.modules)"
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True
+        )
+        self.assertEqual("False", result.stdout.strip().splitlines()[-1])
+
+    def test_pixel_cleaner_save_png(self):
+        """A cleaned image is saved as a png in the output folder"""
+        from deid.dicom import DicomCleaner
+
+        print("Test saving a cleaned image as png")
+        dicom_file = get_file(self.dataset)
+        deid = os.path.join(self.deidpath, "remove_coordinates.dicom")
+        client = DicomCleaner(output_folder=self.tmpdir, deid=deid)
+        client.detect(dicom_file)
+        client.clean()
+        png_file = client.save_png()
+        self.assertEqual(self.tmpdir, os.path.dirname(png_file))
+        self.assertTrue(png_file.endswith(".png"))
+        with open(png_file, "rb") as fd:
+            self.assertEqual(b"\x89PNG", fd.read(4))
+
 
 if __name__ == "__main__":
     unittest.main()
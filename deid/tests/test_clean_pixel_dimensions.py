@@ -254,6 +254,57 @@ class TestCleanPizelDimensions(unittest.TestCase):
         compare = inputpixels == outputpixels
         self.assertTrue(compare.all())
 
+    def test_4d_RGB_cine_clip_chunked(self):
+        """
+        Test the chunked pixel cleaner gives the same pixels as clean(), on "4D"
+        images - RGB cine clips, with a number of frames that isn't a multiple
+        of the chunk size. The cleaned frames can also be compressed.
+        """
+        from pydicom.uid import RLELossless
+
+        from deid.dicom import DicomCleaner
+
+        dicom_file = get_file(self.dataset, "RGB_CINE.zip", self.tmpdir)
+        deid = os.path.join(self.deidpath, "remove_coordinates_us.dicom")
+
+        client = DicomCleaner(output_folder=self.tmpdir, deid=deid)
+        out = client.detect(dicom_file)
+        self.assertTrue(out["flagged"])
+        expected = client.clean()
+
+        cleanedfile = client.clean_chunked(frames_per_chunk=7)
+        outputpixels = utils.dcmread(cleanedfile).pixel_array
+        self.assertEqual(expected.shape, outputpixels.shape)
+        self.assertTrue((expected == outputpixels).all())
+
+        output_folder = os.path.join(self.tmpdir, "compressed")
+        cleanedfile = client.clean_chunked(output_folder, compression=RLELossless)
+        outputfile = utils.dcmread(cleanedfile)
+        self.assertEqual(RLELossless, outputfile.file_meta.TransferSyntaxUID)
+        self.assertTrue((expected == outputfile.pixel_array).all())
+
+    def test_3d_Greyscale_cine_clip_inplace(self):
+        """
+        Test the in place pixel cleaner gives the same pixels as clean(), on "3D"
+        images - greyscale cine clips, and leaves the original file as it was.
+        """
+        from deid.dicom import DicomCleaner
+
+        dicom_file = get_file(self.dataset, "GREYSCALE_CINE.zip", self.tmpdir)
+        deid = os.path.join(self.deidpath, "remove_coordinates_us.dicom")
+        inputpixels = utils.dcmread(dicom_file).pixel_array
+
+        client = DicomCleaner(output_folder=self.tmpdir, deid=deid)
+        out = client.detect(dicom_file)
+        self.assertTrue(out["flagged"])
+        expected = client.clean()
+
+        cleanedfile = client.clean_inplace()
+        outputpixels = utils.dcmread(cleanedfile).pixel_array
+        self.assertTrue((expected == outputpixels).all())
+        self.assertFalse((inputpixels == outputpixels).all())
+        self.assertTrue((utils.dcmread(dicom_file).pixel_array == inputpixels).all())
+
 
 def get_file(dataset, image, tempdir=None):
     """
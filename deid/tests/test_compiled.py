@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import unittest
+
+from deid.config import DeidRecipe
+from deid.data import get_dataset
+from deid.dicom import get_files, replace_identifiers
+from deid.dicom.compiled import CompiledAction, CompiledRecipe, compile_recipe
+from deid.dicom.parser import DicomParser
+from deid.tests.common import create_recipe
+from deid.utils import split_value
+
+
+class TestCompiledRecipe(unittest.TestCase):
+    def setUp(self):
+        self.dataset = get_dataset("dicom-cookies")
+        self.dicom_files = list(get_files(self.dataset))
+        print("\n######################START######################")
+
+    def tearDown(self):
+        print("\n######################END########################")
+
+    def test_compiled_action_kinds(self):
+        print("Test classification of compiled actions")
+        action = CompiledAction("REMOVE", "values:cookie_names")
+        self.assertEqual("values", action.kind)
+        self.assertEqual("cookie_names", action.group)
+
+        action = CompiledAction("BLANK", "fields:instance_fields")
+        self.assertEqual("fields", action.kind)
+        self.assertEqual("instance_fields", action.group)
+
+        action = CompiledAction("REPLACE", "PatientID", "func:generate_uid")
+        self.assertEqual("expression", action.kind)
+        self.assertTrue(action.expression.is_exact)
+        self.assertEqual(("func", "generate_uid", ""), action.value_spec)
+
+        action = CompiledAction("REMOVE", "contains:Time")
+        self.assertEqual("contains", action.expression.expander)
+        self.assertIsNotNone(action.expression.expression_re)
+
+        action = CompiledAction("NOTANACTION", "PatientID")
+        self.assertEqual("BLANK", action.action)
+
+    def test_split_value(self):
+        print("Test split_value")
+        self.assertEqual(None, split_value("SIMPSON"))
+        self.assertEqual(("var", "lookup", ""), split_value("var:lookup"))
+        self.assertEqual(
+            ("deid_func", "jitter", "days=1 years=2"),
+            split_value("deid_func:jitter days=1 years=2"),
+        )
+
+    def test_compile_recipe(self):
+        print("Test compile_recipe")
+        recipe = DeidRecipe()
+        compiled = compile_recipe(recipe)
+        self.assertTrue(isinstance(compiled, CompiledRecipe))
+        self.assertIs(compiled, compile_recipe(compiled))
+        self.assertIs(recipe, compiled.recipe)
+        self.assertEqual(len(recipe.get_actions()), len(compiled.actions))
+
+    def test_compiled_recipe_shared_across_files(self):
+        """A compiled recipe gives the same result as the recipe, for each file"""
+        print("Test sharing a compiled recipe across parsers")
+        actions = [
+            {"action": "REPLACE", "field": "PatientID", "value": "cookie-monster"},
+            {"action": "REMOVE", "field": "contains:Date"},
+            {"action": "JITTER", "field": "StudyDate", "value": "1"},
+        ]
+        recipe = create_recipe(actions)
+        compiled = compile_recipe(recipe)
+
+        expected = replace_identifiers(self.dicom_files, deid=recipe)
+        for dicom_file, ds in zip(self.dicom_files, expected):
+            parser = DicomParser(dicom_file, recipe=compiled)
+            parser.parse()
+            self.assertEqual("cookie-monster", parser.dicom.PatientID)
+            self.assertEqual(ds.StudyDate, parser.dicom.StudyDate)
+            self.assertNotIn("InstanceCreationDate", parser.dicom)
+
+    def test_parser_config_not_shared(self):
+        """Each parser has its own copy of the (cached) config"""
+        print("Test parsers get their own config")
+        first = DicomParser(self.dicom_files[0])
+        first.config["get"]["skip"] = ["PatientID"]
+        second = DicomParser(self.dicom_files[1])
+        self.assertNotEqual(["PatientID"], second.config["get"].get("skip"))
+
+    def test_compile_filters(self):
+        """Filters are compiled once per recipe, and short circuit"""
+        print("Test compile_filters")
+        from pydicom.dataset import Dataset
+
+        from deid.dicom.compiled import CompiledFilters, compile_filters
+
+        print("Case 1: Filters are compiled once per recipe")
+        recipe = DeidRecipe()
+        filters = compile_filters(recipe)
+        self.assertTrue(isinstance(filters, CompiledFilters))
+        self.assertIs(filters, compile_filters(recipe))
+        self.assertEqual(
+            sum(len(items) for items in recipe.get_filters().values()), len(filters)
+        )
+
+        print("Case 2: Criteria that cannot change a group are not evaluated")
+        item = {
+            "filters": [
+                {
+                    "action": ["contains", "missing", "equals"],
+                    "field": ["Modality", "PatientID", "Manufacturer"],
+                    "operator": None,
+                    "InnerOperators": ["or", "and"],
+                    "value": ["CT", "", "GE"],
+                },
+            ],
+            "coordinates": [[0, "0,0,10,10"], [1, "from:SequenceOfUltrasoundRegions"]],
+            "name": "LABEL CT or missing PatientID, from GE",
+        }
+        label = CompiledFilters({"graylist": [item]}).labels[0][1]
+        calls = []
+        for _, criterion in label.groups[0]:
+            func = criterion.func
+            criterion.func = lambda d, f, v, func=func: calls.append(f) or func(d, f, v)
+
+        dicom = Dataset()
+        dicom.Modality = "CT"
+        dicom.Manufacturer = "Siemens"
+        self.assertFalse(label.matches(dicom))
+        self.assertEqual(["Modality", "Manufacturer"], calls)
+
+        print("Case 3: The reason and coordinates for a match")
+        dicom.Manufacturer = "GE"
+        self.assertTrue(label.matches(dicom))
+        self.assertEqual(
+            " Modality contains CT or PatientID missing  and Manufacturer equals GE",
+            label.reason,
+        )
+        self.assertEqual([[0, "0,0,10,10"], [1, []]], label.get_coordinates(dicom))
+        self.assertEqual("from:SequenceOfUltrasoundRegions", item["coordinates"][1][1])
+
+        print("Case 4: evaluate_group combines flags as a compiled group")
+        from deid.dicom.pixels.detect import evaluate_group
+
+        self.assertTrue(evaluate_group([True, "and", False, "or", True]))
+        self.assertFalse(evaluate_group([True, "and", False]))
+        self.assertTrue(evaluate_group(["or", True]))
+        self.assertFalse(evaluate_group([]))
+
+        print("Case 5: evaluate_criteria gives the dicom to each criterion")
+        from deid.dicom.compiled import evaluate_criteria
+
+        criteria = [
+            ("and", lambda d: d.Modality == "CT"),
+            ("or", label.groups[0][1][1]),
+        ]
+        self.assertTrue(evaluate_criteria(dicom, criteria))
+        self.assertFalse(evaluate_criteria(dicom, []))
+
+    def test_projection_tags(self):
+        """Recipes and filters reference a set of tags, unless they use expanders"""
+        print("Test tags referenced by a compiled recipe and filters")
+        from deid.dicom.compiled import compile_filters
+        from deid.dicom.pixels import has_burned_pixels
+
+        print("Case 1: Exact fields, by keyword, name, tag and nested field")
+        actions = [
+            {"action": "REPLACE", "field": "PatientID", "value": "var:id"},
+            {"action": "BLANK", "field": "Patient's Name"},
+            {"action": "JITTER", "field": "(0008,0020)", "value": "1"},
+            {"action": "REMOVE", "field": "ReferencedImageSequence__0__(0008,1155)"},
+        ]
+        compiled = compile_recipe(create_recipe(actions))
+        self.assertEqual(
+            {0x00100020, 0x00100010, 0x00080020, 0x00081140}, compiled.tags
+        )
+
+        print("Case 2: Expanders and functions can reference any field")
+        for action in [
+            {"action": "REMOVE", "field": "contains:Date"},
+            {"action": "REPLACE", "field": "PatientID", "value": "func:generate"},
+            {"action": "REMOVE", "field": "values:cookie_names"},
+        ]:
+            self.assertIsNone(compile_recipe(create_recipe([action])).tags)
+        self.assertIsNone(compile_recipe(DeidRecipe()).tags)
+
+        print("Case 3: Filters reference the fields of their criteria")
+        tags = compile_filters(DeidRecipe()).tags
+        self.assertIn(0x00080060, tags)  # Modality
+        self.assertIn(0x00080008, tags)  # ImageType
+
+        print("Case 4: A projection gives the same result for filters")
+        for dicom_file in self.dicom_files:
+            self.assertEqual(
+                has_burned_pixels(dicom_file),
+                has_burned_pixels(dicom_file, projection=True),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -76,10 +76,148 @@ class TestDicomFields(unittest.TestCase):
         for uid, field in fields.items():
             assert "0019" in uid
 
+        print("Testing that all fields are returned without copies")
+        fields = expand_field_expression(
+            dicom=dicom, field="ALL", contenders=contenders
+        )
+        self.assertIsNot(fields, contenders.fields)
+        for uid, field in fields.items():
+            self.assertIs(contenders[uid], field)
+
         print("Testing nested private tags")
         dataset = get_dataset("animals")  # includes nested private tags
         dicom = get_dicom(dataset)
 
+    def test_fields_cache(self):
+        print("Test deid.dicom.fields FieldsCache")
+        import gc
+
+        from pydicom.dataset import Dataset
+
+        from deid.dicom.fields import FieldsCache
+
+        cache = FieldsCache(maxsize=2)
+        dicom = get_dicom(self.dataset)
+
+        print("Case 1: A second lookup is a hit, and returns a copy")
+        fields = cache.get(dicom)
+        fields.clear()
+        self.assertTrue(cache.get(dicom))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        print("Case 2: Invalidating a dataset gives a miss")
+        del dicom.PatientID
+        cache.invalidate(dicom)
+        fields = cache.get(dicom)
+        self.assertNotIn("(0010,0020)", fields)
+        self.assertEqual(2, cache.misses)
+
+        print("Case 3: The cache is bounded, and does not keep datasets alive")
+        for _ in range(3):
+            other = Dataset()
+            other.PatientID = "cookie"
+            self.assertIn("(0010,0020)", cache.get(other))
+        self.assertEqual(2, cache.info()["size"])
+        del dicom, other
+        gc.collect()
+        self.assertEqual(0, cache.info()["size"])
+
+        cache.clear()
+        self.assertEqual(
+            {"hits": 0, "misses": 0, "size": 0, "maxsize": 2}, cache.info()
+        )
+
+    def test_fields_tree(self):
+        print("Test deid.dicom.fields FieldsWithLookups tree index")
+        from pydicom.dataset import Dataset
+        from pydicom.sequence import Sequence
+
+        code = Dataset()
+        code.CodeValue = "cookie"
+        code.CodeMeaning = "chocolate chip"
+        item = Dataset()
+        item.ReferencedSOPInstanceUID = "1.2.3"
+        item.PurposeOfReferenceCodeSequence = Sequence([code])
+        dicom = Dataset()
+        dicom.PatientID = "cookie-monster"
+        dicom.ReferencedImageSequence = Sequence([item, Dataset()])
+
+        fields = get_fields_with_lookup(dicom)
+        sequence = "(0008,1140)"
+        nested = "(0008,1140)__0__(0040,A170)"
+
+        print("Case 1: Descendants of a sequence are found")
+        self.assertEqual(
+            {
+                "(0008,1140)__0__(0008,1155)",
+                nested,
+                nested + "__0__(0008,0100)",
+                nested + "__0__(0008,0104)",
+            },
+            set(fields.get_descendants(sequence)),
+        )
+        self.assertEqual([], fields.get_descendants("(0010,0020)"))
+
+        print("Case 2: Removing a nested sequence keeps the rest")
+        fields.remove_tree(nested)
+        self.assertEqual(
+            ["(0008,1140)__0__(0008,1155)"], fields.get_descendants(sequence)
+        )
+        self.assertEqual([], fields.get_exact_matches("CodeValue"))
+        matches = fields.get_exact_matches("PatientID")
+        self.assertEqual({"(0010,0020)"}, {field.uid for field in matches})
+
+        print("Case 3: Removing descendants keeps the field")
+        fields.remove_descendants(sequence)
+        self.assertEqual([sequence, "(0010,0020)"], sorted(fields))
+
+    def test_field_keys(self):
+        print("Test deid.dicom.fields DicomField search keys")
+        from pydicom.dataset import Dataset
+
+        from deid.dicom.fields import DicomField
+
+        dicom = Dataset()
+        dicom.PatientName = "Cookie^Monster"
+        block = dicom.private_block(0x0033, "MITRA OBJECT UTF8 ATTRIBUTES 1.0", True)
+        block.add_new(0x1E, "LO", "cookie")
+
+        print("Case 1: Tag forms and lookup keys are derived once")
+        field = DicomField(dicom["PatientName"], "PatientName", "(0010,0010)")
+        self.assertEqual("(0010,0010)", field.tag)
+        self.assertEqual("00100010", field.stripped_tag)
+        self.assertEqual(
+            ("patientname", "(0010,0010)", "00100010", "patient's name")
+            + ("patientname", "(0010,0010)"),
+            field.lookup_keys,
+        )
+        self.assertFalse(hasattr(field, "__dict__"))
+
+        print("Case 2: Private creator forms of a private tag")
+        field = DicomField(dicom[0x0033101E], "(0033,101E)", "(0033,101E)")
+        self.assertEqual(
+            (
+                '(0033,"mitra object utf8 attributes 1.0",1e)',
+                '0033,"mitra object utf8 attributes 1.0",1e',
+            ),
+            field.private_tags,
+        )
+        self.assertTrue(
+            field.name_contains('0033,"MITRA OBJECT UTF8 ATTRIBUTES 1.0",1E')
+        )
+        self.assertTrue(field.name_contains("0033101E"))
+        self.assertFalse(field.name_contains("PatientName"))
+
+        print("Case 3: Fields are found by each key")
+        fields = get_fields_with_lookup(dicom)
+        for key in [
+            "Patient's Name",
+            "00100010",
+            '(0033,"MITRA OBJECT UTF8 ATTRIBUTES 1.0",1E)',
+        ]:
+            self.assertEqual(1, len(fields.get_exact_matches(key)))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -251,6 +251,65 @@ class TestDicomFuncs(unittest.TestCase):
         jittered_date = str(parser.dicom["AcquisitionDate"].value)
         assert jittered_date == "20240102"
 
+    def test_remap(self):
+        """
+        %header
+        REPLACE StudyInstanceUID deid_func:remap generator=dicom_uuid org_root=1.2.3
+        """
+        print("Test deid_func:remap")
+        import os
+
+        from deid.dicom import replace_identifiers
+        from deid.dicom.actions import RemapStore
+
+        store = os.path.join(self.tmpdir, "remap.db")
+        dicom_files = list(get_files(get_dataset("dicom-cookies")))
+        actions = [
+            {
+                "action": "REPLACE",
+                "field": "StudyInstanceUID",
+                "value": "deid_func:remap generator=dicom_uuid org_root=1.2.3 store=%s"
+                % store,
+            }
+        ]
+        recipe = create_recipe(actions)
+
+        print("Case 1: A random generator gives the same value for the same uid")
+        first = replace_identifiers(dicom_files, deid=recipe)
+        second = replace_identifiers(dicom_files, deid=recipe, workers=2)
+        for ds1, ds2 in zip(first, second):
+            self.assertTrue(ds1.StudyInstanceUID.startswith("1.2.3."))
+            self.assertEqual(ds1.StudyInstanceUID, ds2.StudyInstanceUID)
+
+        print("Case 2: Values are saved, and shared by stores at the same path")
+        shared = RemapStore(store)
+        originals = {str(DicomParser(x).dicom.StudyInstanceUID) for x in dicom_files}
+        self.assertEqual(len(originals), len(shared))
+        original = str(DicomParser(dicom_files[0]).dicom.StudyInstanceUID)
+        value = shared.get("dicom_uuid", original, lambda: "not-generated")
+        self.assertEqual(first[0].StudyInstanceUID, value)
+        shared.close()
+
+        print("Case 3: Without a store, values are kept in memory")
+        memory = RemapStore()
+        self.assertEqual("a", memory.get("uid", "1.2", lambda: "a"))
+        self.assertEqual("a", memory.get("uid", "1.2", lambda: "b"))
+        self.assertEqual("c", memory.get("other", "1.2", lambda: "c"))
+        self.assertEqual((1, 2), (memory.hits, memory.misses))
+
+        print("Case 4: Values in memory are not evicted, and a cache is")
+        memory = RemapStore(cache_size=2)
+        for original in ["1", "2", "3"]:
+            memory.get("uid", original, lambda: "new-%s" % original)
+        self.assertEqual(3, len(memory))
+        self.assertEqual("new-1", memory.get("uid", "1", lambda: "again"))
+        shared = RemapStore(store, cache_size=2)
+        for original in ["1", "2", "3"]:
+            shared.get("uid", original, lambda: "new-%s" % original)
+        self.assertEqual(2, len(shared.cache))
+        self.assertEqual("new-1", shared.get("uid", "1", lambda: "again"))
+        shared.close()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -37,6 +37,36 @@ class TestDicomTags(unittest.TestCase):
         tag = get_tag("KleenexTissue")
         self.assertTrue(not tag)
 
+    def test_add_tag(self):
+        print("Test deid.dicom.tags add_tag")
+        from deid.dicom.tags import add_tag
+
+        print("Case 1: Add a private tag, with default VR")
+        tag = add_tag("11112221")
+        self.assertEqual(str(tag["tag"]), "(1111,2221)")
+        self.assertEqual(tag["VR"], "ST")
+
+        print("Case 2: A keyword is looked up in the dictionary")
+        tag = add_tag("PatientID")
+        self.assertEqual(str(tag["tag"]), "(0010,0020)")
+        self.assertEqual(tag["VR"], "LO")
+
+    def test_find_tag(self):
+        print("Test deid.dicom.tags find_tag")
+        from deid.dicom.tags import find_tag
+
+        found = find_tag("Modality")
+        self.assertIn("Modality", [x[4] for x in found])
+        found.clear()
+
+        print("Case 1: Cached results are not changed by the caller")
+        self.assertIn("Modality", [x[4] for x in find_tag("Modality")])
+
+        print("Case 2: Filter by VR")
+        found = find_tag("Modality", VR="CS")
+        self.assertTrue(found)
+        self.assertTrue(all(x[0] == "CS" for x in found))
+
 
 if __name__ == "__main__":
     unittest.main()
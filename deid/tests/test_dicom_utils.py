@@ -58,6 +58,127 @@ class TestDicomUtils(unittest.TestCase):
         expected = 0
         self.assertEqual(found, expected)
 
+    def test_get_files_load(self):
+        print("Test test_get_files_load")
+        from deid.dicom import get_files, replace_identifiers, utils
+
+        print("Case 1: Validated datasets are yielded, without pixel data")
+        datasets = list(get_files(self.dataset, load=True))
+        self.assertEqual(7, len(datasets))
+        for dicom in datasets:
+            self.assertTrue(dicom.pixels_deferred)
+            self.assertNotIn("PixelData", dicom)
+
+        print("Case 2: A file without the DICM prefix is skipped")
+        not_dicom = os.path.join(self.tmpdir, "not-dicom.dcm")
+        with open(not_dicom, "wb") as fd:
+            fd.write(b"\0" * 256)
+        self.assertEqual([], list(get_files(not_dicom, load=True)))
+
+        print("Case 3: The datasets are saved with pixel data")
+        saved = replace_identifiers(
+            datasets[:1], save=True, output_folder=self.tmpdir, overwrite=True
+        )
+        self.assertIn("PixelData", utils.dcmread(saved[0]))
+
+    def test_read_header(self):
+        """A header only read defers the pixel data until it is saved"""
+        print("Test test_read_header")
+        from deid.dicom import get_files, utils
+        from deid.dicom.header import get_identifiers
+
+        dicom_file = next(get_files(self.dataset))
+        full = utils.dcmread(dicom_file)
+
+        print("Case 1: The header is read without the pixel data")
+        dicom = utils.read_header(dicom_file)
+        self.assertTrue(dicom.pixels_deferred)
+        self.assertNotIn("PixelData", dicom)
+        self.assertEqual(full.PatientID, dicom.PatientID)
+
+        print("Case 2: Saving loads the pixel data, and keeps header changes")
+        dicom.PatientID = "cookie-monster"
+        saved = utils.save_dicom(dicom, dicom_file, output_folder=self.tmpdir)
+        self.assertFalse(dicom.pixels_deferred)
+        result = utils.dcmread(saved)
+        self.assertEqual("cookie-monster", result.PatientID)
+        self.assertEqual(full.PixelData, result.PixelData)
+
+        print("Case 3: get_identifiers does not need the pixel data")
+        ids = get_identifiers(dicom_file)
+        self.assertIn("(0010,0020)", ids[dicom_file])
+
+    def test_read_header_trailing_elements(self):
+        """Elements after the pixel data are read, and not restored on save"""
+        print("Test test_read_header_trailing_elements")
+        from deid.dicom import get_files, replace_identifiers, utils
+        from deid.dicom.header import get_identifiers
+
+        dicom_file = os.path.join(self.tmpdir, "trailing.dcm")
+        dicom = utils.dcmread(next(get_files(self.dataset)))
+        dicom.add_new(0x7FE10010, "LO", "PHI CREATOR")
+        dicom.add_new(0x7FE11001, "LO", "PATIENT NAME PHI")
+        dicom.save_as(dicom_file)
+        output_folder = os.path.join(self.tmpdir, "output")
+        os.mkdir(output_folder)
+
+        print("Case 1: A header only read has the private tag after the pixels")
+        datasets = list(get_files([dicom_file], load=True))
+        self.assertIn(0x7FE11001, datasets[0])
+        self.assertNotIn("PixelData", datasets[0])
+
+        print("Case 2: remove_private removes it, and saving doesn't add it back")
+        saved = replace_identifiers(
+            datasets,
+            save=True,
+            remove_private=True,
+            output_folder=output_folder,
+            overwrite=True,
+        )
+        result = utils.dcmread(saved[0])
+        self.assertNotIn(0x7FE11001, result)
+        self.assertNotIn(0x7FE10010, result)
+        self.assertEqual(dicom.PixelData, result.PixelData)
+
+        print("Case 3: get_identifiers reports the private tag after the pixels")
+        ids = get_identifiers(dicom_file)
+        self.assertIn("(7FE1,1001)", ids[dicom_file])
+        self.assertEqual(
+            "PATIENT NAME PHI", ids[dicom_file]["(7FE1,1001)"].element.value
+        )
+
+    def test_read_header_projection(self):
+        """A projection reads only the tags a recipe references"""
+        print("Test test_read_header_projection")
+        from deid.dicom import get_files, utils
+        from deid.dicom.parser import DicomParser
+        from deid.tests.common import create_recipe
+
+        dicom_file = next(get_files(self.dataset))
+
+        print("Case 1: Only the specific tags (and character set) are read")
+        dicom = utils.read_header(dicom_file, specific_tags=[0x00100020])
+        self.assertTrue(dicom.tags_projected)
+        self.assertIn("PatientID", dicom)
+        self.assertNotIn("PatientName", dicom)
+
+        print("Case 2: A projected dicom cannot be saved")
+        with self.assertRaises(SystemExit):
+            utils.save_dicom(dicom, dicom_file, output_folder=self.tmpdir)
+
+        print("Case 3: A parser reads the tags its recipe references")
+        recipe = create_recipe([{"action": "BLANK", "field": "PatientName"}])
+        parser = DicomParser(dicom_file, recipe=recipe, projection=True)
+        parser.parse()
+        self.assertIn("PatientName", parser.dicom)
+        self.assertFalse(parser.dicom.PatientName)
+        self.assertNotIn("PatientID", parser.dicom)
+
+        print("Case 4: A recipe with expanders reads the whole header")
+        parser = DicomParser(dicom_file, projection=True)
+        self.assertFalse(getattr(parser.dicom, "tags_projected", False))
+        self.assertIn("PatientID", parser.dicom)
+
     def test_jitter_timestamp(self):
         from deid.dicom.actions import jitter_timestamp
         from deid.dicom.fields import DicomField
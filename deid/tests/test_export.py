@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from deid.data import get_dataset
+from deid.dicom import export_identifiers, get_files, get_identifiers
+from deid.dicom.export import decode_strings, encode_strings, read_header_table
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.dataset = get_dataset("dicom-cookies")
+        self.dicom_files = list(get_files(self.dataset))
+        self.tmpdir = tempfile.mkdtemp()
+        print("\n######################START######################")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        print("\n######################END########################")
+
+    def test_encode_strings(self):
+        print("Test encoding strings as data and offsets")
+        values = ["", "cookie", "Ünïcode", ""]
+        data, offsets = encode_strings(values)
+        self.assertEqual(len(values) + 1, len(offsets))
+        self.assertEqual(values, decode_strings(data, offsets))
+
+    def test_export_identifiers(self):
+        """The header table has the fields of get_identifiers, in batches"""
+        print("Test export_identifiers")
+        export_identifiers(self.dicom_files, self.tmpdir, batch_size=50)
+        table = read_header_table(self.tmpdir)
+        ids = get_identifiers(self.dicom_files)
+
+        print("Case 1: One row per field, for each file")
+        self.assertEqual(list(ids), table.files)
+        self.assertEqual(sum(len(fields) for fields in ids.values()), len(table))
+        for row in table.iter_rows():
+            field = ids[row["file"]][row["uid"]]
+            self.assertEqual(field.element.keyword, row["keyword"])
+            self.assertEqual(int(field.element.tag), row["tag"])
+            self.assertEqual(field.element.VR, row["VR"])
+
+        print("Case 2: Search values without reading the files")
+        rows = table.find("^cookie")
+        self.assertTrue(len(rows) > 0)
+        values = table.column("value")
+        self.assertTrue(all(values[i].lower().startswith("cookie") for i in rows))
+        counts = table.tags_matching("cookie")
+        self.assertEqual(len(self.dicom_files), counts["PatientID"])
+
+        print("Case 3: Columns are only read when they are used")
+        lazy = read_header_table(self.tmpdir)
+        lazy.find("^cookie")
+        self.assertEqual(["value"], list(lazy._columns))
+
+        print("Case 4: Export in parallel gives the same table")
+        parallel = tempfile.mkdtemp(dir=self.tmpdir)
+        export_identifiers(self.dicom_files, parallel, batch_size=50, workers=2)
+        result = read_header_table(parallel)
+        self.assertEqual(table.files, result.files)
+        self.assertEqual(list(table.iter_rows()), list(result.iter_rows()))
+
+    def test_export_overwrite(self):
+        """A folder that isn't empty is only written to with overwrite"""
+        print("Test export_identifiers with overwrite")
+        export_identifiers(self.dicom_files, self.tmpdir, batch_size=50)
+        self.assertTrue(len(os.listdir(self.tmpdir)) > 2)
+        other = os.path.join(self.tmpdir, "notes.txt")
+        with open(other, "w") as fd:
+            fd.write("keep me")
+
+        print("Case 1: A folder that isn't empty is refused")
+        with self.assertRaises(SystemExit):
+            export_identifiers(self.dicom_files[:1], self.tmpdir)
+        self.assertEqual(
+            len(self.dicom_files), len(read_header_table(self.tmpdir).files)
+        )
+
+        print("Case 2: Overwrite replaces only the earlier table")
+        export_identifiers(self.dicom_files[:1], self.tmpdir, overwrite=True)
+        self.assertEqual(1, len(read_header_table(self.tmpdir).files))
+        self.assertTrue(os.path.exists(other))
+        self.assertEqual(
+            ["batch-00000.npz", "files.npz", "notes.txt"],
+            sorted(os.listdir(self.tmpdir)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
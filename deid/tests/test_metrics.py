@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import deid.main
+from deid.config import DeidRecipe
+from deid.dicom import (
+    DicomCleaner,
+    generate_corpus,
+    has_burned_pixels,
+    replace_identifiers,
+)
+from deid.dicom.metrics import MetricsExporter, MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.corpus = os.path.join(self.tmpdir, "corpus")
+        self.dicom_files = generate_corpus(self.corpus, count=4)
+        self.recipe = os.path.join(self.corpus, "deid.dicom.synthetic")
+        print("\n######################START######################")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        print("\n######################END########################")
+
+    def test_registry(self):
+        print("Test counters and histograms")
+        metrics = MetricsRegistry()
+        metrics.inc("deid_files", kind="replace")
+        metrics.inc("deid_files", 2, kind="replace")
+        for seconds in [0.0005, 0.02, 100]:
+            metrics.observe("deid_file_seconds", seconds, kind="replace")
+
+        print("Case 1: Values are kept by labels")
+        self.assertEqual(3, metrics["deid_files"].get(kind="replace"))
+        self.assertEqual(0, metrics["deid_files"].get(kind="detect"))
+        histogram = metrics["deid_file_seconds"].get(kind="replace")
+        self.assertEqual(3, histogram["count"])
+        self.assertEqual([1, 0, 0, 1], histogram["buckets"][:4])
+        self.assertEqual(1, histogram["buckets"][-1])
+
+        print("Case 2: OpenMetrics buckets are cumulative")
+        text = metrics.to_openmetrics()
+        self.assertIn('deid_files_total{kind="replace"} 3', text)
+        self.assertIn('deid_file_seconds_bucket{kind="replace",le="0.025"} 2', text)
+        self.assertIn('deid_file_seconds_bucket{kind="replace",le="+Inf"} 3', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+        print("Case 3: Snapshots merge")
+        merged = MetricsRegistry().merge(json.loads(json.dumps(metrics.to_dict())))
+        merged.merge(metrics)
+        self.assertEqual(6, merged["deid_files"].get(kind="replace"))
+        self.assertEqual(6, merged["deid_file_seconds"].get(kind="replace")["count"])
+
+    def test_batch_metrics(self):
+        print("Test metrics of replace_identifiers, has_burned_pixels and cleaning")
+        metrics = MetricsRegistry()
+        output_folder = os.path.join(self.tmpdir, "output")
+        os.mkdir(output_folder)
+        replace_identifiers(
+            self.dicom_files,
+            deid=self.recipe,
+            save=True,
+            output_folder=output_folder,
+            metrics=metrics,
+        )
+        has_burned_pixels(self.dicom_files, deid=self.recipe, metrics=metrics)
+
+        print("Case 1: Files and bytes are counted")
+        size = sum(os.path.getsize(x) for x in self.dicom_files)
+        self.assertEqual(4, metrics["deid_files"].get(kind="replace"))
+        self.assertEqual(size, metrics["deid_bytes_read"].get(kind="replace"))
+        self.assertTrue(metrics["deid_bytes_written"].get(kind="replace") > 0)
+        self.assertEqual(4, metrics["deid_detected"].get(result="flagged"))
+
+        print("Case 2: Each stage is timed")
+        for stage in ["read", "parse", "actions", "write", "detect"]:
+            self.assertTrue(metrics["deid_stage_seconds"].get(stage=stage)["count"])
+
+        print("Case 3: Metrics from workers are merged")
+        workers = MetricsRegistry()
+        replace_identifiers(
+            self.dicom_files, deid=self.recipe, metrics=workers, workers=2
+        )
+        self.assertEqual(4, workers["deid_files"].get(kind="replace"))
+        self.assertEqual(4, workers["deid_stage_seconds"].get(stage="actions")["count"])
+
+        print("Case 4: Cleaning pixels is counted, and errors")
+        client = DicomCleaner(
+            deid=self.recipe, output_folder=self.tmpdir, metrics=metrics
+        )
+        client.detect(self.dicom_files[0])
+        client.clean()
+        client.save_dicom()
+        self.assertEqual(1, metrics["deid_files"].get(kind="clean"))
+        self.assertEqual(
+            1, metrics["deid_stage_seconds"].get(stage="pixel_clean")["count"]
+        )
+        self.assertTrue(metrics["deid_bytes_written"].get(kind="clean") > 0)
+        with self.assertRaises(SystemExit):
+            replace_identifiers(
+                [os.path.join(self.tmpdir, "missing.dcm")], metrics=metrics
+            )
+        self.assertEqual(1, metrics["deid_errors"].get(kind="replace"))
+
+        print("Case 5: Files are counted as clean for a recipe without filters")
+        no_filters = DeidRecipe(self.recipe)
+        no_filters.deid.pop("filter", None)
+        detected = MetricsRegistry()
+        has_burned_pixels(self.dicom_files, deid=no_filters, metrics=detected)
+        self.assertEqual(4, detected["deid_detected"].get(result="clean"))
+
+    def test_exporter(self):
+        print("Test the periodic exporter")
+        metrics = MetricsRegistry()
+        path = os.path.join(self.tmpdir, "deid.prom")
+        with MetricsExporter(metrics, path, interval=0.01):
+            metrics.inc("deid_files", kind="replace")
+            time.sleep(0.1)
+            self.assertTrue(os.path.exists(path))
+            metrics.inc("deid_files", kind="replace")
+
+        print("Case 1: The last snapshot is written when stopped")
+        with open(path) as fd:
+            self.assertIn('deid_files_total{kind="replace"} 2', fd.read())
+
+        print("Case 2: A json snapshot")
+        path = os.path.join(self.tmpdir, "deid.json")
+        metrics.write(path)
+        with open(path) as fd:
+            snapshot = json.load(fd)
+        self.assertEqual("counter", snapshot["metrics"]["deid_files"]["type"])
+
+    def test_metrics_cli(self):
+        print("Test deid identifiers --metrics")
+        path = os.path.join(self.tmpdir, "deid.json")
+        output_folder = os.path.join(self.tmpdir, "output")
+        os.mkdir(output_folder)
+        argv = "deid --outfolder %s identifiers --action all --input %s --metrics %s"
+        with patch("sys.argv", (argv % (output_folder, self.corpus, path)).split(" ")):
+            deid.main.main()
+        with open(path) as fd:
+            metrics = MetricsRegistry().merge(json.load(fd))
+        self.assertEqual(4, metrics["deid_files"].get(kind="replace"))
+
+
+if __name__ == "__main__":
+    unittest.main()
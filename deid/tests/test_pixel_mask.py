@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy
+
+from deid.dicom.pixels.mask import get_coordinates, is_multiframe, mask_pixels
+
+
+class TestPixelMask(unittest.TestCase):
+    def setUp(self):
+        print("\n######################START######################")
+
+    def tearDown(self):
+        print("\n######################END########################")
+
+    def test_mask_pixels_remove(self):
+        print("Test mask_pixels with coordinates to remove")
+        pixels = numpy.full((4, 10, 8, 3), 7, dtype=numpy.uint16)
+        results = {"results": [{"coordinates": [[0, "0,0,2,3"], [0, "6,8,8,10"]]}]}
+
+        self.assertTrue(is_multiframe(pixels, 3))
+        coordinates = get_coordinates(results, pixels.shape[1:3])
+        cleaned = mask_pixels(pixels, coordinates, multiframe=True)
+
+        # The array is changed in place, and keeps the dtype
+        self.assertIs(cleaned, pixels)
+        self.assertEqual(numpy.uint16, cleaned.dtype)
+        self.assertTrue((cleaned[:, 0:3, 0:2, :] == 0).all())
+        self.assertTrue((cleaned[:, 8:10, 6:8, :] == 0).all())
+        self.assertEqual(4 * (80 - 6 - 4) * 3, numpy.count_nonzero(cleaned))
+
+    def test_mask_pixels_keep(self):
+        print("Test mask_pixels with coordinates to keep")
+        pixels = numpy.full((10, 8), -5, dtype=numpy.int16)
+        results = {"results": [{"coordinates": [[0, "all"], [1, "2,2,4,4"]]}]}
+
+        self.assertFalse(is_multiframe(pixels, 1))
+        coordinates = get_coordinates(results, pixels.shape)
+        self.assertEqual([(0, [0, 0, 8, 10]), (1, [2, 2, 4, 4])], coordinates)
+
+        cleaned = mask_pixels(pixels, coordinates)
+        self.assertEqual(numpy.int16, cleaned.dtype)
+        self.assertTrue((cleaned[2:4, 2:4] == -5).all())
+        self.assertEqual(4, numpy.count_nonzero(cleaned))
+
+
+if __name__ == "__main__":
+    unittest.main()
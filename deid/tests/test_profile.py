@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from deid.config import DeidRecipe
+from deid.config.utils import load_deid
+from deid.dicom import generate_corpus, replace_identifiers
+from deid.dicom.profile import ActionProfile, merge_profiles
+
+recipe_text = """FORMAT dicom
+
+%header
+
+# Generate new UIDs
+REPLACE SOPInstanceUID deid_func:pydicom_uuid
+REMOVE contains:Date
+BLANK PatientName
+"""
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.recipe = os.path.join(self.tmpdir, "deid.dicom.profile")
+        with open(self.recipe, "w") as fd:
+            fd.write(recipe_text)
+        self.dicom_files = generate_corpus(
+            os.path.join(self.tmpdir, "corpus"), count=4, recipe=False
+        )
+        print("\n######################START######################")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        print("\n######################END########################")
+
+    def test_load_deid_source(self):
+        print("Test load_deid records the source line of actions")
+        actions = load_deid(self.recipe)["header"]
+        sources = [action["source"] for action in actions]
+        self.assertEqual(
+            ["deid.dicom.profile:6", "deid.dicom.profile:7", "deid.dicom.profile:8"],
+            sources,
+        )
+
+    def test_replace_identifiers_profile(self):
+        print("Test profiling replace_identifiers")
+        profile = ActionProfile()
+        replace_identifiers(
+            self.dicom_files, deid=DeidRecipe(self.recipe), profile=profile
+        )
+
+        print("Case 1: Each action is run once per file")
+        self.assertEqual(4, profile.files)
+        replace = profile.actions[
+            "deid.dicom.profile:6 REPLACE SOPInstanceUID deid_func:pydicom_uuid"
+        ]
+        self.assertEqual(4, replace["calls"])
+        self.assertEqual(4, replace["matched"])
+        self.assertTrue(replace["seconds"] >= replace["expand_seconds"] > 0)
+
+        print("Case 2: Expanders count each matched field")
+        remove = profile.actions["deid.dicom.profile:7 REMOVE contains:Date"]
+        self.assertTrue(remove["matched"] > remove["calls"])
+
+        print("Case 3: Each deid_func call is recorded")
+        self.assertEqual(4, profile.funcs["pydicom_uuid"]["calls"])
+
+        print("Case 4: Profiles from workers are merged")
+        workers = ActionProfile()
+        replace_identifiers(
+            self.dicom_files, deid=DeidRecipe(self.recipe), profile=workers, workers=2
+        )
+        self.assertEqual(profile.files, workers.files)
+        for key, counts in profile.actions.items():
+            self.assertEqual(counts["matched"], workers.actions[key]["matched"])
+        self.assertEqual(4, workers.funcs["pydicom_uuid"]["calls"])
+
+        print("Case 5: A profile can be saved and merged")
+        saved = json.loads(json.dumps(profile.to_dict()))
+        merged = merge_profiles([saved, ActionProfile.from_dict(saved)])
+        self.assertEqual(8, merged.files)
+        self.assertEqual(8, merged.funcs["pydicom_uuid"]["calls"])
+        key = "deid.dicom.profile:7 REMOVE contains:Date"
+        self.assertEqual(2 * remove["matched"], merged.actions[key]["matched"])
+        self.assertIn("REMOVE contains:Date", profile.table())
+
+
+if __name__ == "__main__":
+    unittest.main()
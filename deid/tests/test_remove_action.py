@@ -324,6 +324,33 @@ class TestRemoveAction(unittest.TestCase):
         if os.path.exists(copy_path):
             os.remove(copy_path)
 
+    def test_remove_excluded_uids(self):
+        """RECIPE RULES
+        ADD PatientIdentityRemoved YES
+        REPLACE PatientIdentityRemoved NO
+        REMOVE ALL
+        """
+        print("Test REMOVE ALL keeps fields added and later replaced")
+        from deid.dicom.parser import DicomParser
+
+        dicom_file = get_file(self.dataset)
+        actions = [
+            {"action": "ADD", "field": "PatientIdentityRemoved", "value": "YES"},
+            {"action": "REPLACE", "field": "PatientIdentityRemoved", "value": "NO"},
+            {"action": "REPLACE", "field": "PatientID", "value": "cookie"},
+            {"action": "REMOVE", "field": "ALL"},
+        ]
+        parser = DicomParser(dicom_file, recipe=create_recipe(actions))
+        parser.parse()
+
+        self.assertEqual("NO", parser.dicom.PatientIdentityRemoved)
+        self.assertEqual("cookie", parser.dicom.PatientID)
+        self.assertNotIn("PatientName", parser.dicom)
+        self.assertEqual(
+            set(["(0010,0020)", "(0012,0062)"]),
+            set(x for x in parser.excluded_uids if x in parser.fields),
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -9,7 +9,13 @@ from collections import OrderedDict
 from pydicom.sequence import Sequence
 
 from deid.data import get_dataset
-from deid.dicom import get_files, get_identifiers, replace_identifiers, utils
+from deid.dicom import (
+    get_files,
+    get_identifiers,
+    iter_replace_identifiers,
+    replace_identifiers,
+    utils,
+)
 from deid.dicom.parser import DicomParser
 from deid.tests.common import create_recipe
 from deid.utils import get_installdir
@@ -1343,6 +1349,48 @@ class TestDicom(unittest.TestCase):
         self.assertEqual(len(original_dataset), len(result[0]))
         self.assertEqual("", result[0]["ContentDate"].value)
 
+    def test_iter_replace_identifiers(self):
+        """RECIPE RULE
+        REPLACE PatientID cookie
+        """
+        print("Test iter_replace_identifiers yields one result per file, in order")
+        dicom_files = list(get_files(self.dataset))
+        actions = [{"action": "REPLACE", "field": "PatientID", "value": "cookie"}]
+        recipe = create_recipe(actions)
+
+        results = list(
+            iter_replace_identifiers(
+                dicom_files=(x for x in dicom_files), deid=recipe, lookahead=1
+            )
+        )
+        self.assertEqual(len(dicom_files), len(results))
+        for dicom_file, (input_path, result, report) in zip(dicom_files, results):
+            self.assertEqual(dicom_file, input_path)
+            self.assertEqual("cookie", result.PatientID)
+            self.assertEqual(os.path.basename(dicom_file), report["dicom_name"])
+            self.assertFalse(report["saved"])
+
+    def test_iter_replace_identifiers_save(self):
+        print("Test iter_replace_identifiers with save")
+        dicom_file = next(get_files(self.dataset, pattern="ctbrain1.dcm"))
+        actions = [{"action": "REPLACE", "field": "PatientID", "value": "cookie"}]
+        recipe = create_recipe(actions)
+
+        for input_path, output_path, report in iter_replace_identifiers(
+            dicom_files=dicom_file, deid=recipe, save=True, output_folder=self.tmpdir
+        ):
+            self.assertTrue(report["saved"])
+            self.assertEqual(self.tmpdir, os.path.dirname(output_path))
+            self.assertEqual("cookie", utils.dcmread(output_path).PatientID)
+
+    def test_iter_replace_identifiers_missing_file(self):
+        print("Test iter_replace_identifiers raises for a file that cannot be read")
+        results = iter_replace_identifiers(
+            dicom_files=[os.path.join(self.tmpdir, "missing.dcm")]
+        )
+        with self.assertRaises(FileNotFoundError):
+            list(results)
+
 
 # MORE TESTS NEED TO BE WRITTEN TO TEST SEQUENCES
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import deid.main
+from deid.dicom import (
+    DicomCleaner,
+    generate_corpus,
+    generate_dataset,
+    has_burned_pixels,
+)
+from deid.dicom.utils import dcmread
+
+
+class TestSynthetic(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        print("\n######################START######################")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        print("\n######################END########################")
+
+    def test_generate_dataset(self):
+        print("Test generate_dataset")
+
+        print("Case 1: The same seed generates the same dataset")
+        dicom = generate_dataset(index=3, seed=7)
+        self.assertEqual(dicom, generate_dataset(index=3, seed=7))
+        self.assertNotEqual(
+            dicom.SOPInstanceUID, generate_dataset(index=3).SOPInstanceUID
+        )
+
+        print("Case 2: Files in a series share identifiers")
+        other = generate_dataset(index=4, seed=7, series_size=5)
+        self.assertEqual(dicom.SeriesInstanceUID, other.SeriesInstanceUID)
+        self.assertEqual(dicom.PatientName, other.PatientName)
+        self.assertNotEqual(dicom.SOPInstanceUID, other.SOPInstanceUID)
+
+        print("Case 3: Nested sequences have a depth and fanout")
+        dicom = generate_dataset(depth=3, fanout=2)
+        self.assertEqual(2, len(dicom.ContentSequence))
+        item = dicom.ContentSequence[1].ContentSequence[0].ContentSequence[1]
+        self.assertNotIn("ContentSequence", item)
+
+        print("Case 4: Private blocks have a creator, and a patient name")
+        dicom = generate_dataset(private_blocks=3)
+        for group in (0x0009, 0x0011, 0x0013):
+            self.assertTrue(str(dicom[group, 0x0010].value).startswith("SYNTHETIC"))
+            self.assertEqual(str(dicom.PatientName), str(dicom[group, 0x1010].value))
+
+        print("Case 5: Header width adds standard fields")
+        narrow = generate_dataset(width=0)
+        wide = generate_dataset(width=100)
+        self.assertEqual(len(narrow) + 100, len(wide))
+
+    def test_pixels(self):
+        print("Test synthetic pixels for photometric interpretations")
+        shapes = {
+            ("MONOCHROME1", 1): (32, 48),
+            ("MONOCHROME2", 4): (4, 32, 48),
+            ("RGB", 1): (32, 48, 3),
+            ("YBR_FULL", 4): (4, 32, 48, 3),
+        }
+        for (photometric, frames), shape in shapes.items():
+            print("Case: %s with %s frames" % (photometric, frames))
+            dicom = generate_dataset(
+                rows=32, columns=48, frames=frames, photometric=photometric
+            )
+            self.assertEqual(photometric, dicom.PhotometricInterpretation)
+            self.assertEqual(shape, dicom.pixel_array.shape)
+
+    def test_clean_burned_in(self):
+        """The recipe written with a corpus flags and cleans burned in text"""
+        print("Test cleaning a synthetic corpus")
+        paths = generate_corpus(self.tmpdir, count=3, burned_in=2, frames=2)
+        recipe = os.path.join(self.tmpdir, "deid.dicom.synthetic")
+        self.assertTrue(os.path.exists(recipe))
+
+        print("Case 1: All files are flagged")
+        results = has_burned_pixels(paths, deid=recipe)
+        self.assertEqual(sorted(paths), sorted(results["flagged"]))
+
+        print("Case 2: The burned in rectangles are cleaned")
+        client = DicomCleaner(deid=recipe, output_folder=self.tmpdir)
+        client.detect(paths[0])
+        client.clean()
+        self.assertTrue((client.cleaned[:, 0:4, 0:32] == 0).all())
+        self.assertTrue((client.cleaned[:, 6:10, 32:64] == 0).all())
+
+        print("Case 3: Files without burned in text are not flagged")
+        folder = os.path.join(self.tmpdir, "clean")
+        paths = generate_corpus(folder, count=2, burned_in=0)
+        self.assertFalse(os.path.exists(os.path.join(folder, "deid.dicom.synthetic")))
+        self.assertEqual(0, len(has_burned_pixels(paths, deid=recipe)["flagged"]))
+
+    def test_synthetic_cli(self):
+        print("Test deid synthetic")
+        argv = "deid --outfolder %s synthetic --count 2 --seed 3 --photometric RGB"
+        with patch("sys.argv", (argv % self.tmpdir).split(" ")):
+            deid.main.main()
+        dicom = dcmread(os.path.join(self.tmpdir, "synthetic-00001.dcm"))
+        self.assertEqual("RGB", dicom.PhotometricInterpretation)
+        expected = generate_dataset(index=1, seed=3, photometric="RGB")
+        self.assertEqual(expected.SOPInstanceUID, dicom.SOPInstanceUID)
+        self.assertEqual(expected.PixelData, dicom.PixelData)
+
+
+if __name__ == "__main__":
+    unittest.main()
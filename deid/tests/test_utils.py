@@ -92,6 +92,30 @@ class TestUtils(unittest.TestCase):
         print("Found %s deid files" % (found))
         self.assertTrue(found == expected)
 
+    def test_literal_matcher(self):
+        """test_literal_matcher should find literal strings, ignoring case"""
+        print("Testing literal matcher.")
+        from deid.utils.matcher import LiteralMatcher
+
+        print("Case 1: Matching is case insensitive")
+        matcher = LiteralMatcher(["Simpson", "1.2.3", ""])
+        self.assertEqual(2, len(matcher))
+        self.assertTrue(matcher.search("Homer SIMPSON"))
+        self.assertFalse(matcher.search("Homer Flanders"))
+
+        print("Case 2: Regular expression characters are literal")
+        self.assertTrue(matcher.search("prefix-1.2.3.4"))
+        self.assertFalse(matcher.search("1x2x3"))
+
+        print("Case 3: Overlapping patterns are found through failure links")
+        matcher = LiteralMatcher(["abcd", "bce", "c"])
+        self.assertTrue(matcher.search("xxbce"))
+        self.assertTrue(LiteralMatcher(["abcd", "bce"]).search("abce"))
+        self.assertFalse(LiteralMatcher(["abcd", "bce"]).search("abcbe"))
+
+        print("Case 4: Without patterns, nothing matches")
+        self.assertFalse(LiteralMatcher([""]).search("anything"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,10 @@
-from .actions import get_func, get_timestamp, parse_keyvalue_pairs, parse_value
+from .actions import (
+    get_func,
+    get_timestamp,
+    parse_keyvalue_pairs,
+    parse_value,
+    split_value,
+)
 from .fileio import (
     get_installdir,
     get_temporary_name,
@@ -4,6 +4,7 @@ __license__ = "MIT"
 
 import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import dateutil.parser
 
@@ -29,28 +30,21 @@ def parse_value(dicom, value, item=None, field=None, funcs=None):
         item = dict()
 
     # Does the user want a custom value?
-    if re.search("(^var:)|(^func:)|(^deid_func:)", value):
-        value_type, value_option = value.split(":", 1)
-        if value_type.lower() == "var":
+    spec = split_value(value)
+    if spec is not None:
+        value_type, value_option, extras = spec
+        if value_type == "var":
             # If selected variable not provided, skip
             if value_option not in item:
                 return None
             return item[value_option]
 
         # The user wants to use a deid provided function
-        elif value_type.lower() == "deid_func":
-            # There can be additional key=value pairs
-            try:
-                value_option, extras = value_option.split(" ", 1)
-            except Exception:
-                extras = ""
-                pass
-
+        elif value_type == "deid_func":
             if value_option not in funcs:
                 bot.warning("%s not a known deid provided function." % (value_option))
                 return None
 
-            print(extras)
             # item is the lookup, value from the recipe, and field
             # The field is an entire dicom element object
             return funcs[value_option](
@@ -58,7 +52,7 @@ def parse_value(dicom, value, item=None, field=None, funcs=None):
             )
 
         # The user is providing a specific function
-        elif value_type.lower() == "func":
+        elif value_type == "func":
             if value_option not in item:
                 bot.warning("%s not found in item lookup." % (value_option))
                 return None
@@ -86,6 +80,28 @@ def parse_value(dicom, value, item=None, field=None, funcs=None):
     return convert_value(fieldName, fieldVR, value) if existingField else value
 
 
+@lru_cache(maxsize=1024)
+def split_value(value):
+    """
+    Split the value of an action into its parts.
+
+    A value that refers to a variable or function (var:, func: or deid_func:)
+    is returned as a tuple of (type, option, extras), where extras are the
+    additional key=value pairs for a deid_func. Any other value is a literal,
+    and None is returned. Values repeat across files, so results are cached.
+    """
+    if not re.search("(^var:)|(^func:)|(^deid_func:)", value):
+        return None
+
+    value_type, value_option = value.split(":", 1)
+    extras = ""
+
+    # There can be additional key=value pairs
+    if value_type.lower() == "deid_func" and " " in value_option:
+        value_option, extras = value_option.split(" ", 1)
+    return value_type.lower(), value_option, extras
+
+
 def parse_keyvalue_pairs(pairs):
     """
     Given a listing of extra arguments, parse into lookup dict.
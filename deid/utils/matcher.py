@@ -0,0 +1,94 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2016-2025, Vanessa Sochat"
+__license__ = "MIT"
+
+
+class LiteralMatcher:
+    """
+    Find if a string contains any of a set of literal strings.
+
+    The patterns are compiled once into an Aho-Corasick automaton (a trie of
+    the patterns with failure links), so a string is searched for all of the
+    patterns in one pass over its characters, however many patterns there
+    are. Matching is case insensitive, and the patterns are literal (regular
+    expression characters like "." or "+" have no special meaning). Empty
+    patterns are ignored. Usage:
+
+    matcher = LiteralMatcher(["Simpson", "1.2.3"])
+    matcher.search("Homer SIMPSON")  # True
+    matcher.search("1x2x3")  # False
+    """
+
+    def __init__(self, patterns):
+        # Each state has transitions (character to state), a failure link,
+        # and whether a pattern ends at (or is a suffix of) the state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+        self.patterns = set()
+
+        for pattern in patterns:
+            pattern = str(pattern).lower()
+            if pattern:
+                self.patterns.add(pattern)
+                self._add(pattern)
+        self._link()
+
+    def __str__(self):
+        return "[literal-matcher:%s patterns]" % len(self.patterns)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            following = self.goto[state].get(char)
+            if following is None:
+                following = len(self.goto)
+                self.goto[state][char] = following
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(False)
+            state = following
+        self.output[state] = True
+
+    def _link(self):
+        """
+        Add failure links, breadth first from the root.
+        """
+        queue = list(self.goto[0].values())
+        while queue:
+            following = []
+            for state in queue:
+                for char, child in self.goto[state].items():
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    link = self.goto[fallback].get(char, 0)
+                    self.fail[child] = link if link != child else 0
+                    self.output[child] = self.output[child] or self.output[link]
+                    following.append(child)
+            queue = following
+
+    def search(self, text):
+        """
+        Return True if the text contains any of the patterns.
+        """
+        if not self.patterns:
+            return False
+
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in str(text).lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False